@@ -11,6 +11,11 @@ try:
 except ImportError:
     PRESENTATION_ROOM_OPTIONS = {}
     PRESENTATION_ROOM_IDS = frozenset()
+try:
+    from blacklist_index import BLACKLIST_INDEX_PATH, projection_updates
+except ImportError:
+    BLACKLIST_INDEX_PATH = "blacklist_index"
+    projection_updates = None
 
 import smtplib
 import random
@@ -4461,7 +4466,6 @@ def toggle_blacklist(visitor_id):
             return jsonify({'success': False, 'message': 'Invalid visitor id'}), 400
         if not visitor_snapshot:
             return jsonify({'success': False, 'message': 'Visitor not found'}), 404
-        basic_info_ref = visitor_ref.child('basic_info')
 
         update_payload = {
             'blacklisted': 'yes' if blacklisted else 'no',
@@ -4476,7 +4480,16 @@ def toggle_blacklist(visitor_id):
         else:
             update_payload['blacklisted_at'] = ''
 
-        basic_info_ref.update(update_payload)
+        # basic_info and the registration-side blacklist face projection change in one
+        # multi-location update: registration trusts a complete projection as a fast
+        # negative, so the two must never diverge.
+        updates = {f'visitors/{visitor_id}/basic_info/{field}': value for field, value in update_payload.items()}
+        if projection_updates is not None:
+            updates.update(projection_updates(visitor_id, {**existing_basic, **update_payload}, blacklisted))
+        else:
+            # Cannot maintain the projection: mark it incomplete so registration scans all visitors.
+            updates[f'{BLACKLIST_INDEX_PATH}/meta/complete'] = None
+        db.reference().update(updates)
 
         # Send blacklist notification email when adding to blacklist (not when removing)
         if blacklisted and not existing_blacklisted:
@@ -10,6 +10,7 @@ import json
 import os
 import sys
 import unittest
+import unittest.mock
 from pathlib import Path
 
 _admin_dir = Path(__file__).resolve().parent.parent
@@ -220,6 +221,29 @@ class AdminDashboardMockTests(unittest.TestCase):
             self.assertEqual(state2.get("reason"), "updated")
             self.assertEqual(state2.get("blacklisted_at"), ts1)
 
+    def test_blacklist_toggle_writes_basic_info_and_projection_together(self):
+        """Firebase mode: one root update, so a failed write cannot leave them diverged."""
+        snapshot = {"basic_info": {"name": "Ann", "embedding": "0.1 0.2", "blacklisted": "no"}}
+        root = unittest.mock.MagicMock()
+        root.child.return_value.get.return_value = snapshot
+        root.update.side_effect = RuntimeError("network down")
+        admin_app.USE_MOCK_DATA = False
+        with unittest.mock.patch.object(admin_app.db, "reference", return_value=root), \
+                unittest.mock.patch.object(admin_app, "send_blacklist_notification_email") as send, \
+                self.app.test_client() as c:
+            r = c.post(
+                "/blacklist/v1",
+                data=json.dumps({"blacklisted": True, "reason": "tailgating"}),
+                content_type="application/json",
+            )
+        self.assertEqual(r.status_code, 500)
+        send.assert_not_called()
+        root.update.assert_called_once()
+        updates = root.update.call_args[0][0]
+        self.assertEqual(updates["visitors/v1/basic_info/blacklisted"], "yes")
+        self.assertEqual(updates["blacklist_index/faces/v1"]["reason"], "tailgating")
+        self.assertIn("blacklist_index/meta/version", updates)
+
     def test_blacklist_unknown_visitor_rejected(self):
         with self.app.test_client() as c:
             r = c.post(
@@ -0,0 +1,256 @@
+"""
+Approximate nearest-neighbour (IVF) backend for the face index.
+=============================================
+Drop-in subclass of ``face_index.FaceIndex`` for very large enrolments
+(100k+ faces). Pure NumPy, no GPU or external service:
+
+  • Coarse quantiser: k-means over the stored embeddings (``nlist`` centroids).
+  • Each row is assigned to its nearest centroid (new rows on insert); a query
+    scores only rows in the ``nprobe`` nearest lists.
+  • The shortlist is re-ranked with exact float64 distances by the base class,
+    so threshold and twin decisions on returned candidates stay exact.
+  • Training runs in a background thread; until the first training finishes,
+    or while the index is below ``min_train_size``, it behaves as brute force.
+
+Blacklisted rows are always scored exhaustively (see FaceIndex.match).
+"""
+
+import logging
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from face_index import FaceIndex
+
+logger = logging.getLogger(__name__)
+
+_UNASSIGNED = -1
+
+
+def kmeans(data, k, iters=10, seed=0, sample_size=None):
+    """
+    Plain Lloyd k-means on float32 rows. Returns (k, dim) centroids.
+
+    Trains on at most *sample_size* rows (default 64 per centroid) and
+    re-seeds empty clusters from random points.
+    """
+    rng = np.random.default_rng(seed)
+    n = data.shape[0]
+    k = max(1, min(int(k), n))
+    sample_size = sample_size or 64 * k
+    if n > sample_size:
+        data = data[rng.choice(n, sample_size, replace=False)]
+        n = sample_size
+    centroids = data[rng.choice(n, k, replace=False)].astype(np.float32, copy=True)
+    data_sq = np.einsum("ij,ij->i", data, data)
+    for _ in range(iters):
+        d2 = data_sq[:, None] - 2.0 * (data @ centroids.T) + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        labels = np.argmin(d2, axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(n, int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFFaceIndex(FaceIndex):
+    """
+    Inverted-file FaceIndex.
+
+    Parameters
+    ----------
+    nlist : int
+        Number of coarse clusters; 0 picks ~4·sqrt(N) at training time.
+    nprobe : int
+        Clusters scanned per query (recall/latency knob).
+    min_train_size : int
+        Below this many rows the index stays exhaustive.
+    retrain_growth : float
+        Retrain in the background once rows added since the last training
+        exceed this fraction of the trained size.
+    """
+
+    def __init__(self, capacity=256, nlist=0, nprobe=16, min_train_size=5000,
+                 retrain_growth=0.2, background=True):
+        self._assign = np.full(max(int(capacity), 1), _UNASSIGNED, dtype=np.int32)
+        super().__init__(capacity=capacity)
+        self.nlist = int(nlist)
+        self.nprobe = max(1, int(nprobe))
+        self.min_train_size = int(min_train_size)
+        self.retrain_growth = float(retrain_growth)
+        self.background = background
+        self._centroids = None
+        self._trained_size = 0
+        self._added_since_training = 0
+        self._list_cache = {}
+        self._train_thread = None
+        self._bulk_loading = False
+        self.last_train_ms = None
+
+    @classmethod
+    def from_visitors(cls, all_visitors, **kwargs):
+        index = cls(capacity=max(len(all_visitors or {}), 256), **kwargs)
+        index.sync(all_visitors or {})
+        return index
+
+    # ── Row bookkeeping (keeps _assign parallel to the matrix) ──
+
+    def _grow(self, needed):
+        super()._grow(needed)
+        capacity = self._matrix.shape[0]
+        if self._assign.shape[0] < capacity:
+            assign = np.full(capacity, _UNASSIGNED, dtype=np.int32)
+            assign[: self._assign.shape[0]] = self._assign
+            self._assign = assign
+
+    def upsert(self, visitor_id, visitor_data):
+        with self._lock:
+            changed = super().upsert(visitor_id, visitor_data)
+            row = self._rows.get(str(visitor_id))
+            if changed and row is not None:
+                if self._centroids is not None:
+                    vec = self._matrix[row]
+                    d2 = np.einsum("ij,ij->i", self._centroids, self._centroids) - 2.0 * (self._centroids @ vec)
+                    self._list_cache.pop(int(self._assign[row]), None)
+                    self._assign[row] = int(np.argmin(d2))
+                    self._list_cache.pop(int(self._assign[row]), None)
+                else:
+                    self._assign[row] = _UNASSIGNED
+                self._added_since_training += 1
+        if changed:
+            self._maybe_retrain()
+        return changed
+
+    def remove(self, visitor_id):
+        with self._lock:
+            row = self._rows.get(str(visitor_id))
+            last = len(self._ids) - 1
+            removed = super().remove(visitor_id)
+            if removed:
+                self._list_cache.pop(int(self._assign[row]), None)
+                self._list_cache.pop(int(self._assign[last]), None)
+                if row != last:
+                    self._assign[row] = self._assign[last]
+                self._assign[last] = _UNASSIGNED
+            return removed
+
+    def sync(self, all_visitors):
+        # Train once after a bulk load instead of repeatedly while rows stream in.
+        with self._lock:
+            self._bulk_loading = True
+            try:
+                changed = super().sync(all_visitors)
+            finally:
+                self._bulk_loading = False
+        if changed:
+            self._maybe_retrain()
+        return changed
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._assign.fill(_UNASSIGNED)
+            self._list_cache = {}
+            self._centroids = None
+            self._trained_size = 0
+            self._added_since_training = 0
+
+    # ── Training ─────────────────────────────────
+
+    def _maybe_retrain(self):
+        n = len(self)
+        if self._bulk_loading or n < self.min_train_size:
+            return
+        if self._centroids is not None and self._added_since_training <= self.retrain_growth * max(self._trained_size, 1):
+            return
+        if self.background:
+            self.rebuild_async()
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        """Retrain centroids and reassign every row (blocking)."""
+        started = perf_counter()
+        with self._lock:
+            n = len(self._ids)
+            if n == 0:
+                return
+            snapshot = self._matrix[:n].copy()
+            nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        # k-means runs without the lock so queries keep being served.
+        centroids = kmeans(snapshot, nlist)
+        c_sq = np.einsum("ij,ij->i", centroids, centroids)
+        with self._lock:
+            n = len(self._ids)
+            assign = np.empty(n, dtype=np.int32)
+            for start in range(0, n, 8192):
+                block = self._matrix[start:min(start + 8192, n)]
+                assign[start:start + block.shape[0]] = np.argmin(c_sq[None, :] - 2.0 * (block @ centroids.T), axis=1)
+            self._assign[:n] = assign
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(centroids.shape[0] + 1))
+            self._list_cache = {c: order[bounds[c]:bounds[c + 1]] for c in range(centroids.shape[0])}
+            self._centroids = centroids
+            self._trained_size = n
+            self._added_since_training = 0
+        self.last_train_ms = (perf_counter() - started) * 1000.0
+        logger.info("IVF index trained: %d rows, %d lists in %.0fms", n, centroids.shape[0], self.last_train_ms)
+
+    def rebuild_async(self):
+        """Start a background retrain unless one is already running."""
+        if self._train_thread is not None and self._train_thread.is_alive():
+            return False
+
+        def _run():
+            try:
+                self.rebuild()
+            except Exception as exc:
+                logger.error(f"IVF background rebuild failed: {exc}")
+
+        self._train_thread = threading.Thread(target=_run, name="ivf-rebuild", daemon=True)
+        self._train_thread.start()
+        return True
+
+    def wait_until_trained(self, timeout=None):
+        thread = self._train_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self._centroids is not None
+
+    # ── Query ────────────────────────────────────
+
+    def _candidate_rows(self, q, n):
+        centroids = self._centroids
+        if centroids is None or n < self.min_train_size:
+            return None
+        nprobe = min(self.nprobe, centroids.shape[0])
+        c_d2 = np.einsum("ij,ij->i", centroids, centroids) - 2.0 * (centroids @ q)
+        probes = np.argpartition(c_d2, nprobe - 1)[:nprobe]
+        lists = [self._inverted_list(int(c), n) for c in probes]
+        return np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+
+    def _inverted_list(self, cluster, n):
+        """Rows assigned to *cluster*; rebuilt lazily after inserts/removes touch it."""
+        rows = self._list_cache.get(cluster)
+        if rows is None:
+            rows = np.flatnonzero(self._assign[:n] == cluster)
+            self._list_cache[cluster] = rows
+        return rows
+
+    def stats(self):
+        out = super().stats()
+        with self._lock:
+            out.update({
+                "backend": "ivf",
+                "trained": self._centroids is not None,
+                "nlist": 0 if self._centroids is None else int(self._centroids.shape[0]),
+                "nprobe": self.nprobe,
+                "trained_size": self._trained_size,
+                "added_since_training": self._added_since_training,
+                "last_train_ms": self.last_train_ms,
+            })
+        return out
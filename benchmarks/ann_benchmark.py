@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Recall / latency benchmark: IVF face index vs brute force.
+
+Generates synthetic dlib-like 128-D embeddings (identities clustered around a
+few dozen "population" centres, norm ~0.9, same-person probes ~0.35 away) and
+compares ann_index.IVFFaceIndex against the exact face_index.FaceIndex.
+
+Run from project root:
+  python benchmarks/ann_benchmark.py
+  python benchmarks/ann_benchmark.py --sizes 10000 100000 --nprobe 4 8 16 32 --queries 500
+
+Reported per (N, nprobe):
+  recall@1     top candidate identical to brute force
+  recall@k     overlap of the top-k candidate sets
+  decision     accept/deny (distance <= threshold) identical to brute force
+  p50/p95 ms   per-query match() latency
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from ann_index import IVFFaceIndex  # noqa: E402
+from embedding_codec import encode_embedding  # noqa: E402
+from face_index import FaceIndex  # noqa: E402
+
+
+def synthetic_embeddings(n, dim=128, populations=48, seed=7):
+    """Identity embeddings with dlib-like geometry (inter-person distance ~0.6-1.1)."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 1, (populations, dim))
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    which = rng.integers(0, populations, n)
+    ids = 0.55 * centres[which] + rng.normal(0, 0.6 / np.sqrt(dim), (n, dim))
+    ids *= 0.9 / np.linalg.norm(ids, axis=1, keepdims=True)
+    return ids.astype(np.float32)
+
+
+def probes_for(identities, count, noise=0.35, seed=11):
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(identities.shape[0], count, replace=False)
+    jitter = rng.normal(0, noise / np.sqrt(identities.shape[1]), (count, identities.shape[1]))
+    return identities[picked] + jitter.astype(np.float32)
+
+
+def fill(index, matrix):
+    visitors = {f"v{i}": {"basic_info": {"name": f"v{i}", "embedding": encode_embedding(row)}} for i, row in enumerate(matrix)}
+    index.sync(visitors)
+    return index
+
+
+def time_queries(index, probes, k, threshold):
+    results, latencies = [], []
+    for q in probes:
+        t0 = perf_counter()
+        results.append(index.match(q, threshold=threshold, k=k))
+        latencies.append((perf_counter() - t0) * 1000.0)
+    return results, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF vs brute-force face matching benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[2, 4, 8, 16, 32])
+    parser.add_argument("--nlist", type=int, default=0, help="0 = auto (~4*sqrt(N))")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    args = parser.parse_args()
+
+    print(f"{'N':>8} {'index':>10} {'nlist':>6} {'recall@1':>9} {'recall@k':>9} {'decision':>9} "
+          f"{'scanned':>8} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8}")
+    for n in args.sizes:
+        data = synthetic_embeddings(n)
+        probes = probes_for(data, min(args.queries, n))
+
+        t0 = perf_counter()
+        exact = fill(FaceIndex(capacity=n), data)
+        exact_build = perf_counter() - t0
+        truth, exact_lat = time_queries(exact, probes, args.k, args.threshold)
+        print(f"{n:>8} {'exact':>10} {'-':>6} {1.0:>9.3f} {1.0:>9.3f} {1.0:>9.3f} "
+              f"{n:>8} {np.percentile(exact_lat, 50):>8.3f} {np.percentile(exact_lat, 95):>8.3f} "
+              f"{exact_build:>8.2f}")
+
+        t0 = perf_counter()
+        ivf = IVFFaceIndex(capacity=n, nlist=args.nlist, min_train_size=0, background=False)
+        fill(ivf, data)
+        ivf_build = perf_counter() - t0
+        nlist = ivf.stats()["nlist"]
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            got, lat = time_queries(ivf, probes, args.k, args.threshold)
+            r1 = np.mean([bool(t.candidates) and bool(g.candidates)
+                          and t.candidates[0]["visitor_id"] == g.candidates[0]["visitor_id"]
+                          for t, g in zip(truth, got)])
+            rk = np.mean([len({c["visitor_id"] for c in t.candidates} & {c["visitor_id"] for c in g.candidates})
+                          / max(len(t.candidates), 1) for t, g in zip(truth, got)])
+            decision = np.mean([(t[0]["visitor_id"] if t else None) == (g[0]["visitor_id"] if g else None)
+                                for t, g in zip(truth, got)])
+            scanned = int(np.mean([g.scanned for g in got]))
+            print(f"{n:>8} {'ivf/' + str(nprobe):>10} {nlist:>6} {r1:>9.3f} {rk:>9.3f} {decision:>9.3f} "
+                  f"{scanned:>8} {np.percentile(lat, 50):>8.3f} {np.percentile(lat, 95):>8.3f} {ivf_build:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
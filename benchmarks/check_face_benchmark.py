@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Latency of /api/check_face: detection-only quick_check vs the full embedding path.
+
+The live-feedback endpoints used to call get_face_embedding (detector stages +
+68-point landmarks + ResNet descriptor) just to answer "is there a face?".
+They now call FaceEngine.quick_check (one YuNet pass at 320 px, or one Haar
+pass when the YuNet model is missing). This script times both on the same
+frames.
+
+Run from project root:
+  python benchmarks/check_face_benchmark.py --images gate/debug_frames/*.jpg
+  python benchmarks/check_face_benchmark.py --iterations 200 --model-dir gate
+
+Without --images a synthetic 640x480 frame is used. That frame has no face, so
+the full path runs every fallback stage, which is the worst case a kiosk sees
+between visitors. Without dlib installed the "full" row measures detection
+stages only (no descriptor).
+"""
+import argparse
+import glob
+import os
+import sys
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from face_engine import FaceEngine, load_face_engine  # noqa: E402
+
+
+def build_engine(model_dir, budget_ms):
+    yunet_path = os.path.join(model_dir, "face_detection_yunet_2023mar.onnx")
+    try:
+        return load_face_engine(model_dir, yunet_path=yunet_path, budget_ms=budget_ms), True
+    except Exception as e:
+        print(f"[!] dlib models unavailable ({e}); timing detection stages only.")
+    yunet = None
+    if hasattr(cv2, "FaceDetectorYN") and os.path.isfile(yunet_path):
+        yunet = cv2.FaceDetectorYN.create(yunet_path, "", (320, 320))
+    engine = FaceEngine(
+        None, None,
+        cascade=cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml"),
+        cascade_alt=cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_alt2.xml"),
+        yunet=yunet, budget_ms=budget_ms,
+    )
+    return engine, False
+
+
+def load_frames(patterns):
+    frames = []
+    for pattern in patterns or []:
+        for path in sorted(glob.glob(pattern)):
+            img = cv2.imread(path)
+            if img is not None:
+                frames.append(img)
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames.append(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8))
+    return frames
+
+
+def time_calls(fn, frames, iterations):
+    latencies = []
+    for i in range(iterations):
+        frame = frames[i % len(frames)]
+        t0 = perf_counter()
+        fn(frame)
+        latencies.append((perf_counter() - t0) * 1000.0)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="check_face quick_check vs full embedding latency")
+    parser.add_argument("--images", nargs="*", help="Glob(s) of JPEG frames captured from a kiosk")
+    parser.add_argument("--model-dir", default=os.path.join(_REPO_ROOT, "gate"))
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    args = parser.parse_args()
+
+    engine, has_descriptor = build_engine(args.model_dir, args.budget_ms)
+    frames = load_frames(args.images)
+    full = engine.embed if has_descriptor else engine.detect
+    rows = [
+        ("quick_check", time_calls(engine.quick_check, frames, args.iterations)),
+        ("embed" if has_descriptor else "detect (no dlib)", time_calls(full, frames, args.iterations)),
+    ]
+    detector = engine.quick_check(frames[0]).detector
+    print(f"frames={len(frames)} iterations={args.iterations} quick_check detector={detector}")
+    print(f"{'path':>18} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, lat in rows:
+        print(f"{name:>18} {np.percentile(lat, 50):>8.2f} {np.percentile(lat, 95):>8.2f} {lat.mean():>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
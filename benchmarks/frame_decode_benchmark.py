@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Latency and memory per frame size: full JPEG decode + resize vs IMREAD_REDUCED decode.
+
+FaceEngine works on a frame whose long side is at most 640 px (WORKING_MAX_SIDE).
+The old path decoded every upload at full resolution and then resized it; the
+new path (frame_upload.decode_frame_reduced) reads the size from the JPEG header
+and lets libjpeg decode at 1/2, 1/4 or 1/8 scale. The crop columns are the extra
+cost paid only when a face is under 150 px in the reduced frame and is re-read
+for the descriptor (JpegSource.crop). OpenCV cannot decode a JPEG region, so
+"+crop small" (a face that needs full resolution) costs a full decode; "+crop
+large" (a face big enough at 1/2 or 1/4 scale) decodes only at that scale.
+That helps only frames reduced by 4 or more, and only a little: libjpeg still
+entropy-decodes the whole file at every scale. Both columns include the
+reduced decode itself.
+
+Memory is the tracemalloc peak for one frame, which covers the numpy buffers
+OpenCV returns (not libjpeg's internal scratch space).
+
+Run from project root:
+  python benchmarks/frame_decode_benchmark.py
+  python benchmarks/frame_decode_benchmark.py --iterations 100 --quality 90
+  python benchmarks/frame_decode_benchmark.py --images gate/debug_frames/*.jpg
+"""
+import argparse
+import glob
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from face_engine import FULL_RES_FACE_SIDE, WORKING_MAX_SIDE  # noqa: E402
+from frame_upload import decode_frame, decode_frame_reduced  # noqa: E402
+
+SIZES = [(640, 480), (1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)]
+
+
+def synthetic_jpeg(width, height, quality):
+    """Smooth gradient plus noise: compresses roughly like a webcam frame."""
+    rng = np.random.default_rng(0)
+    x = np.linspace(40, 200, width, dtype=np.float32)
+    y = np.linspace(0, 40, height, dtype=np.float32)[:, None]
+    base = (x[None, :] + y)[..., None].repeat(3, axis=2)
+    img = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def to_working(img):
+    h, w = img.shape[:2]
+    scale = WORKING_MAX_SIDE / max(h, w)
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_LINEAR)
+
+
+def full_path(jpeg):
+    return to_working(decode_frame(jpeg))
+
+
+def reduced_path(jpeg):
+    img, _ = decode_frame_reduced(jpeg, WORKING_MAX_SIDE)
+    return to_working(img)
+
+
+def crop_path(jpeg, side):
+    img, source = decode_frame_reduced(jpeg, WORKING_MAX_SIDE)
+    if source is None:
+        return img
+    h, w = img.shape[:2]
+    return source.crop((w // 2 - side // 2, h // 2 - side // 2, side, side), min_side=FULL_RES_FACE_SIDE)
+
+
+def small_crop_path(jpeg):
+    return crop_path(jpeg, 30)
+
+
+def large_crop_path(jpeg):
+    return crop_path(jpeg, 120)
+
+
+def measure(fn, jpeg, iterations):
+    fn(jpeg)  # warm-up
+    latencies = []
+    for _ in range(iterations):
+        t0 = perf_counter()
+        fn(jpeg)
+        latencies.append((perf_counter() - t0) * 1000.0)
+    tracemalloc.start()
+    fn(jpeg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(np.median(latencies)), peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs reduced-resolution JPEG decode per frame size")
+    parser.add_argument("--images", nargs="*", help="Glob(s) of JPEG frames captured from a kiosk")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality for synthetic frames")
+    args = parser.parse_args()
+
+    frames = []
+    for pattern in args.images or []:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "rb") as f:
+                data = f.read()
+            img = decode_frame(data)
+            if img is not None:
+                frames.append((f"{img.shape[1]}x{img.shape[0]}", data))
+    if not frames:
+        frames = [(f"{w}x{h}", synthetic_jpeg(w, h, args.quality)) for w, h in SIZES]
+
+    print(f"working size {WORKING_MAX_SIDE}px, {args.iterations} iterations, median ms / tracemalloc peak MiB")
+    print(f"{'frame':>10} {'KiB':>6} {'full ms':>8} {'full MiB':>9} {'reduced ms':>11} {'reduced MiB':>12} "
+          f"{'factor':>6} {'+crop small':>12} {'+crop large':>12}")
+    for label, jpeg in frames:
+        full_ms, full_mb = measure(full_path, jpeg, args.iterations)
+        red_ms, red_mb = measure(reduced_path, jpeg, args.iterations)
+        small_ms, _ = measure(small_crop_path, jpeg, args.iterations)
+        large_ms, _ = measure(large_crop_path, jpeg, args.iterations)
+        _, source = decode_frame_reduced(jpeg, WORKING_MAX_SIDE)
+        factor = source.factor if source is not None else 1
+        print(f"{label:>10} {len(jpeg) / 1024:>6.0f} {full_ms:>8.2f} {full_mb:>9.2f} {red_ms:>11.2f} "
+              f"{red_mb:>12.2f} {factor:>6} {small_ms:>12.2f} {large_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
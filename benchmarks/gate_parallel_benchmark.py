@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+p50/p95 latency of a hybrid gate decision: sequential steps vs GATE_PARALLEL.
+
+Runs the real /checkin_verify_and_log handler (gate app in USE_MOCK_DATA mode)
+and adds simulated latency to the three independent steps:
+
+  --db-ms     validate_qr_token round trip, and again for the visitor record read
+  --embed-ms  get_face_embedding (detector + descriptor)
+
+Sequentially a granted check-in costs about db + embed + db. With
+GATE_PARALLEL the face step and the visitor read overlap the QR round trip,
+so it costs about max(db, embed). The latency is simulated with sleeps, and a
+sleep releases the GIL the same way a socket wait does. The dlib descriptor
+computation does not release the GIL, so with FACE_WORKERS=0 only the I/O
+steps overlap the CPU work.
+
+Run from project root:
+  python benchmarks/gate_parallel_benchmark.py
+  python benchmarks/gate_parallel_benchmark.py --db-ms 120 --embed-ms 250 --iterations 50
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_GATE_DIR = os.path.join(_REPO_ROOT, "gate")
+for _path in (_REPO_ROOT, _GATE_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+
+def load_gate():
+    os.environ["USE_MOCK_DATA"] = "True"
+    os.environ.setdefault("AUTH_MODE", "hybrid")
+    os.environ["CHECKIN_COOLDOWN_SECONDS"] = "0"
+    spec = importlib.util.spec_from_file_location("gate_app_benchmark", os.path.join(_GATE_DIR, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.init_gate()
+    return module
+
+
+class _SlowReader:
+    """read_reference() result whose visitors/<id> reads pay the simulated round trip."""
+
+    def __init__(self, ref, delay_s):
+        self._ref = ref
+        self._delay_s = delay_s
+
+    def get(self, *args, **kwargs):
+        time.sleep(self._delay_s)
+        return self._ref.get(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+def install_latency(gate, db_ms, embed_ms):
+    real_validate, real_read = gate.validate_qr_token, gate.read_reference
+    stored = gate.build_mock_gate_data()["visitors"]["visitor_demo_1"]["basic_info"]["embedding"]
+    embedding = [float(v) for v in stored.split()]
+
+    def slow_validate(qr_data, ref):
+        time.sleep(db_ms / 1000.0)
+        return real_validate(qr_data, ref)
+
+    def slow_read(path=None):
+        ref = real_read(path)
+        if path and path.startswith("visitors/") and path.count("/") == 1:
+            return _SlowReader(ref, db_ms / 1000.0)
+        return ref
+
+    def slow_embed(cv2_img, source=None, track=None):
+        time.sleep(embed_ms / 1000.0)
+        return embedding
+
+    gate.validate_qr_token = slow_validate
+    gate.read_reference = slow_read
+    gate.get_face_embedding = slow_embed
+    gate.frame_quality = None  # the same frame is posted repeatedly
+
+
+def run(gate, client, frame, iterations, parallel):
+    gate.GATE_PARALLEL = parallel
+    latencies = []
+    statuses = set()
+    for _ in range(iterations):
+        gate.db_ref = gate.InMemoryDBRef(gate.build_mock_gate_data())
+        visit_ref = gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        visit_ref.update({"status": "approved", "visit_approved": True})
+        qr_payload = visit_ref.get()["qr_payload"]
+        gate.get_face_matcher()  # rebind replica + index for the fresh DB outside the timing
+        t0 = perf_counter()
+        resp = client.post("/checkin_verify_and_log", data=frame, content_type="image/jpeg",
+                           query_string={"qr_data": qr_payload, "action": "checkin"})
+        latencies.append((perf_counter() - t0) * 1000.0)
+        statuses.add(resp.get_json()["status"])
+    return np.array(latencies), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs concurrent hybrid gate decision latency")
+    parser.add_argument("--db-ms", type=float, default=80.0, help="Simulated Firebase round trip")
+    parser.add_argument("--embed-ms", type=float, default=200.0, help="Simulated face embedding time")
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    gate = load_gate()
+    install_latency(gate, args.db_ms, args.embed_ms)
+    client = gate.app.test_client()
+    frame = cv2.imencode(".jpg", np.random.default_rng(0).integers(60, 200, (480, 640, 3), dtype=np.uint8))[1].tobytes()
+
+    print(f"db {args.db_ms:.0f}ms, embed {args.embed_ms:.0f}ms, {args.iterations} granted check-ins per mode")
+    print(f"{'mode':>12} {'p50 ms':>8} {'p95 ms':>8} {'statuses':>12}")
+    for name, parallel in (("sequential", False), ("parallel", True)):
+        lat, statuses = run(gate, client, frame, args.iterations, parallel)
+        print(f"{name:>12} {np.percentile(lat, 50):>8.1f} {np.percentile(lat, 95):>8.1f} {','.join(sorted(statuses)):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Blacklist face projection shared by Admin (writer) and registration (reader).
+=============================================
+Registration only needs "how close is the nearest blacklisted face?", yet used
+to download every visitor to answer it. This module maintains a small node
+holding just the blacklisted visitors' embeddings:
+
+    blacklist_index/
+        faces/{visitor_id}: {embedding, name, reason, blacklisted_at}
+        meta: {complete: true, version, updated_at}
+
+Admin's toggle_blacklist writes ``basic_info`` and the visitor's ``faces``
+entry in one multi-location update (``projection_updates``), so a blacklisted
+visitor is never missing from a complete projection. ``meta.complete`` is only
+set by a full rebuild, so readers fall back to scanning all visitors until the
+projection has been seeded at least once. ``meta.version`` is bumped with a
+server-side increment, so two concurrent toggles always yield two versions.
+
+Run from project root to (re)build the projection from all visitors:
+  python blacklist_index.py
+
+Uses: admin/firebase_credentials.json and FIREBASE_DATABASE_URL in admin/.env
+"""
+import os
+import sys
+import threading
+from datetime import datetime
+from time import time
+
+from event_partitions import increment
+
+BLACKLIST_INDEX_PATH = "blacklist_index"
+
+
+def _is_blacklisted(basic_info, visitor_root=None):
+    raw = (basic_info or {}).get("blacklisted")
+    if raw is None and isinstance(visitor_root, dict):
+        raw = visitor_root.get("blacklisted", "no")
+    return str(raw).strip().lower() in ("yes", "true", "1")
+
+
+def projection_entry(basic_info):
+    """Projection record for one blacklisted visitor, or None if it has no embedding."""
+    basic_info = basic_info or {}
+    embedding = basic_info.get("embedding")
+    if not embedding:
+        return None
+    return {
+        "embedding": embedding,
+        "name": basic_info.get("name", "Unknown"),
+        "reason": basic_info.get("blacklist_reason", "Security restriction"),
+        "blacklisted_at": basic_info.get("blacklisted_at", ""),
+    }
+
+
+def _meta_update():
+    """meta fields for a projection write; ``version`` is a server-side increment (no read)."""
+    return {
+        "meta/version": increment(),
+        "meta/updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def projection_updates(visitor_id, basic_info, blacklisted):
+    """
+    Root-relative multi-location update that adds, refreshes or drops one
+    visitor in the projection. Merge it into the update that changes
+    ``basic_info.blacklisted`` so the two are written atomically.
+    """
+    entry = projection_entry(basic_info) if blacklisted else None
+    updates = {f"{BLACKLIST_INDEX_PATH}/faces/{visitor_id}": entry}  # None deletes
+    updates.update({f"{BLACKLIST_INDEX_PATH}/{path}": value for path, value in _meta_update().items()})
+    return updates
+
+
+def update_blacklist_projection(root_ref, visitor_id, basic_info, blacklisted):
+    """
+    Add, refresh or drop one visitor in the projection with one update (call
+    after changing ``basic_info.blacklisted``). *root_ref* is a reference to the DB root.
+    """
+    root_ref.update(projection_updates(visitor_id, basic_info, blacklisted))
+
+
+def rebuild_blacklist_projection(root_ref, all_visitors=None):
+    """Rebuild the whole projection from the visitors tree and mark it complete."""
+    if all_visitors is None:
+        all_visitors = root_ref.child("visitors").get() or {}
+    faces = {}
+    for vid, vdata in (all_visitors or {}).items():
+        if not isinstance(vdata, dict):
+            continue
+        basic = vdata.get("basic_info") or {}
+        if not _is_blacklisted(basic, vdata):
+            continue
+        entry = projection_entry(basic)
+        if entry is not None:
+            faces[vid] = entry
+    # One multi-location update: faces are replaced and the version bumped together.
+    updates = {"faces": faces, "meta/complete": True, **_meta_update()}
+    root_ref.child(BLACKLIST_INDEX_PATH).update(updates)
+    return len(faces)
+
+
+class BlacklistProjectionCache:
+    """
+    Process-local FaceIndex over the projection, refreshed when ``meta.version``
+    changes (checked at most every *ttl_seconds*). ``get()`` returns None when
+    the projection is missing or was never completed — callers must then fall
+    back to a full visitors scan.
+    """
+
+    def __init__(self, ttl_seconds=5.0):
+        self.ttl_seconds = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._checked_at = None
+
+    def get(self, root_ref):
+        now = time()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.ttl_seconds:
+                return self._index
+        meta = root_ref.child(f"{BLACKLIST_INDEX_PATH}/meta").get()
+        if not isinstance(meta, dict) or meta.get("complete") is not True:
+            with self._lock:
+                self._index, self._version, self._checked_at = None, None, now
+            return None
+        version = meta.get("version")
+        with self._lock:
+            if self._index is not None and version == self._version:
+                self._checked_at = now
+                return self._index
+        faces = root_ref.child(f"{BLACKLIST_INDEX_PATH}/faces").get() or {}
+        from face_index import FaceIndex
+
+        index = FaceIndex.from_visitors({
+            vid: {"basic_info": {
+                "name": entry.get("name", "Unknown"),
+                "embedding": entry.get("embedding"),
+                "blacklisted": "yes",
+            }}
+            for vid, entry in faces.items() if isinstance(entry, dict)
+        })
+        with self._lock:
+            self._index = index
+            self._version = version
+            self._checked_at = now
+        return index
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
+
+
+def main():
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "admin"))
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(os.path.join(os.path.dirname(__file__), "admin", ".env"))
+    except ImportError:
+        pass
+
+    import firebase_admin
+    from firebase_admin import credentials, db
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    cred_path = os.path.join(base, "admin", "firebase_credentials.json")
+    if not os.path.exists(cred_path):
+        print("ERROR: admin/firebase_credentials.json not found.")
+        sys.exit(1)
+
+    database_url = os.environ.get("FIREBASE_DATABASE_URL", "").strip().rstrip("/")
+    if not database_url:
+        print("ERROR: FIREBASE_DATABASE_URL not set. Set it in admin/.env")
+        sys.exit(1)
+    if not database_url.startswith("https://"):
+        database_url = "https://visitor-management-8f5b4-default-rtdb.firebaseio.com"
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred, {"databaseURL": database_url + "/"})
+
+    count = rebuild_blacklist_projection(db.reference())
+    print(f"Blacklist projection rebuilt: {count} blacklisted face(s) in /{BLACKLIST_INDEX_PATH}.")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        if "404" in str(e) or "NotFound" in type(e).__name__:
+            print("Firebase returned 404. Check FIREBASE_DATABASE_URL and that the Realtime Database exists.")
+        else:
+            print(f"Error: {e}")
+        sys.exit(1)
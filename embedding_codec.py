@@ -0,0 +1,63 @@
+"""
+Compact storage format for 128-D face embeddings.
+=============================================
+Embeddings used to be stored as space-separated decimal text (~2.5 KB per
+visitor, parsed with ``float()`` per component). The current format is a
+version tag followed by base64 of little-endian float32:
+
+    "f32v1:" + base64(<128 x float32 LE>)      (~690 bytes)
+
+which decodes with a single ``np.frombuffer`` over the base64-decoded bytes.
+``decode_embedding`` still accepts the legacy text form (and plain lists), so
+readers work on a partially migrated database; see migrate_embeddings.py.
+"""
+
+import base64
+import binascii
+
+import numpy as np
+
+EMBEDDING_DIM = 128
+EMBEDDING_FORMAT_TAG = "f32v1:"
+_DTYPE = np.dtype("<f4")
+
+
+def encode_embedding(vec):
+    """Encode an embedding (any array-like of floats) in the current tagged format."""
+    arr = np.ascontiguousarray(np.asarray(vec, dtype=_DTYPE).ravel())
+    return EMBEDDING_FORMAT_TAG + base64.b64encode(arr.tobytes()).decode("ascii")
+
+
+def is_legacy_embedding(raw):
+    """True if *raw* is stored in an older format that migration should rewrite."""
+    return bool(raw) and not (isinstance(raw, str) and raw.startswith(EMBEDDING_FORMAT_TAG))
+
+
+def decode_embedding(raw, dim=EMBEDDING_DIM):
+    """
+    Decode a stored embedding to a float32 vector, or None if unusable.
+
+    Accepts the tagged base64 format, legacy space-separated text and plain
+    lists. The tagged path returns a read-only view over the decoded bytes.
+    Pass ``dim=None`` to skip the length check.
+    """
+    if raw is None:
+        return None
+    try:
+        if isinstance(raw, str):
+            if raw.startswith(EMBEDDING_FORMAT_TAG):
+                buf = base64.b64decode(raw[len(EMBEDDING_FORMAT_TAG):], validate=True)
+                if len(buf) % _DTYPE.itemsize:
+                    return None
+                vec = np.frombuffer(buf, dtype=_DTYPE)
+            else:
+                vec = np.array(raw.strip().split(), dtype=np.float32)
+        else:
+            vec = np.asarray(raw, dtype=np.float32).ravel()
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if dim is not None and vec.size != dim:
+        return None
+    if not np.all(np.isfinite(vec)):
+        return None
+    return vec
@@ -0,0 +1,271 @@
+"""
+Date-partitioned storage for research_protocol_events and security_alerts.
+=============================================
+Both streams used to be flat nodes keyed by ``%Y-%m-%d_%H-%M-%S_%f``, so any
+read or export had to download the whole history. They are now stored per
+day, with a daily summary node next to each stream:
+
+    research_protocol_events/<YYYY-MM-DD>/<key>       event record
+    research_protocol_events_daily/<YYYY-MM-DD>       {"total": n,
+                                                       "by_type": {"arrival": n, ...},
+                                                       "by_auth_mode": {"DUAL": n, ...}}
+    security_alerts/<YYYY-MM-DD>/<key>                alert record ("by_type" counts alert_type)
+    security_alerts_daily/<YYYY-MM-DD>
+
+``write_event`` sends the record and its summary counters as one
+multi-location update on whatever db_ref-shaped target the gate writes
+through (the database root, a grant's WriteBatch or the write-behind
+LogJournal). The counters use the Realtime Database server-side increment
+(``{".sv": {"increment": n}}``), so no read is needed. If the write-behind
+journal re-sends an entry after a crash, the record is simply overwritten
+but its counters are incremented twice. ``migrate_event_partitions.py
+--rebuild-summaries`` recomputes the summaries from the records.
+
+Every record also gets ``written_at``, a server timestamp
+(``{".sv": "timestamp"}``, epoch ms) resolved when the write reaches the
+database, not when the event happened. A record the write-behind journal
+holds back during an outage keeps its old key but gets a late
+``written_at``; ``iter_written_between`` finds such records for exports.
+On Firebase it queries each day by ``written_at``, which needs
+``".indexOn": ["written_at"]`` on ``<stream>/$day`` in the database rules.
+
+``read_events`` / ``read_summaries`` range-scan days, so dashboards and
+exports download only the days they ask for; ``iter_event_pages`` pages
+through a key range for exports of any size.
+"""
+
+import re
+from datetime import date, datetime, timedelta
+
+STREAMS = ("research_protocol_events", "security_alerts")
+SUMMARY_SUFFIX = "_daily"
+# Record field counted in the summary's "by_type"
+TYPE_FIELD = {"research_protocol_events": "event", "security_alerts": "alert_type"}
+WRITTEN_AT = "written_at"  # server timestamp (epoch ms) of the write that stored the record
+
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_UNSAFE_KEY_CHARS = re.compile(r"[.$#\[\]/]")
+
+
+def increment(n=1):
+    """Server-side increment sentinel for set()/update() values."""
+    return {".sv": {"increment": n}}
+
+
+def is_increment(value):
+    return isinstance(value, dict) and isinstance(value.get(".sv"), dict) and "increment" in value[".sv"]
+
+
+def server_timestamp():
+    """Server timestamp sentinel: the database stores its own clock (epoch ms) at write time."""
+    return {".sv": "timestamp"}
+
+
+def is_server_timestamp(value):
+    return isinstance(value, dict) and value.get(".sv") == "timestamp"
+
+
+def written_at(record):
+    """``written_at`` of a stored record (epoch ms), or None for records written before it existed."""
+    value = record.get(WRITTEN_AT) if isinstance(record, dict) else None
+    return value if isinstance(value, (int, float)) else None
+
+
+def day_of_key(key):
+    """'YYYY-MM-DD' of an event key (``%Y-%m-%d_%H-%M-%S_%f``), or None for anything else."""
+    day = str(key)[:10]
+    return day if _DAY_RE.match(day) else None
+
+
+def is_day(key):
+    return bool(_DAY_RE.match(str(key)))
+
+
+def summary_stream(stream):
+    return f"{stream}{SUMMARY_SUFFIX}"
+
+
+def _counter_key(value):
+    text = _UNSAFE_KEY_CHARS.sub("_", str(value or "").strip())
+    return text or "unknown"
+
+
+def summary_increments(stream, day, entries):
+    """Server increments (path → value) that count *entries* in *day*'s summary."""
+    counts = {}
+    type_field = TYPE_FIELD.get(stream, "type")
+    summary = f"{summary_stream(stream)}/{day}"
+    for entry in entries:
+        paths = [f"{summary}/total", f"{summary}/by_type/{_counter_key(entry.get(type_field))}"]
+        if entry.get("auth_mode"):
+            paths.append(f"{summary}/by_auth_mode/{_counter_key(entry['auth_mode'])}")
+        for path in paths:
+            counts[path] = counts.get(path, 0) + 1
+    return {path: increment(n) for path, n in counts.items()}
+
+
+def event_updates(stream, key, entry):
+    """Multi-location update (path → value) that stores *entry* and counts it in its day's summary."""
+    day = day_of_key(key) or datetime.now().strftime("%Y-%m-%d")
+    updates = {f"{stream}/{day}/{key}": dict(entry, **{WRITTEN_AT: server_timestamp()})}
+    updates.update(summary_increments(stream, day, [entry]))
+    return updates
+
+
+def write_event(ref, stream, key, entry):
+    """Write one event record + summary counters through *ref* (db root, WriteBatch or LogJournal)."""
+    ref.update(event_updates(stream, key, entry))
+
+
+def summarize(events_by_key, stream):
+    """Summary node for one day's records, as write_event would have counted them."""
+    summary = {"total": 0, "by_type": {}, "by_auth_mode": {}}
+    type_field = TYPE_FIELD.get(stream, "type")
+    for entry in events_by_key.values():
+        if not isinstance(entry, dict):
+            continue
+        summary["total"] += 1
+        kind = _counter_key(entry.get(type_field))
+        summary["by_type"][kind] = summary["by_type"].get(kind, 0) + 1
+        if entry.get("auth_mode"):
+            mode = _counter_key(entry["auth_mode"])
+            summary["by_auth_mode"][mode] = summary["by_auth_mode"].get(mode, 0) + 1
+    if not summary["by_auth_mode"]:
+        del summary["by_auth_mode"]
+    return summary
+
+
+# ──────────────────────────────────────────────
+# Reader API
+# ──────────────────────────────────────────────
+
+def _as_day(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, date):
+        return value.isoformat()
+    day = str(value)[:10]
+    datetime.strptime(day, "%Y-%m-%d")  # ValueError on malformed input
+    return day
+
+
+def day_range(start, end=None):
+    """Inclusive list of 'YYYY-MM-DD' strings from *start* to *end* (default: *start*)."""
+    first = datetime.strptime(_as_day(start), "%Y-%m-%d").date()
+    last = datetime.strptime(_as_day(end if end is not None else start), "%Y-%m-%d").date()
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+def _scan_days(ref, node, start, end):
+    """{day: value} for the day children of *node* in [start, end]."""
+    start, end = _as_day(start), _as_day(end if end is not None else start)
+    parent = ref.child(node)
+    if hasattr(parent, "order_by_key"):
+        # Firebase: one key-range query instead of a read per day.
+        data = parent.order_by_key().start_at(start).end_at(end).get() or {}
+        return {day: value for day, value in data.items() if is_day(day)}
+    found = {}
+    for day in day_range(start, end):
+        value = parent.child(day).get()
+        if value:
+            found[day] = value
+    return found
+
+
+def read_events(ref, stream, start, end=None):
+    """
+    Records of *stream* between *start* and *end* (inclusive days), oldest first.
+
+    Returns a list of (day, key, record). *ref* is the database root (a
+    firebase_admin Reference or the gate's InMemoryDBRef).
+    """
+    rows = []
+    for day, records in sorted(_scan_days(ref, stream, start, end).items()):
+        if isinstance(records, dict):
+            rows.extend((day, key, records[key]) for key in sorted(records))
+    return rows
+
+
+def _day_keys(ref, stream):
+    node = ref.child(stream)
+    try:
+        data = node.get(shallow=True)
+    except TypeError:  # references without shallow reads (in-memory demo DB)
+        data = node.get()
+    return sorted(k for k in (data or {}) if is_day(k)) if isinstance(data, dict) else []
+
+
+def _read_page(day_ref, after, limit):
+    """Up to *limit* (key, record) pairs of one day with key > *after*, in key order."""
+    if hasattr(day_ref, "order_by_key"):
+        query = day_ref.order_by_key()
+        if after is not None:
+            query = query.start_at(after)
+        data = query.limit_to_first(limit + (1 if after is not None else 0)).get() or {}
+        items = [(k, v) for k, v in data.items() if after is None or k > after]
+        return sorted(items)[:limit]
+    data = day_ref.get() or {}
+    return [(k, data[k]) for k in sorted(data) if after is None or k > after][:limit]
+
+
+def iter_event_pages(ref, stream, after_key=None, until_key=None, page_size=1000):
+    """
+    Yield pages (lists of (key, record), oldest first) of *stream* records
+    with ``after_key < key <= until_key``.
+
+    Only the day list (a shallow read) and one page are held at a time, so
+    memory stays bounded however many events a day holds.
+    """
+    first_day = day_of_key(after_key) if after_key else None
+    last_day = day_of_key(until_key) if until_key else None
+    for day in _day_keys(ref, stream):
+        if first_day and day < first_day:
+            continue
+        if last_day and day > last_day:
+            break
+        cursor = after_key if first_day and day == first_day else None
+        day_ref = ref.child(f"{stream}/{day}")
+        while True:
+            page = _read_page(day_ref, cursor, page_size)
+            if until_key is not None:
+                page = [(k, v) for k, v in page if k <= until_key]
+            if not page:
+                break
+            yield page
+            if len(page) < page_size:
+                break
+            cursor = page[-1][0]
+
+
+def iter_written_between(ref, stream, written_after, written_before, until_key=None):
+    """
+    Yield pages (one per day, oldest first) of *stream* records with
+    ``written_after < written_at <= written_before`` (epoch ms) and
+    ``key <= until_key``.
+
+    Used to catch records that reached the database after later-keyed ones.
+    Each page holds the matching records of one day, which stay few: only
+    records written inside the window match.
+    """
+    last_day = day_of_key(until_key) if until_key else None
+    for day in _day_keys(ref, stream):
+        if last_day and day > last_day:
+            break
+        day_ref = ref.child(f"{stream}/{day}")
+        if hasattr(day_ref, "order_by_child"):
+            query = day_ref.order_by_child(WRITTEN_AT).start_at(written_after + 1).end_at(written_before)
+            data = query.get() or {}
+        else:
+            data = day_ref.get() or {}
+        page = sorted(
+            (k, v) for k, v in data.items()
+            if (until_key is None or k <= until_key)
+            and written_at(v) is not None and written_after < written_at(v) <= written_before
+        )
+        if page:
+            yield page
+
+
+def read_summaries(ref, stream, start, end=None):
+    """{day: summary} for *stream* between *start* and *end*; days without events are absent."""
+    return dict(sorted(_scan_days(ref, summary_stream(stream), start, end).items()))
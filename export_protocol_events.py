@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Export gate protocol events to Parquet (or Arrow IPC) for the protocol comparison.
+Reads research_protocol_events/<YYYY-MM-DD>/<key> (see event_partitions.py) page by
+page in key order and writes each page as one row group. Memory use is bounded by
+--page-size, whatever the number of events. Columns are typed:
+
+  event_key, event, auth_mode, protocol_config, visitor_id, visit_id, reason, status, ip   string
+  timestamp                                                                                timestamp[ms]
+
+Other event fields are not exported.
+
+Run from project root:
+  python export_protocol_events.py --out exports/events.parquet                   # everything
+  python export_protocol_events.py --from 2026-03-01 --to 2026-03-31 --out march.parquet
+  python export_protocol_events.py --checkpoint exports/checkpoint.json           # only events since last run
+  python export_protocol_events.py --format arrow --out exports/events.arrow
+
+With --checkpoint each run writes the events after the checkpoint's last key to
+a new file in --out-dir (unless --out is given), named after the first and last
+key it holds. The checkpoint advances only once that file is complete.
+Incremental runs stop --settle-seconds before now. Keys are event times, so an
+event a gate's write-behind journal held back (a Firebase outage, a replay
+after a crash) arrives with a key older than the checkpoint. Each run therefore
+also exports the older-keyed events whose server ``written_at`` (see
+event_partitions.py) falls after the previous run's write cutoff, and leaves
+events written in the last --settle-seconds to the next run. A record the
+journal re-sends after a crash is written, and exported, again: de-duplicate
+on event_key. --settle-seconds must exceed the clock skew between this machine
+and the database.
+
+Requires pyarrow (pip install pyarrow). Uses admin/firebase_credentials.json and
+FIREBASE_DATABASE_URL in admin/.env. Run migrate_event_partitions.py first if the
+database still has flat (pre-partition) records; they are not exported.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "admin"))
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), "admin", ".env"))
+except ImportError:
+    pass
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+import firebase_admin
+from firebase_admin import credentials, db
+
+from event_partitions import day_of_key, iter_event_pages, iter_written_between, written_at
+
+STREAM = "research_protocol_events"
+KEY_FORMAT = "%Y-%m-%d_%H-%M-%S_%f"
+STRING_COLUMNS = ("event", "auth_mode", "protocol_config", "visitor_id", "visit_id", "reason", "status", "ip")
+COLUMNS = ("event_key", "event", "auth_mode", "protocol_config", "timestamp",
+           "visitor_id", "visit_id", "reason", "status", "ip")
+
+
+def export_schema():
+    fields = [pa.field("event_key", pa.string(), nullable=False)]
+    for name in COLUMNS[1:]:
+        fields.append(pa.field(name, pa.timestamp("ms") if name == "timestamp" else pa.string()))
+    return pa.schema(fields)
+
+
+def _timestamp(value):
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+def page_columns(page):
+    """Column lists for one page of (key, record) pairs."""
+    columns = {name: [] for name in COLUMNS}
+    for key, record in page:
+        record = record if isinstance(record, dict) else {}
+        columns["event_key"].append(str(key))
+        columns["timestamp"].append(_timestamp(record.get("timestamp")))
+        for name in STRING_COLUMNS:
+            value = record.get(name)
+            columns[name].append(None if value is None else str(value))
+    return columns
+
+
+class _TableWriter:
+    """Streams row groups to a Parquet file or an Arrow IPC file."""
+
+    def __init__(self, path, fmt):
+        self.schema = export_schema()
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+            self._sink = None
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+
+    def write(self, columns):
+        self._writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def export_events(root_ref, out_path, fmt="parquet", after_key=None, until_key=None, page_size=5000):
+    """
+    Write events with ``after_key < key <= until_key`` to *out_path*.
+
+    The file is written under a temporary name and moved into place when
+    complete; with no matching events nothing is written. Returns a stats dict
+    (rows, row_groups, first_key, last_key, path).
+    """
+    pages = iter_event_pages(root_ref, STREAM, after_key=after_key, until_key=until_key, page_size=page_size)
+    return write_pages(pages, out_path, fmt=fmt)
+
+
+def write_pages(pages, out_path, fmt="parquet"):
+    """Write each non-empty page of (key, record) pairs as one row group; see export_events."""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the export (pip install pyarrow)")
+    stats = {"rows": 0, "row_groups": 0, "first_key": None, "last_key": None, "path": None}
+    tmp = f"{out_path}.tmp"
+    writer = None
+    try:
+        for page in pages:
+            if not page:
+                continue
+            if writer is None:
+                os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+                writer = _TableWriter(tmp, fmt)
+            writer.write(page_columns(page))
+            stats["rows"] += len(page)
+            stats["row_groups"] += 1
+            keys = [page[0][0], page[-1][0]] + [k for k in (stats["first_key"], stats["last_key"]) if k]
+            stats["first_key"], stats["last_key"] = min(keys), max(keys)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp)
+        raise
+    if writer is None:
+        return stats
+    writer.close()
+    os.replace(tmp, out_path)
+    stats["path"] = out_path
+    return stats
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(path, checkpoint):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(checkpoint, fh, indent=2)
+    os.replace(tmp, path)
+
+
+def export_since_checkpoint(root_ref, checkpoint_path, out_dir="exports", out_path=None, fmt="parquet",
+                            page_size=5000, settle_seconds=300, now=None):
+    """
+    Export the events after the checkpoint's last key, plus older-keyed events
+    written since the last run, and advance the checkpoint. Returns the stats
+    dict, with ``late_rows`` counting the older-keyed events.
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    after_key = checkpoint.get("last_key")
+    written_after = checkpoint.get("written_before")
+    cutoff = (now or datetime.now()) - timedelta(seconds=settle_seconds)
+    until_key = cutoff.strftime(KEY_FORMAT)
+    written_before = int(cutoff.timestamp() * 1000)
+    late = {"rows": 0}
+
+    def settled(page):
+        # Written after the cutoff: the next run's write window picks it up.
+        return [(k, v) for k, v in page if (written_at(v) or 0) <= written_before]
+
+    def pages():
+        for page in iter_event_pages(root_ref, STREAM, after_key=after_key, until_key=until_key,
+                                     page_size=page_size):
+            yield settled(page)
+        if after_key is not None and written_after is not None:
+            for page in iter_written_between(root_ref, STREAM, written_after, written_before, until_key=after_key):
+                late["rows"] += len(page)
+                yield page
+
+    suffix = "parquet" if fmt == "parquet" else "arrow"
+    target = out_path or os.path.join(out_dir, f"{STREAM}_export.{suffix}")
+    stats = write_pages(pages(), target, fmt=fmt)
+    stats["late_rows"] = late["rows"]
+    if stats["rows"] and out_path is None:
+        named = os.path.join(out_dir, f"{STREAM}_{stats['first_key']}__{stats['last_key']}.{suffix}")
+        os.replace(target, named)
+        stats["path"] = named
+    save_checkpoint(checkpoint_path, {
+        "stream": STREAM,
+        "last_key": max(filter(None, (after_key, stats["last_key"])), default=None),
+        "written_before": written_before,
+        "last_file": stats["path"] or checkpoint.get("last_file"),
+        "exported_rows": int(checkpoint.get("exported_rows", 0)) + stats["rows"],
+        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export research_protocol_events to Parquet / Arrow IPC.")
+    parser.add_argument("--out", help="Output file (default with --checkpoint: a new file in --out-dir)")
+    parser.add_argument("--out-dir", default="exports", help="Directory for incremental exports (default exports)")
+    parser.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    parser.add_argument("--from", dest="from_day", help="First day to export (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="to_day", help="Last day to export (YYYY-MM-DD)")
+    parser.add_argument("--checkpoint", help="Checkpoint file: export only events after the last run")
+    parser.add_argument("--settle-seconds", type=int, default=300,
+                        help="Incremental runs leave out the most recent events (default 300 s)")
+    parser.add_argument("--page-size", type=int, default=5000, help="Events per read and per row group")
+    args = parser.parse_args()
+    if pa is None:
+        print("ERROR: pyarrow is not installed (pip install pyarrow).")
+        sys.exit(1)
+    if args.page_size < 1:
+        print("ERROR: --page-size must be at least 1.")
+        sys.exit(1)
+    if args.checkpoint and (args.from_day or args.to_day):
+        print("ERROR: --checkpoint cannot be combined with --from/--to.")
+        sys.exit(1)
+    if not args.checkpoint and not args.out:
+        print("ERROR: --out is required unless --checkpoint is given.")
+        sys.exit(1)
+    for day in (args.from_day, args.to_day):
+        if day and day_of_key(day) != day:
+            print(f"ERROR: {day!r} is not a YYYY-MM-DD day.")
+            sys.exit(1)
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    cred_path = os.path.join(base, "admin", "firebase_credentials.json")
+    if not os.path.exists(cred_path):
+        print("ERROR: admin/firebase_credentials.json not found.")
+        sys.exit(1)
+
+    database_url = os.environ.get("FIREBASE_DATABASE_URL", "").strip().rstrip("/")
+    if not database_url:
+        print("ERROR: FIREBASE_DATABASE_URL not set. Set it in admin/.env")
+        sys.exit(1)
+    if not database_url.startswith("https://"):
+        database_url = "https://visitor-management-8f5b4-default-rtdb.firebaseio.com"
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred, {"databaseURL": database_url + "/"})
+
+    if args.checkpoint:
+        stats = export_since_checkpoint(db.reference(), args.checkpoint, out_dir=args.out_dir, out_path=args.out,
+                                        fmt=args.format, page_size=args.page_size,
+                                        settle_seconds=args.settle_seconds)
+    else:
+        # "~" sorts after every digit/underscore, so it bounds the whole last day.
+        stats = export_events(db.reference(), args.out, fmt=args.format,
+                              after_key=f"{args.from_day}" if args.from_day else None,
+                              until_key=f"{args.to_day}~" if args.to_day else None,
+                              page_size=args.page_size)
+    if not stats["rows"]:
+        print("No new events to export.")
+        return
+    print(
+        f"Exported {stats['rows']} event(s) in {stats['row_groups']} row group(s) to {stats['path']} "
+        f"({stats['first_key']} .. {stats['last_key']})."
+    )
+    if stats.get("late_rows"):
+        print(f"{stats['late_rows']} of them reached the database after the previous export.")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        if "404" in str(e) or "NotFound" in type(e).__name__:
+            print("Firebase returned 404. Check FIREBASE_DATABASE_URL and that the Realtime Database exists.")
+        else:
+            print(f"Error: {e}")
+        sys.exit(1)
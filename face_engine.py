@@ -0,0 +1,549 @@
+"""
+Detect-once, embed-once face pipeline shared by gate and registration.
+=============================================
+The old ``get_face_embedding`` tried 5 image variants x 6 scales, and at each
+scale ran Haar (2 cascades x 4 settings), YuNet (+ mirrored), dlib HOG at
+upsample 0-4 on gray and RGB, 6 more cascade settings and then all of it
+mirrored again - a frame without a face could cost hundreds of detector passes
+and several ``compute_face_descriptor`` calls.
+
+``FaceEngine`` instead:
+
+  1. normalises the frame once to a working size (long side 480-640 px),
+  2. runs an ordered list of detector *stages* until one returns a face box -
+     the first (primary) stage always runs, later fallback stages only while
+     the per-frame millisecond budget lasts,
+  3. maps that box back to the original frame and runs the 68-point shape
+     predictor and ``compute_face_descriptor`` exactly once.
+
+Every stage reports its timing in ``FaceEngineResult.timings`` so slow or
+useless fallbacks are visible in the logs. With an ``AdaptiveStageOrder``
+(stage_order.py) the stage order is learned per kiosk instead of fixed.
+
+With a ``hint_box`` (the face box from the same kiosk's previous frame, kept
+in a ``FaceTrack``) ``detect``/``embed`` first run one detector pass on a
+padded region around it (stage "track") and fall back to the full stage list
+only when the face is not there any more. ``FaceTrack`` also averages the
+embeddings of the last few frames of the same face for a steadier distance.
+
+``quick_check`` is the detection-only path behind /api/check_face: one YuNet
+pass at 320 px (one Haar pass without the YuNet model) returning the box, a
+0..1 quality score and a positioning hint. It skips the landmarks and the
+ResNet descriptor, which dominate ``embed``; compare the two on kiosk frames
+with benchmarks/check_face_benchmark.py.
+"""
+
+import os
+import threading
+from collections import deque
+from time import perf_counter
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # pragma: no cover - both apps require OpenCV
+    cv2 = None
+
+try:
+    import dlib
+except ImportError:
+    dlib = None
+
+DEFAULT_BUDGET_MS = 250.0
+# Detectors behave best with the long side in this range (see the old multi-scale loop).
+WORKING_MAX_SIDE = 640
+WORKING_MIN_SIDE = 400
+WORKING_UPSCALE_TO = 480
+# Detection-only live-feedback check (/api/check_face): one detector pass at this long side.
+QUICK_CHECK_SIDE = 320
+# dlib aligns faces into a 150 px chip; smaller boxes in a reduced-resolution decode
+# are re-read from a finer-scale crop (see frame_upload.JpegSource).
+FULL_RES_FACE_SIDE = 150
+# Cross-frame tracking: ROI = previous box padded by this fraction of its size on each side.
+TRACK_ROI_PAD = 0.5
+TRACK_WINDOW = 3  # embeddings averaged per track
+TRACK_MAX_DRIFT = 0.5  # a new embedding this far from the track mean starts a new average
+
+
+class FaceEngineResult:
+    """Outcome of one ``detect``/``embed`` call on a frame."""
+
+    __slots__ = ("embedding", "box", "stage", "timings", "elapsed_ms", "budget_exhausted")
+
+    def __init__(self):
+        self.embedding = None
+        self.box = None  # (x, y, w, h) in original frame pixels
+        self.stage = None  # name of the stage that found the face
+        self.timings = []  # [{"stage", "ms", "found"}], in run order; "embed" last
+        self.elapsed_ms = 0.0
+        self.budget_exhausted = False
+
+    @property
+    def found(self):
+        return self.box is not None
+
+    @property
+    def detector_calls(self):
+        return sum(1 for t in self.timings if t["stage"] != "embed")
+
+    def summary(self):
+        """Compact one-line timing string for logs, e.g. ``yunet=4.1ms* embed=38.0ms``."""
+        parts = [f"{t['stage']}={t['ms']:.1f}ms{'*' if t['found'] else ''}" for t in self.timings]
+        if self.budget_exhausted:
+            parts.append("budget-exhausted")
+        return " ".join(parts)
+
+
+class FaceCheck:
+    """Detection-only result for UI feedback: box, quality score and a positioning hint."""
+
+    __slots__ = ("face_detected", "box", "score", "quality", "hint", "faces", "detector", "elapsed_ms")
+
+    def __init__(self):
+        self.face_detected = False
+        self.box = None  # (x, y, w, h) in original frame pixels
+        self.score = None  # detector confidence (YuNet only)
+        self.quality = 0.0  # 0..1: confidence x size x centring
+        self.hint = None
+        self.faces = 0
+        self.detector = None
+        self.elapsed_ms = 0.0
+
+    def to_dict(self):
+        return {
+            "face_detected": self.face_detected,
+            "box": list(self.box) if self.box else None,
+            "quality": round(self.quality, 3),
+            "hint": self.hint,
+            "faces": self.faces,
+            "detector": self.detector,
+            "latency_ms": round(self.elapsed_ms, 2),
+        }
+
+
+def _positioning(box, frame_w, frame_h, score, faces):
+    """(quality, hint) for one face box; hint None when the framing is good."""
+    x, y, w, h = box
+    rel_w = w / float(frame_w)
+    off_x = (x + w / 2.0) / frame_w - 0.5
+    off_y = (y + h / 2.0) / frame_h - 0.5
+    if rel_w < 0.25:
+        size_q = rel_w / 0.25
+    else:
+        size_q = max(0.0, 1.0 - max(0.0, rel_w - 0.65) / 0.35)
+    centre_q = max(0.0, 1.0 - 2.0 * (off_x ** 2 + off_y ** 2) ** 0.5)
+    conf = 1.0 if score is None else max(0.0, min(1.0, score))
+    quality = conf * size_q * centre_q
+
+    if faces > 1:
+        hint = "Only one person in front of the camera, please."
+    elif rel_w < 0.18:
+        hint = "Move a little closer to the camera."
+    elif rel_w > 0.65:
+        hint = "Move back a little."
+    elif abs(off_x) > 0.2 or abs(off_y) > 0.25:
+        hint = "Center your face in the oval."
+    elif score is not None and score < 0.75:
+        hint = "Face the camera directly and ensure good lighting."
+    else:
+        hint = None
+    return quality, hint
+
+
+class _Frame:
+    """Working-size views of one frame, built lazily and shared by all stages."""
+
+    def __init__(self, bgr):
+        self.original = np.ascontiguousarray(bgr.astype(np.uint8))
+        h, w = self.original.shape[:2]
+        long_side = max(h, w)
+        if long_side > WORKING_MAX_SIDE:
+            self.scale = WORKING_MAX_SIDE / long_side
+        elif long_side < WORKING_MIN_SIDE:
+            self.scale = WORKING_UPSCALE_TO / long_side
+        else:
+            self.scale = 1.0
+        if self.scale != 1.0:
+            size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+            self.bgr = np.ascontiguousarray(cv2.resize(self.original, size, interpolation=cv2.INTER_LINEAR))
+        else:
+            self.bgr = self.original
+        self._gray = None
+        self._gray_eq = None
+
+    @property
+    def size(self):
+        h, w = self.bgr.shape[:2]
+        return w, h
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = np.ascontiguousarray(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+        return self._gray
+
+    @property
+    def gray_eq(self):
+        # Histogram equalisation helps in poor lighting.
+        if self._gray_eq is None:
+            self._gray_eq = np.ascontiguousarray(cv2.equalizeHist(self.gray))
+        return self._gray_eq
+
+    def to_original(self, box):
+        """Map a working-size (x, y, w, h) box back to original pixels, clipped to the frame."""
+        x, y, w, h = (float(v) / self.scale for v in box)
+        oh, ow = self.original.shape[:2]
+        x0, y0 = max(0, int(round(x))), max(0, int(round(y)))
+        x1, y1 = min(ow, int(round(x + w))), min(oh, int(round(y + h)))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1 - x0, y1 - y0
+
+
+def _largest(boxes):
+    return max(boxes, key=lambda b: b[2] * b[3]) if len(boxes) else None
+
+
+class FaceTrack:
+    """
+    One kiosk session's face across consecutive frames.
+
+    ``box`` (original pixels) seeds the next ``embed(hint_box=...)``; ``update``
+    averages the last *window* embeddings as long as they stay within
+    *max_drift* of each other (same face), and drops the track after more than
+    *max_misses* frames without a face. Not shared between sessions.
+    """
+
+    def __init__(self, window=TRACK_WINDOW, max_misses=2, max_drift=TRACK_MAX_DRIFT):
+        self.max_misses = int(max_misses)
+        self.max_drift = float(max_drift)
+        self.box = None
+        self.misses = 0
+        self._embeddings = deque(maxlen=int(window))
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.tracked = 0  # frames where the ROI pass found the face
+        self.detector_calls = 0
+        self.lost = 0
+
+    def update(self, result):
+        """Fold in one FaceEngineResult; returns the averaged embedding or None."""
+        with self._lock:
+            self.frames += 1
+            self.detector_calls += result.detector_calls
+            if result.stage == "track":
+                self.tracked += 1
+            if result.box is None:
+                self.misses += 1
+                if self.misses > self.max_misses:
+                    self._reset()
+                return None
+            self.box = tuple(int(v) for v in result.box)
+            self.misses = 0
+            if result.embedding is None:
+                return None
+            emb = np.asarray(result.embedding, dtype=np.float64)
+            if self._embeddings and np.linalg.norm(emb - np.mean(self._embeddings, axis=0)) > self.max_drift:
+                # Different face (or a bad frame) in the same place: do not blend them.
+                self._embeddings.clear()
+                self.lost += 1
+            self._embeddings.append(emb)
+            return np.mean(self._embeddings, axis=0)
+
+    def _reset(self):
+        if self.box is not None:
+            self.lost += 1
+        self.box = None
+        self.misses = 0
+        self._embeddings.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "tracked": self.tracked,
+                "detector_calls": self.detector_calls,
+                "lost": self.lost,
+                "averaged": len(self._embeddings),
+            }
+
+
+def load_face_engine(model_dir, yunet_path=None, budget_ms=DEFAULT_BUDGET_MS, stats_path=None):
+    """
+    Load dlib (HOG, 68-point predictor, ResNet descriptor), both Haar cascades and
+    optionally YuNet from *model_dir*, and return a FaceEngine. Used by worker
+    processes that cannot share the app's already loaded models; *stats_path*
+    seeds the stage order from the app's learned statistics (read-only).
+    """
+    if dlib is None:
+        raise RuntimeError("dlib is not installed")
+    ordering = None
+    if stats_path:
+        from stage_order import AdaptiveStageOrder
+        ordering = AdaptiveStageOrder(path=stats_path, persist=False)
+    predictor = dlib.shape_predictor(os.path.join(model_dir, "shape_predictor_68_face_landmarks.dat"))
+    face_recognizer = dlib.face_recognition_model_v1(
+        os.path.join(model_dir, "dlib_face_recognition_resnet_model_v1.dat")
+    )
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    cascade_alt = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_alt2.xml")
+    yunet = None
+    if yunet_path and hasattr(cv2, "FaceDetectorYN") and os.path.isfile(yunet_path):
+        yunet = cv2.FaceDetectorYN.create(yunet_path, "", (320, 320))
+    return FaceEngine(
+        predictor, face_recognizer,
+        hog_detector=dlib.get_frontal_face_detector(),
+        cascade=cascade if not cascade.empty() else None,
+        cascade_alt=cascade_alt if not cascade_alt.empty() else None,
+        yunet=yunet, budget_ms=budget_ms, ordering=ordering,
+    )
+
+
+class FaceEngine:
+    """
+    Face detector + dlib descriptor with a per-frame time budget.
+
+    Models are passed in already loaded (the apps own model discovery). Missing
+    detectors simply drop their stages; *rectangle* defaults to
+    ``dlib.rectangle`` and exists so the pipeline can be exercised without dlib.
+    """
+
+    def __init__(self, predictor, face_recognizer, hog_detector=None, cascade=None,
+                 cascade_alt=None, yunet=None, budget_ms=DEFAULT_BUDGET_MS, rectangle=None,
+                 ordering=None):
+        self.predictor = predictor
+        self.face_recognizer = face_recognizer
+        self.hog_detector = hog_detector
+        self.cascade = cascade
+        self.cascade_alt = cascade_alt
+        self.yunet = yunet
+        self.budget_ms = float(budget_ms)
+        self._rectangle = rectangle or (dlib.rectangle if dlib is not None else None)
+        # FaceDetectorYN keeps the input size as state; Flask serves requests on threads.
+        self._yunet_lock = threading.Lock()
+        self.stages = self._default_stages()
+        self.ordering = ordering
+        self._recent_ms = deque(maxlen=200)  # time-to-embedding of recent successful frames
+
+    @property
+    def ready(self):
+        return bool(self.predictor and self.face_recognizer and self.stages)
+
+    # ── Stages ──────────────────────────────────────────────────────────────
+    # Each stage takes a _Frame and returns a face box (x, y, w, h) in working
+    # pixels, or None. Order = cheapest reliable detector first.
+
+    def _default_stages(self):
+        stages = []
+        if self.yunet is not None:
+            stages.append(("yunet", self._stage_yunet))
+        if self.cascade is not None:
+            stages.append(("haar", self._stage_haar))
+        if self.hog_detector is not None:
+            stages.append(("hog", self._stage_hog))
+        if self.cascade_alt is not None or self.cascade is not None:
+            stages.append(("haar_eq", self._stage_haar_eq))
+        if self.hog_detector is not None:
+            stages.append(("hog_up1", self._stage_hog_up1))
+        return stages
+
+    def _stage_yunet(self, frame):
+        with self._yunet_lock:
+            self.yunet.setInputSize(frame.size)
+            _, dets = self.yunet.detect(frame.bgr)
+        if dets is None or len(dets) == 0:
+            return None
+        best = max(dets, key=lambda d: float(d[14]) if len(d) > 14 else 0.0)
+        x, y, w, h = (float(v) for v in best[:4])
+        return (x, y, w, h) if w > 0 and h > 0 else None
+
+    def _stage_haar(self, frame):
+        rects = self.cascade.detectMultiScale(frame.gray, scaleFactor=1.15, minNeighbors=3, minSize=(30, 30))
+        return _largest(rects)
+
+    def _stage_haar_eq(self, frame):
+        cascade = self.cascade_alt if self.cascade_alt is not None else self.cascade
+        rects = cascade.detectMultiScale(frame.gray_eq, scaleFactor=1.05, minNeighbors=2, minSize=(20, 20))
+        return _largest(rects)
+
+    def _hog(self, img, upsample):
+        faces = self.hog_detector(img, upsample)
+        if len(faces) == 0:
+            return None
+        boxes = [(f.left(), f.top(), f.right() - f.left(), f.bottom() - f.top()) for f in faces]
+        return _largest(boxes)
+
+    def _stage_hog(self, frame):
+        return self._hog(frame.gray, 0)
+
+    def _stage_hog_up1(self, frame):
+        return self._hog(frame.gray_eq, 1)
+
+    def _stage_track(self, frame, hint_box):
+        """One detector pass on a padded ROI around *hint_box* (original pixels)."""
+        x, y, w, h = (float(v) * frame.scale for v in hint_box)
+        fw, fh = frame.size
+        x0, y0 = max(0, int(x - w * TRACK_ROI_PAD)), max(0, int(y - h * TRACK_ROI_PAD))
+        x1 = min(fw, int(x + w * (1 + TRACK_ROI_PAD)))
+        y1 = min(fh, int(y + h * (1 + TRACK_ROI_PAD)))
+        if x1 - x0 < 24 or y1 - y0 < 24:
+            return None
+        box = None
+        if self.yunet is not None:
+            roi = np.ascontiguousarray(frame.bgr[y0:y1, x0:x1])
+            with self._yunet_lock:
+                self.yunet.setInputSize((x1 - x0, y1 - y0))
+                _, dets = self.yunet.detect(roi)
+            if dets is not None and len(dets):
+                best = max(dets, key=lambda d: float(d[14]) if len(d) > 14 else 0.0)
+                box = tuple(float(v) for v in best[:4])
+        elif self.cascade is not None:
+            min_side = max(20, int(min(w, h) * 0.5))
+            rects = self.cascade.detectMultiScale(
+                np.ascontiguousarray(frame.gray[y0:y1, x0:x1]), scaleFactor=1.1, minNeighbors=3,
+                minSize=(min_side, min_side),
+            )
+            box = _largest(rects)
+        elif self.hog_detector is not None:
+            box = self._hog(np.ascontiguousarray(frame.gray[y0:y1, x0:x1]), 0)
+        if box is None or box[2] <= 0 or box[3] <= 0:
+            return None
+        # A box of a very different size is not the tracked face: let the full search decide.
+        if not 0.25 <= (box[2] * box[3]) / (w * h) <= 4.0:
+            return None
+        return float(box[0]) + x0, float(box[1]) + y0, float(box[2]), float(box[3])
+
+    # ── Detection-only check ────────────────────────────────────────────────
+
+    def quick_check(self, cv2_img, max_side=QUICK_CHECK_SIDE):
+        """
+        One detector pass (YuNet, else one Haar pass) on a frame downscaled to
+        *max_side*; no landmarks, no descriptor. For live "is my face OK?" polling.
+        """
+        check = FaceCheck()
+        if cv2_img is None or cv2_img.size == 0:
+            return check
+        started = perf_counter()
+        h, w = cv2_img.shape[:2]
+        scale = min(1.0, float(max_side) / max(h, w))
+        small = cv2_img if scale == 1.0 else cv2.resize(
+            cv2_img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA
+        )
+        small = np.ascontiguousarray(small.astype(np.uint8))
+        sh, sw = small.shape[:2]
+        boxes, scores = [], []
+        if self.yunet is not None:
+            check.detector = "yunet"
+            with self._yunet_lock:
+                self.yunet.setInputSize((sw, sh))
+                _, dets = self.yunet.detect(small)
+            for d in (dets if dets is not None else []):
+                if d[2] > 0 and d[3] > 0:
+                    boxes.append(tuple(float(v) for v in d[:4]))
+                    scores.append(float(d[14]) if len(d) > 14 else None)
+        elif self.cascade is not None:
+            check.detector = "haar"
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            rects = self.cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=4, minSize=(24, 24))
+            boxes = [tuple(float(v) for v in r) for r in rects]
+            scores = [None] * len(boxes)
+        if boxes:
+            i = max(range(len(boxes)), key=lambda j: boxes[j][2] * boxes[j][3])
+            bx, by, bw, bh = boxes[i]
+            check.face_detected = True
+            check.faces = len(boxes)
+            check.score = scores[i]
+            check.quality, check.hint = _positioning(boxes[i], sw, sh, scores[i], len(boxes))
+            check.box = tuple(int(round(v / scale)) for v in (bx, by, bw, bh))
+        check.elapsed_ms = (perf_counter() - started) * 1000.0
+        return check
+
+    # ── Pipeline ────────────────────────────────────────────────────────────
+
+    def detect(self, cv2_img, budget_ms=None, hint_box=None):
+        """Find one face box without computing a descriptor."""
+        return self._run_stages(cv2_img, budget_ms, hint_box)[0]
+
+    def _run_stages(self, cv2_img, budget_ms, hint_box=None):
+        """Stages in order until one finds a face; fallbacks only while the budget lasts."""
+        result = FaceEngineResult()
+        if cv2_img is None or cv2_img.size == 0 or not self.stages:
+            return result, None
+        budget = self.budget_ms if budget_ms is None else float(budget_ms)
+        started = perf_counter()
+        frame = _Frame(cv2_img)
+        if hint_box is not None:
+            # Not fed to the stage ordering: "track" is not one of the interchangeable stages.
+            t0 = perf_counter()
+            box = self._stage_track(frame, hint_box)
+            result.timings.append({"stage": "track", "ms": (perf_counter() - t0) * 1000.0, "found": box is not None})
+            if box is not None:
+                result.box = frame.to_original(box)
+                if result.box is not None:
+                    result.stage = "track"
+                    result.elapsed_ms = (perf_counter() - started) * 1000.0
+                    return result, frame
+        stages = self.ordering.order(self.stages) if self.ordering is not None else self.stages
+        for i, (name, stage) in enumerate(stages):
+            elapsed = (perf_counter() - started) * 1000.0
+            if i > 0 and elapsed >= budget:
+                result.budget_exhausted = True
+                break
+            t0 = perf_counter()
+            box = stage(frame)
+            ms = (perf_counter() - t0) * 1000.0
+            result.timings.append({"stage": name, "ms": ms, "found": box is not None})
+            if self.ordering is not None:
+                self.ordering.record(name, ms, box is not None)
+            if box is not None:
+                result.box = frame.to_original(box)
+                if result.box is not None:
+                    result.stage = name
+                    break
+        result.elapsed_ms = (perf_counter() - started) * 1000.0
+        return result, frame
+
+    def embed(self, cv2_img, budget_ms=None, source=None, hint_box=None):
+        """
+        Detect once, then one shape prediction + ``compute_face_descriptor`` on the original frame.
+
+        *source* (a frame_upload.JpegSource) marks *cv2_img* as a reduced-resolution
+        decode; faces smaller than FULL_RES_FACE_SIDE are then described from a
+        crop decoded from it at the coarsest scale that gives them that size. *hint_box* is the previous frame's
+        face box from a FaceTrack.
+        """
+        result, frame = self._run_stages(cv2_img, budget_ms, hint_box)
+        if result.box is None or not self.predictor or not self.face_recognizer:
+            return result
+        t0 = perf_counter()
+        x, y, w, h = result.box
+        image = frame.original
+        if source is not None and source.factor > 1 and min(w, h) < FULL_RES_FACE_SIDE:
+            cropped = source.crop(result.box, min_side=FULL_RES_FACE_SIDE)
+            if cropped is not None:
+                image, ox, oy, scale = cropped
+                f = source.factor / scale
+                x, y, w, h = x * f - ox, y * f - oy, w * f, h * f
+        rgb = np.ascontiguousarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        shape = self.predictor(rgb, self._rectangle(int(x), int(y), int(x + w), int(y + h)))
+        result.embedding = np.array(self.face_recognizer.compute_face_descriptor(rgb, shape))
+        ms = (perf_counter() - t0) * 1000.0
+        result.timings.append({"stage": "embed", "ms": ms, "found": True})
+        result.elapsed_ms += ms
+        self._recent_ms.append(result.elapsed_ms)
+        return result
+
+    def stats(self):
+        """Current stage order, median time-to-embedding and (if adaptive) per-stage statistics."""
+        recent = sorted(self._recent_ms)
+        stages = self.ordering.order(self.stages) if self.ordering is not None else self.stages
+        out = {
+            "stage_order": [name for name, _ in stages],
+            "budget_ms": self.budget_ms,
+            "median_ms_to_embedding": round(recent[len(recent) // 2], 2) if recent else None,
+            "embeddings_sampled": len(recent),
+        }
+        if self.ordering is not None:
+            out["stages"] = self.ordering.snapshot()
+        return out
@@ -0,0 +1,349 @@
+"""
+Resident face-embedding index and matching API shared by gate and registration.
+=============================================
+Keeps every stored 128-D dlib embedding in one contiguous float32 matrix with
+parallel arrays for visitor_id, name and blacklisted flag, so a live face is
+matched with a single vectorised distance computation instead of re-parsing
+every ``basic_info.embedding`` string on each request.
+
+The index is built once and then kept current incrementally: ``upsert`` and
+``remove`` touch a single row, and ``sync`` only re-parses visitors whose
+embedding, name or blacklist flag actually changed.
+"""
+
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from embedding_codec import EMBEDDING_DIM, decode_embedding
+
+_INITIAL_CAPACITY = 256
+
+
+def parse_embedding(raw):
+    """Decode a stored embedding (tagged float32 or legacy text) into a float32 vector, or None."""
+    return decode_embedding(raw, dim=EMBEDDING_DIM)
+
+
+def is_blacklisted_record(basic_info, visitor_root=None):
+    """Same rule as the apps: basic_info.blacklisted, falling back to the visitor root."""
+    raw = (basic_info or {}).get("blacklisted")
+    if raw is None and isinstance(visitor_root, dict):
+        raw = visitor_root.get("blacklisted", "no")
+    return str(raw).strip().lower() in ("yes", "true", "1")
+
+
+def _record_signature(visitor_data):
+    """Cheap change-detection key for one visitor record (no float parsing)."""
+    if not isinstance(visitor_data, dict):
+        return None
+    basic = visitor_data.get("basic_info") or {}
+    if not isinstance(basic, dict):
+        return None
+    emb = basic.get("embedding")
+    if not emb:
+        return None
+    return (
+        emb if isinstance(emb, str) else repr(emb),
+        basic.get("name", "Unknown"),
+        is_blacklisted_record(basic, visitor_data),
+    )
+
+
+class FaceMatchResult(list):
+    """
+    Matches within threshold (closest first), plus statistics from the same scan.
+
+    It is a list, so code that only iterates matches keeps working. Extra attributes:
+      candidates        top-k nearest regardless of threshold (closest first)
+      best_distance     global nearest distance (999.0 when nothing was scanned)
+      twin_gap          distance gap between the two nearest candidates
+      best_blacklisted  nearest blacklisted candidate, or None
+      scanned           number of stored embeddings compared
+      elapsed_ms        wall time of the scan
+    """
+
+    def __init__(self, matches=(), candidates=(), best_blacklisted=None, scanned=0, elapsed_ms=0.0):
+        super().__init__(matches)
+        self.candidates = list(candidates)
+        self.best_blacklisted = best_blacklisted
+        self.scanned = scanned
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def best(self):
+        return self.candidates[0] if self.candidates else None
+
+    @property
+    def runner_up(self):
+        return self.candidates[1] if len(self.candidates) > 1 else None
+
+    @property
+    def best_distance(self):
+        return self.candidates[0]["distance"] if self.candidates else 999.0
+
+    @property
+    def twin_gap(self):
+        """Distance gap between the two nearest candidates (inf if fewer than two)."""
+        if len(self.candidates) < 2:
+            return float("inf")
+        return abs(self.candidates[1]["distance"] - self.candidates[0]["distance"])
+
+
+class FaceIndex:
+    """
+    Contiguous (N, 128) float32 embedding matrix with row-parallel metadata.
+
+    Rows are packed: removing a visitor moves the last row into the hole, so
+    the live region is always ``[0, len(self))``. All public methods are
+    thread-safe.
+    """
+
+    def __init__(self, capacity=_INITIAL_CAPACITY):
+        capacity = max(int(capacity), 1)
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self._blacklisted = np.zeros(capacity, dtype=bool)
+        self._ids = []
+        self._names = []
+        self._rows = {}
+        self._signatures = {}
+        self.version = 0
+
+    @classmethod
+    def from_visitors(cls, all_visitors):
+        """Build an index from a ``visitors`` tree ({visitor_id: record})."""
+        index = cls(capacity=max(len(all_visitors or {}), _INITIAL_CAPACITY))
+        index.sync(all_visitors or {})
+        return index
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, visitor_id):
+        return visitor_id in self._rows
+
+    # ── Incremental maintenance ──────────────────
+
+    def _grow(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        matrix = np.zeros((new_capacity, EMBEDDING_DIM), dtype=np.float32)
+        sq_norms = np.zeros(new_capacity, dtype=np.float32)
+        blacklisted = np.zeros(new_capacity, dtype=bool)
+        n = len(self._ids)
+        matrix[:n] = self._matrix[:n]
+        sq_norms[:n] = self._sq_norms[:n]
+        blacklisted[:n] = self._blacklisted[:n]
+        self._matrix, self._sq_norms, self._blacklisted = matrix, sq_norms, blacklisted
+
+    def upsert(self, visitor_id, visitor_data):
+        """
+        Insert or replace one visitor from its full record.
+
+        Records without a usable embedding are removed from the index.
+        Returns True if the index changed.
+        """
+        visitor_id = str(visitor_id)
+        signature = _record_signature(visitor_data)
+        with self._lock:
+            if signature is None:
+                return self.remove(visitor_id)
+            if self._signatures.get(visitor_id) == signature:
+                return False
+            vec = parse_embedding((visitor_data.get("basic_info") or {}).get("embedding"))
+            if vec is None:
+                return self.remove(visitor_id)
+            row = self._rows.get(visitor_id)
+            if row is None:
+                row = len(self._ids)
+                self._grow(row + 1)
+                self._ids.append(visitor_id)
+                self._names.append(signature[1])
+                self._rows[visitor_id] = row
+            else:
+                self._names[row] = signature[1]
+            self._matrix[row] = vec
+            self._sq_norms[row] = float(np.dot(vec, vec))
+            self._blacklisted[row] = signature[2]
+            self._signatures[visitor_id] = signature
+            self.version += 1
+            return True
+
+    def remove(self, visitor_id):
+        """Drop one visitor. Returns True if it was present."""
+        visitor_id = str(visitor_id)
+        with self._lock:
+            row = self._rows.pop(visitor_id, None)
+            self._signatures.pop(visitor_id, None)
+            if row is None:
+                return False
+            last = len(self._ids) - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._blacklisted[row] = self._blacklisted[last]
+                self._ids[row] = moved_id
+                self._names[row] = self._names[last]
+                self._rows[moved_id] = row
+            self._ids.pop()
+            self._names.pop()
+            self.version += 1
+            return True
+
+    def sync(self, all_visitors):
+        """
+        Reconcile the index with a full ``visitors`` tree.
+
+        Only records whose signature changed are re-parsed. Returns the number
+        of rows inserted, replaced or removed.
+        """
+        all_visitors = all_visitors or {}
+        changed = 0
+        with self._lock:
+            for vid in [v for v in self._rows if v not in all_visitors]:
+                changed += int(self.remove(vid))
+            for vid, vdata in all_visitors.items():
+                changed += int(self.upsert(vid, vdata))
+        return changed
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+            self._rows.clear()
+            self._signatures.clear()
+            self.version += 1
+
+    # ── Matching ─────────────────────────────────
+
+    def search(self, live_embedding, k=None, threshold=None):
+        """
+        Nearest stored embeddings to *live_embedding* in one vectorised pass.
+
+        Returns a list sorted closest first:
+            [{"visitor_id", "distance", "name", "blacklisted"}, …]
+        limited to ``distance <= threshold`` (when given) and to *k* entries
+        (when given).
+        """
+        q = np.asarray(live_embedding, dtype=np.float32).flatten()
+        if q.size != EMBEDDING_DIM:
+            return []
+        with self._lock:
+            n = len(self._ids)
+            if n == 0:
+                return []
+            rows = self._candidate_rows(q, n)
+            d2 = self._sq_dists(q, rows)
+            if rows is None:
+                rows = np.arange(n)
+            if threshold is not None:
+                # Small slack so float32 rounding never drops a borderline row;
+                # the exact re-rank below applies the real threshold.
+                keep = np.flatnonzero(d2 <= (float(threshold) + 1e-3) ** 2)
+                rows, d2 = rows[keep], d2[keep]
+            if k is not None and rows.size > k:
+                rows = rows[np.argpartition(d2, k - 1)[:k]]
+            if rows.size == 0:
+                return []
+            ranked = self._rerank(q, rows)
+        if threshold is None:
+            return ranked
+        return [m for m in ranked if m["distance"] <= threshold]
+
+    def match(self, live_embedding, threshold=None, k=5):
+        """
+        Single-pass match: everything a caller needs to accept, deny or flag a twin.
+
+        Returns a ``FaceMatchResult`` holding the matches within *threshold*
+        (at most *k*), the unfiltered top-*k* candidates, the global best
+        distance, the nearest blacklisted candidate and scan statistics.
+        """
+        started = perf_counter()
+        q = np.asarray(live_embedding, dtype=np.float32).flatten()
+        if q.size != EMBEDDING_DIM:
+            return FaceMatchResult()
+        with self._lock:
+            n = len(self._ids)
+            if n == 0:
+                return FaceMatchResult(elapsed_ms=(perf_counter() - started) * 1000.0)
+            rows = self._candidate_rows(q, n)
+            d2 = self._sq_dists(q, rows)
+            if rows is None:
+                rows = np.arange(n)
+            if k is not None and rows.size > k:
+                kk = max(int(k), 1)
+                shortlist = rows[np.argpartition(d2, kk - 1)[:kk]]
+            else:
+                shortlist = rows
+            candidates = self._rerank(q, shortlist) if shortlist.size else []
+            # Blacklisted rows are always scored in full (small set), even when an
+            # approximate subclass narrows the candidate rows.
+            best_blacklisted = None
+            bl_rows = np.flatnonzero(self._blacklisted[:n])
+            if bl_rows.size:
+                nearest_bl = bl_rows[int(np.argmin(self._sq_dists(q, bl_rows)))]
+                best_blacklisted = self._rerank(q, np.array([nearest_bl]))[0]
+        matches = [c for c in candidates if threshold is None or c["distance"] <= threshold]
+        return FaceMatchResult(
+            matches, candidates, best_blacklisted,
+            scanned=int(rows.size), elapsed_ms=(perf_counter() - started) * 1000.0,
+        )
+
+    def _candidate_rows(self, q, n):
+        """Rows worth scoring for query *q*; None means all rows (this exact index)."""
+        return None
+
+    def _sq_dists(self, q, rows=None):
+        """Squared L2 distances from *q* to *rows* (None = all) via ||m||² - 2 m·q + ||q||²."""
+        if rows is None:
+            n = len(self._ids)
+            matrix, sq_norms = self._matrix[:n], self._sq_norms[:n]
+        else:
+            matrix, sq_norms = self._matrix[rows], self._sq_norms[rows]
+        d2 = sq_norms - 2.0 * (matrix @ q) + float(np.dot(q, q))
+        np.maximum(d2, 0.0, out=d2)
+        return d2
+
+    def _rerank(self, q, rows):
+        """Exact float64 distances for *rows*, sorted closest first (caller holds the lock)."""
+        # Float64 keeps threshold decisions identical to the old per-visitor np.linalg.norm loop.
+        diff = self._matrix[rows].astype(np.float64) - q.astype(np.float64)
+        exact = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        ranked = []
+        for pos in np.argsort(exact, kind="stable"):
+            row = int(rows[pos])
+            ranked.append({
+                "visitor_id": self._ids[row],
+                "distance": float(exact[pos]),
+                "name": self._names[row],
+                "blacklisted": bool(self._blacklisted[row]),
+            })
+        return ranked
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._ids),
+                "capacity": int(self._matrix.shape[0]),
+                "blacklisted": int(self._blacklisted[: len(self._ids)].sum()),
+                "version": self.version,
+                "matrix_bytes": int(self._matrix.nbytes),
+            }
+
+
+def match_faces(live_embedding, visitors, threshold=None, k=5):
+    """
+    Shared matching entry point for gate and registration.
+
+    *visitors* is a resident ``FaceIndex`` (or anything with the same
+    ``match()``, e.g. the gate's tiered matcher) or a raw ``visitors`` tree,
+    indexed on the fly. Returns a ``FaceMatchResult``.
+    """
+    index = visitors if hasattr(visitors, "match") else FaceIndex.from_visitors(visitors or {})
+    return index.match(live_embedding, threshold=threshold, k=k)
@@ -0,0 +1,180 @@
+"""
+Process pool for face embedding (detector + dlib descriptor off the request threads).
+=============================================
+dlib's shape predictor and ``compute_face_descriptor`` are CPU-bound and hold
+the GIL, so inline calls from Flask request threads serialise every kiosk on
+one core. ``FaceWorkerPool`` runs N worker processes that each load the dlib,
+YuNet and Haar models once (``engine_factory`` in the pool initializer) and
+then embed frames handed over through ``multiprocessing.shared_memory`` - only
+the block name and shape are pickled, never the pixels.
+
+Backpressure: at most ``max_pending`` frames may be queued or in flight.
+``embed`` waits up to ``submit_timeout`` seconds for a slot and then raises
+``FaceWorkerPoolBusy`` so callers can shed load instead of piling up threads.
+``stats()`` reports queue depth, in-flight count, rejections and latency.
+"""
+
+import logging
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from time import perf_counter
+
+import numpy as np
+
+from face_engine import FaceEngineResult
+
+logger = logging.getLogger(__name__)
+
+_ENGINE = None  # per worker process
+
+
+class FaceWorkerPoolBusy(RuntimeError):
+    """Raised when the pool already holds ``max_pending`` frames."""
+
+
+def _attach(name):
+    # Workers only borrow the block; the submitting process owns and unlinks it.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _init_worker(engine_factory, factory_kwargs):
+    global _ENGINE
+    _ENGINE = engine_factory(**(factory_kwargs or {}))
+
+
+def _embed_in_worker(shm_name, shape, options=None):
+    shm = _attach(shm_name)
+    try:
+        view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        frame = view.copy()
+        del view
+    finally:
+        shm.close()
+    result = _ENGINE.embed(frame, **(options or {}))
+    embedding = None if result.embedding is None else np.asarray(result.embedding, dtype=np.float64)
+    return embedding, result.timings, result.elapsed_ms, getattr(result, "box", None), getattr(result, "stage", None)
+
+
+class FaceWorkerPool:
+    """
+    Bounded pool of embedding worker processes.
+
+    *engine_factory(**factory_kwargs)* must be a picklable module-level callable
+    returning an object with FaceEngine's ``embed`` contract. Stage timings
+    returned by workers are folded into *ordering* (an AdaptiveStageOrder) in
+    this process, so the learned order keeps being persisted in one place.
+    """
+
+    def __init__(self, workers, engine_factory, factory_kwargs=None, max_pending=None,
+                 submit_timeout=2.0, result_timeout=15.0, ordering=None):
+        self.workers = max(1, int(workers))
+        self.max_pending = int(max_pending) if max_pending else 2 * self.workers
+        self.submit_timeout = float(submit_timeout)
+        self.result_timeout = float(result_timeout)
+        self.ordering = ordering
+        self._engine_factory = engine_factory
+        self._factory_kwargs = dict(factory_kwargs or {})
+        self._executor = None
+        self._start_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {"submitted": 0, "completed": 0, "rejected": 0, "errors": 0}
+        self._total_ms = 0.0
+
+    def start(self):
+        with self._start_lock:
+            if self._executor is None:
+                # spawn: never fork a threaded Flask process holding dlib/OpenCV state.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self._engine_factory, self._factory_kwargs),
+                )
+        return self
+
+    def shutdown(self, wait=True):
+        with self._start_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def embed(self, cv2_img, source=None):
+        """Embedding (np.ndarray) or None if no face; raises FaceWorkerPoolBusy when saturated."""
+        return self.embed_result(cv2_img, source=source).embedding
+
+    def embed_result(self, cv2_img, source=None, hint_box=None):
+        """
+        FaceEngineResult (embedding, box, stage, timings) computed in a worker;
+        raises FaceWorkerPoolBusy when saturated.
+
+        *source* (a JpegSource for reduced-resolution decodes) is pickled as-is:
+        it holds the compressed JPEG, not pixels. *hint_box* comes from a FaceTrack.
+        """
+        result = FaceEngineResult()
+        if cv2_img is None or cv2_img.size == 0:
+            return result
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise FaceWorkerPoolBusy(f"face worker queue full ({self.max_pending} frames pending)")
+        started = perf_counter()
+        with self._lock:
+            self._in_flight += 1
+            self._counters["submitted"] += 1
+        frame = np.ascontiguousarray(cv2_img, dtype=np.uint8)
+        shm = None
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, frame.nbytes))
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)[...] = frame
+            options = {k: v for k, v in (("source", source), ("hint_box", hint_box)) if v is not None}
+            future = self.start()._executor.submit(_embed_in_worker, shm.name, frame.shape, options)
+            embedding, timings, elapsed_ms, box, stage = future.result(timeout=self.result_timeout)
+        except Exception:
+            with self._lock:
+                self._counters["errors"] += 1
+            raise
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+        with self._lock:
+            self._counters["completed"] += 1
+            self._total_ms += (perf_counter() - started) * 1000.0
+        if self.ordering is not None:
+            for t in timings:
+                if t["stage"] not in ("embed", "track"):
+                    self.ordering.record(t["stage"], t["ms"], t["found"])
+        result.embedding, result.timings, result.elapsed_ms = embedding, timings, elapsed_ms
+        result.box, result.stage = box, stage
+        return result
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._counters)
+            in_flight = self._in_flight
+            completed = out["completed"]
+            out["mean_ms"] = round(self._total_ms / completed, 2) if completed else None
+        out.update({
+            "workers": self.workers,
+            "started": self._executor is not None,
+            "in_flight": in_flight,
+            "queue_depth": max(0, in_flight - self.workers),
+            "max_pending": self.max_pending,
+        })
+        return out
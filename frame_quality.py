@@ -0,0 +1,168 @@
+"""
+Cheap frame quality gate run before face detection.
+=============================================
+Dark, blurred, shaking and empty frames used to go through the whole detector
+pipeline before the gate could answer "No face detected". ``FrameQualityGate``
+rejects them in a few milliseconds on a 160 px grayscale thumbnail:
+
+  too_dark / too_bright   mean brightness outside [min_brightness, max_brightness]
+  low_contrast            grayscale standard deviation below min_contrast
+  blurry                  variance of the Laplacian below min_sharpness
+  motion                  mean absolute difference against the same kiosk's
+                          previous frame above max_motion ("hold still")
+  unchanged               opt-in (recheck_every > 1): scene identical to the
+                          previous frame, which had no face (idle kiosk polling
+                          an empty doorway); every ``recheck_every``-th such
+                          frame still goes to the detector. Off by default: a
+                          visitor standing still in a frame the detector missed
+                          would otherwise wait recheck_every frames for a retry.
+
+Every rejection carries a user-facing hint, and ``stats()`` exports counts per
+reason. Thresholds come from FRAME_QUALITY_* environment variables via
+``from_env``.
+"""
+
+import threading
+from collections import OrderedDict
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+THUMB_WIDTH = 160
+MOTION_SIZE = (64, 48)
+
+HINTS = {
+    "too_dark": "It is too dark. Please step into better light.",
+    "too_bright": "Too much light behind you. Please turn away from the window or bright light.",
+    "low_contrast": "The image is washed out. Please check the camera and lighting.",
+    "blurry": "The image is blurry. Please hold still and face the camera.",
+    "motion": "Please hold still for a moment.",
+    "unchanged": "Checking again in a moment.",
+}
+
+
+class FrameVerdict:
+    __slots__ = ("ok", "reason", "hint", "metrics", "elapsed_ms")
+
+    def __init__(self, ok=True, reason=None, metrics=None, elapsed_ms=0.0):
+        self.ok = ok
+        self.reason = reason
+        self.hint = HINTS.get(reason)
+        self.metrics = metrics or {}
+        self.elapsed_ms = elapsed_ms
+
+
+class FrameQualityGate:
+    """Per-kiosk frame screening; thread-safe."""
+
+    def __init__(self, min_brightness=40.0, max_brightness=225.0, min_contrast=12.0,
+                 min_sharpness=15.0, max_motion=40.0, unchanged_delta=1.5, recheck_every=1,
+                 max_kiosks=256):
+        self.min_brightness = float(min_brightness)
+        self.max_brightness = float(max_brightness)
+        self.min_contrast = float(min_contrast)
+        self.min_sharpness = float(min_sharpness)
+        self.max_motion = float(max_motion)
+        self.unchanged_delta = float(unchanged_delta)
+        self.recheck_every = int(recheck_every)
+        self.max_kiosks = int(max_kiosks)
+        self._lock = threading.Lock()
+        self._kiosks = OrderedDict()  # kiosk_id -> {"thumb", "face": bool|None, "unchanged": int}
+        self._checked = 0
+        self._passed = 0
+        self._rejected = {reason: 0 for reason in HINTS}
+
+    @classmethod
+    def from_env(cls, environ):
+        def num(name, default):
+            try:
+                return float(environ.get(name, default))
+            except (TypeError, ValueError):
+                return float(default)
+
+        return cls(
+            min_brightness=num("FRAME_QUALITY_MIN_BRIGHTNESS", 40),
+            max_brightness=num("FRAME_QUALITY_MAX_BRIGHTNESS", 225),
+            min_contrast=num("FRAME_QUALITY_MIN_CONTRAST", 12),
+            min_sharpness=num("FRAME_QUALITY_MIN_SHARPNESS", 15),
+            max_motion=num("FRAME_QUALITY_MAX_MOTION", 40),
+            recheck_every=num("FRAME_QUALITY_RECHECK_EVERY", 1),
+        )
+
+    def assess(self, cv2_img, kiosk_id=None):
+        """FrameVerdict for one BGR frame; also remembers it as *kiosk_id*'s previous frame."""
+        started = perf_counter()
+        h, w = cv2_img.shape[:2]
+        scale = min(1.0, THUMB_WIDTH / float(w))
+        small = cv2.resize(cv2_img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        mean, std = cv2.meanStdDev(gray)
+        brightness, contrast = float(mean[0][0]), float(std[0][0])
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        thumb = cv2.resize(gray, MOTION_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+        metrics = {
+            "brightness": round(brightness, 1),
+            "contrast": round(contrast, 1),
+            "sharpness": round(sharpness, 1),
+        }
+
+        with self._lock:
+            prev = self._kiosks.pop(kiosk_id, None) if kiosk_id is not None else None
+            if kiosk_id is not None:
+                self._kiosks[kiosk_id] = {"thumb": thumb, "face": None, "unchanged": 0}
+                while len(self._kiosks) > self.max_kiosks:
+                    self._kiosks.popitem(last=False)
+
+        motion = None
+        if prev is not None and prev["thumb"].shape == thumb.shape:
+            motion = float(np.abs(thumb - prev["thumb"]).mean())
+            metrics["motion"] = round(motion, 2)
+
+        if brightness < self.min_brightness:
+            reason = "too_dark"
+        elif brightness > self.max_brightness:
+            reason = "too_bright"
+        elif contrast < self.min_contrast:
+            reason = "low_contrast"
+        elif sharpness < self.min_sharpness:
+            reason = "blurry"
+        elif motion is not None and motion > self.max_motion:
+            reason = "motion"
+        elif (motion is not None and motion < self.unchanged_delta and prev["face"] is False
+              and prev["unchanged"] + 1 < self.recheck_every):
+            reason = "unchanged"
+        else:
+            reason = None
+
+        with self._lock:
+            self._checked += 1
+            if reason is None:
+                self._passed += 1
+            else:
+                self._rejected[reason] += 1
+                if kiosk_id is not None and kiosk_id in self._kiosks and prev is not None:
+                    # Keep the last detector outcome across rejected frames.
+                    state = self._kiosks[kiosk_id]
+                    state["face"] = prev["face"]
+                    state["unchanged"] = prev["unchanged"] + 1 if reason == "unchanged" else 0
+        return FrameVerdict(ok=reason is None, reason=reason, metrics=metrics,
+                            elapsed_ms=(perf_counter() - started) * 1000.0)
+
+    def record_outcome(self, kiosk_id, face_found):
+        """Tell the gate whether the detector found a face in *kiosk_id*'s last frame."""
+        if kiosk_id is None:
+            return
+        with self._lock:
+            state = self._kiosks.get(kiosk_id)
+            if state is not None:
+                state["face"] = bool(face_found)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checked": self._checked,
+                "passed": self._passed,
+                "rejected": dict(self._rejected),
+                "kiosks": len(self._kiosks),
+            }
@@ -0,0 +1,195 @@
+"""
+Frame uploads for the face endpoints: JSON data URL, multipart or raw JPEG.
+=============================================
+Kiosk pages used to post every webcam frame as a base64 data URL inside JSON,
+which is ~33% larger on the wire and is copied several times (JSON parse, split,
+b64decode) before ``cv2.imdecode`` sees it. The endpoints now also accept:
+
+  multipart/form-data   the frame as a file part (``canvas.toBlob`` + FormData),
+                        other parameters as ordinary form fields
+  image/jpeg (raw body) the frame is the whole request body, other parameters
+                        in the query string
+
+and decode straight from the uploaded bytes with ``np.frombuffer``. JSON bodies
+with a data URL keep working for older kiosks and scripts.
+
+Large webcam JPEGs are decoded at reduced resolution: ``decode_frame_reduced``
+reads the width and height from the JPEG header and picks
+``cv2.IMREAD_REDUCED_COLOR_2/4/8`` so the frame lands just above the detector's
+working size (a 1080p frame decodes at 960x540 instead of being decoded at full
+size and then resized). The encoded bytes travel along as a ``JpegSource`` so
+FaceEngine.embed can decode a full-resolution crop around a small face when the
+descriptor needs the extra pixels. benchmarks/frame_decode_benchmark.py compares
+latency and memory per frame size.
+"""
+
+import base64
+import binascii
+import math
+
+import cv2
+import numpy as np
+
+RAW_CONTENT_TYPES = ("image/jpeg", "image/jpg", "image/png", "image/webp", "application/octet-stream")
+
+# Start-of-frame markers carrying the image size (baseline, progressive, lossless, arithmetic).
+_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+_REDUCED_FLAGS = {
+    2: getattr(cv2, "IMREAD_REDUCED_COLOR_2", None),
+    4: getattr(cv2, "IMREAD_REDUCED_COLOR_4", None),
+    8: getattr(cv2, "IMREAD_REDUCED_COLOR_8", None),
+}
+
+
+class FrameUploadError(ValueError):
+    """Malformed frame upload; ``kind`` is "payload" (bad data URL / empty part)."""
+
+    def __init__(self, message, kind="payload"):
+        super().__init__(message)
+        self.kind = kind
+
+
+def read_frame_upload(req, field="image", json_field=None):
+    """
+    Split a Flask request into (fields, frame_bytes).
+
+    *fields* is a plain dict of the non-image parameters; *frame_bytes* is the
+    encoded image, or None when the request carries no frame at all. *field* is
+    the multipart file part name, *json_field* the JSON key holding the data URL
+    (defaults to *field*). Raises FrameUploadError for a frame that is present
+    but unreadable.
+    """
+    mimetype = (req.mimetype or "").lower()
+    if mimetype in RAW_CONTENT_TYPES:
+        fields = req.args.to_dict()
+        body = req.get_data(cache=False)
+        return fields, (body or None)
+
+    if mimetype == "multipart/form-data":
+        fields = req.args.to_dict()
+        fields.update(req.form.to_dict())
+        part = req.files.get(field)
+        if part is None:
+            return fields, None
+        body = part.read()
+        if not body:
+            raise FrameUploadError(f"Empty {field} upload")
+        return fields, body
+
+    data = req.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {}, None
+    key = json_field or field
+    fields = {k: v for k, v in data.items() if k != key}
+    data_url = data.get(key)
+    if not data_url:
+        return fields, None
+    try:
+        return fields, base64.b64decode(str(data_url).split(",")[1])
+    except (IndexError, binascii.Error) as e:
+        raise FrameUploadError(f"Invalid {key} data URL") from e
+
+
+def decode_frame(frame_bytes):
+    """BGR image decoded in place from *frame_bytes*, or None if it is not an image."""
+    if not frame_bytes:
+        return None
+    return cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+# ── Reduced-resolution decode ───────────────────────────────────────────────
+
+def jpeg_size(frame_bytes):
+    """(width, height) from the JPEG header without decoding, or None if not a JPEG."""
+    data = memoryview(frame_bytes)
+    n = len(data)
+    if n < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # markers without a length
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            h = (data[i + 5] << 8) | data[i + 6]
+            w = (data[i + 7] << 8) | data[i + 8]
+            return (w, h) if w and h else None
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+def reduction_factor(width, height, target_side):
+    """Largest of 1/2/4/8 that keeps the long side at or above *target_side*."""
+    long_side = max(width, height)
+    factor = 1
+    while factor < 8 and long_side // (factor * 2) >= target_side and _REDUCED_FLAGS[factor * 2] is not None:
+        factor *= 2
+    return factor
+
+
+class JpegSource:
+    """Encoded frame kept next to a reduced decode, for full-resolution face crops (picklable)."""
+
+    __slots__ = ("data", "factor")
+
+    def __init__(self, data, factor):
+        self.data = bytes(data)
+        self.factor = int(factor)
+
+    def crop(self, box, margin=0.5, min_side=None):
+        """
+        (crop, x0, y0, scale): pixels around *box* (x, y, w, h in reduced pixels)
+        padded by *margin* x the box size, decoded at 1/*scale* of full
+        resolution; *x0*, *y0* are the crop origin at that scale. None if the
+        JPEG will not decode.
+
+        OpenCV cannot decode a region of a JPEG, so the whole frame is decoded
+        and sliced. With *min_side* the decode is the coarsest IMREAD_REDUCED
+        scale finer than this source's at which the box's short side is still
+        >= *min_side* pixels. A reduced decode still entropy-decodes the whole
+        file, so it saves the buffer and some time, not most of it. At scale 1
+        (the default, or a box too small for any reduction) it costs a full
+        decode. Only the crop is kept.
+        """
+        scale = 1
+        if min_side:
+            side = min(float(box[2]), float(box[3])) * self.factor
+            while (scale * 2 < self.factor and side / (scale * 2) >= min_side
+                   and _REDUCED_FLAGS.get(scale * 2) is not None):
+                scale *= 2
+        flag = _REDUCED_FLAGS[scale] if scale > 1 else cv2.IMREAD_COLOR
+        img = cv2.imdecode(np.frombuffer(self.data, np.uint8), flag)
+        if img is None:
+            return None
+        x, y, w, h = (float(v) * self.factor / scale for v in box)
+        fh, fw = img.shape[:2]
+        x0, y0 = max(0, int(x - w * margin)), max(0, int(y - h * margin))
+        x1 = min(fw, int(math.ceil(x + w * (1 + margin))))
+        y1 = min(fh, int(math.ceil(y + h * (1 + margin))))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return np.ascontiguousarray(img[y0:y1, x0:x1]), x0, y0, scale
+
+
+def decode_frame_reduced(frame_bytes, target_side):
+    """
+    (image, source): *frame_bytes* decoded at the smallest JPEG scale whose long
+    side is still >= *target_side*. *source* is a JpegSource when the frame was
+    reduced, else None (small frames, PNG/WebP, unreadable headers decode as-is).
+    """
+    if not frame_bytes:
+        return None, None
+    size = jpeg_size(frame_bytes)
+    factor = reduction_factor(size[0], size[1], target_side) if size else 1
+    if factor == 1:
+        return decode_frame(frame_bytes), None
+    img = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), _REDUCED_FLAGS[factor])
+    if img is None:
+        return None, None
+    return img, JpegSource(frame_bytes, factor)
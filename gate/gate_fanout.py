@@ -0,0 +1,78 @@
+"""
+Concurrent steps of one gate decision on a bounded thread pool.
+=============================================
+A hybrid check-in used to run its independent steps one after another. First
+``validate_qr_token`` made a database round trip. Then ``get_face_embedding``
+spent hundreds of ms of CPU. Only after both did the visitor record fetch
+start. ``gate_decision`` now submits face step A and candidate loading
+(matcher refresh + the QR holder's visitor record) to a ``GateFanout`` and
+validates the QR in the request thread meanwhile, so a decision costs roughly
+the slowest step instead of their sum.
+
+Tasks only read: every database write (QR state, scan log, security alerts,
+check-in records) still happens in the request thread, after the results it
+depends on are in, in the same order as before.
+
+A task submitted with ``cancellable=True`` receives a ``cancelled``
+threading.Event. ``GateTask.cancel()`` drops the task if it has not started
+yet and sets the event so a started task can stop at its next checkpoint. The
+bad-QR short circuit uses this to abandon face work nobody will read.
+``stats()`` is exported on /debug_gate.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class GateTask:
+    """One submitted step: ``result()`` waits for it, ``cancel()`` abandons it."""
+
+    __slots__ = ("future", "cancelled", "_fanout")
+
+    def __init__(self, future, cancelled, fanout):
+        self.future = future
+        self.cancelled = cancelled
+        self._fanout = fanout
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def cancel(self):
+        """Abandon the task; returns True if it had not finished yet."""
+        if self.future.done():
+            return False
+        if self.cancelled is not None:
+            self.cancelled.set()
+        self._fanout._count("cancelled_before_start" if self.future.cancel() else "cancelled_running")
+        return True
+
+
+class GateFanout:
+    """Bounded executor for the per-request parallel steps, with counters."""
+
+    def __init__(self, max_workers=4, thread_name_prefix="gate-fanout"):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "cancelled_before_start": 0, "cancelled_running": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def submit(self, fn, *args, cancellable=False, **kwargs):
+        cancelled = threading.Event() if cancellable else None
+        if cancellable:
+            kwargs["cancelled"] = cancelled
+        future = self._executor.submit(fn, *args, **kwargs)
+        self._count("submitted")
+        return GateTask(future, cancelled, self)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._counters)
+        out["max_workers"] = self.max_workers
+        return out
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
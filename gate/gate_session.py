@@ -0,0 +1,139 @@
+"""
+Streaming gate sessions: validate the QR once, then only detect + match frames.
+=============================================
+The kiosk page used to POST a full frame to /checkin_verify_and_log every
+1.5 s, and every POST redid the IP check, QR parsing, ``validate_qr_token``
+and the visitor fetch. A ``GateSession`` is opened once per scanned QR
+(POST /gate/session): the server checks the IP, validates the QR and loads
+the candidate's name, and keeps that state here. Each following frame
+(POST /gate/session/<id>/frame, or one binary message on the WebSocket
+/gate/session/<id>/ws when flask-sock is installed) only runs the quality
+gate, detection and matching against the session state. The decision comes
+back as soon as a frame succeeds, and the kiosk sends its next frame
+straight away instead of waiting for a fixed polling interval.
+
+Each session also carries a FaceTrack (face_engine.py): the previous frame's
+face box seeds a small ROI search, so the full detector cascade only runs when
+the face is lost, and the embeddings of consecutive tracked frames are
+averaged before matching.
+
+Sessions expire after ``ttl_seconds`` without a frame and end on a terminal
+decision (granted / checked_out / rescan). ``stats()`` is exported on
+/debug_gate, including detector calls per decided session.
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+from time import time
+
+# Decisions after which the kiosk leaves the face step.
+TERMINAL_STATUSES = frozenset({"granted", "checked_out"})
+
+
+class GateSession:
+    """Per-QR state reused by every frame of one gate attempt."""
+
+    __slots__ = ("session_id", "kiosk_id", "client_ip", "action", "raw_qr", "qr_check",
+                 "visitor_name", "opened_at", "last_seen", "frames", "last_status", "track")
+
+    def __init__(self, kiosk_id, client_ip, action, raw_qr, qr_check, visitor_name=None, track=None):
+        self.session_id = secrets.token_urlsafe(16)
+        self.kiosk_id = kiosk_id
+        self.client_ip = client_ip
+        self.action = action
+        self.raw_qr = raw_qr
+        self.qr_check = qr_check
+        self.visitor_name = visitor_name
+        self.opened_at = self.last_seen = time()
+        self.frames = 0
+        self.last_status = None
+        self.track = track  # face_engine.FaceTrack: previous face box + averaged embedding
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "action": self.action,
+            "visitor_name": self.visitor_name,
+            "has_qr": bool(self.qr_check and self.qr_check[0]),
+            "frames": self.frames,
+            "track": self.track.stats() if self.track is not None else None,
+        }
+
+
+class GateSessionStore:
+    """Thread-safe session table with idle expiry and an LRU cap."""
+
+    def __init__(self, ttl_seconds=120.0, max_sessions=64, track_factory=None):
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_sessions = int(max_sessions)
+        self.track_factory = track_factory
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._counters = {"opened": 0, "closed": 0, "expired": 0, "frames": 0, "decided": 0,
+                          "decided_detector_calls": 0}
+
+    def _expire(self, now):
+        stale = [sid for sid, s in self._sessions.items() if now - s.last_seen > self.ttl_seconds]
+        for sid in stale:
+            del self._sessions[sid]
+        self._counters["expired"] += len(stale)
+
+    def open(self, kiosk_id, client_ip, action, raw_qr, qr_check, visitor_name=None):
+        track = self.track_factory() if self.track_factory is not None else None
+        session = GateSession(kiosk_id, client_ip, action, raw_qr, qr_check, visitor_name, track)
+        with self._lock:
+            self._expire(session.opened_at)
+            # One live session per kiosk: a rescan replaces the previous attempt.
+            for sid in [sid for sid, s in self._sessions.items() if s.kiosk_id == kiosk_id]:
+                del self._sessions[sid]
+                self._counters["closed"] += 1
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._counters["expired"] += 1
+            self._counters["opened"] += 1
+        return session
+
+    def get(self, session_id):
+        """Live session (marked as seen) or None if unknown / expired."""
+        now = time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_seen = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def record(self, session, status, terminal=False):
+        """Count one processed frame; a terminal decision closes the session."""
+        with self._lock:
+            session.frames += 1
+            session.last_status = status
+            self._counters["frames"] += 1
+            if terminal or status in TERMINAL_STATUSES:
+                self._counters["decided"] += 1
+                if session.track is not None:
+                    self._counters["decided_detector_calls"] += session.track.detector_calls
+                if self._sessions.pop(session.session_id, None) is not None:
+                    self._counters["closed"] += 1
+
+    def close(self, session_id):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is None:
+                return False
+            self._counters["closed"] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._expire(time())
+            out = dict(self._counters)
+            out["active"] = len(self._sessions)
+            frames, decided = out["frames"], out["decided"]
+        out["frames_per_decision"] = round(frames / decided, 2) if decided else None
+        detector_calls = out.pop("decided_detector_calls")
+        out["detector_calls_per_decision"] = round(detector_calls / decided, 2) if decided else None
+        out["ttl_seconds"] = self.ttl_seconds
+        return out
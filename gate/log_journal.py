@@ -0,0 +1,305 @@
+"""
+Write-behind journal for the gate's research and security logs.
+=============================================
+``log_protocol_event``, ``log_qr_scan`` and ``log_security_alert`` each did a
+synchronous Firebase ``set`` inside the request, on the deny paths as well as
+the grant path. ``LogJournal`` takes those writes off the request thread:
+
+* ``journal.child(path).set(value)`` and ``journal.update(fields)`` (the
+  ``db_ref`` shape the log helpers already use) append one JSON line
+  ``{"seq", "t", "writes": {path: value, ...}}`` to a local journal file and
+  return. Nothing waits on the network. A multi-path update, such as
+  event_partitions.write_event's record plus its summary counters, is one
+  entry: it is queued, dropped and sent as a unit, so the counters never
+  disagree with the records they count.
+* A background thread fsyncs the journal every ``fsync_interval`` seconds
+  (group commit: one fsync covers every append since the last one), then
+  sends up to ``batch_size`` pending entries as one multi-location
+  ``update()`` (write_batch.WriteBatch). An entry is never split across two
+  sends. A failed flush is retried with exponential backoff and the entries
+  stay pending.
+* After a successful flush the last sent ``seq`` is written to
+  ``<journal>.ack`` (atomic replace). Once nothing is pending the journal
+  file is truncated.
+* On start-up, entries after the ack are replayed, so events logged before a
+  crash or a network outage still reach Firebase. A torn last line (crash
+  mid-append) is skipped. Replay is at-least-once: a batch sent just before
+  a crash, whose ack was not written yet, is sent again. Its record writes
+  are ``set`` on unique keys and land unchanged, but its summary counters
+  are server increments and count those events twice. Recompute the day's
+  summaries with ``migrate_event_partitions.py --rebuild-summaries`` (add
+  ``--include-today``, with the gates stopped, for today) if exact counts
+  matter after a crash.
+
+Durability: an append reaches the OS when ``append`` returns and the disk
+within ``fsync_interval``. A process crash loses nothing; a power cut can
+lose the last ``fsync_interval`` of events. When ``max_pending`` entries are
+waiting (Firebase unreachable for a long time), new events are
+dropped and counted rather than growing memory without bound.
+
+``stats()`` (queue depth, lag of the oldest pending entry, dropped / flushed /
+failed counts) is exported on /debug_gate.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from write_batch import WriteBatch
+
+logger = logging.getLogger(__name__)
+
+
+class LogJournal:
+    """Durable append-only queue of multi-path writes flushed to a root ref in the background."""
+
+    def __init__(self, path, root_ref, batch_size=200, fsync_interval=0.2,
+                 max_pending=100000, retry_min=0.5, retry_max=30.0, start=True):
+        self.path = path
+        self.ack_path = f"{path}.ack"
+        # Callable so the sink follows the gate's current db reference.
+        self._root_ref = root_ref if callable(root_ref) else (lambda: root_ref)
+        self.batch_size = max(1, int(batch_size))
+        self.fsync_interval = max(0.01, float(fsync_interval))
+        self.max_pending = max(1, int(max_pending))
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one sender at a time (flush thread, close, tests)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pending = deque()  # (seq, t, {path: value})
+        self._dirty = False
+        self._next_attempt = 0.0
+        self._backoff = retry_min
+        self._counters = {"appended": 0, "flushed": 0, "flushes": 0, "flush_failures": 0,
+                          "dropped": 0, "replayed": 0}
+        self._last_error = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._acked = self._read_ack()
+        self._seq = self._replay()
+        self._fh = open(path, "a", encoding="utf-8")
+        self._thread = None
+        if start:
+            self._thread = threading.Thread(target=self._run, name="log-journal", daemon=True)
+            self._thread.start()
+
+    # ── db_ref shape ──────────────────────────────
+
+    def child(self, path):
+        return _JournalRef(self, [p for p in str(path).split("/") if p])
+
+    def update(self, fields):
+        """Multi-location update relative to the root, journalled as one entry."""
+        return self.append_update(fields)
+
+    # ── Append (request thread) ──────────────────
+
+    def append(self, path, value):
+        """Queue ``set(path, value)``; returns False if the event was dropped."""
+        return self.append_update({path: value})
+
+    def append_update(self, fields):
+        """Queue ``{path: value}`` writes as one entry; returns False if it was dropped."""
+        writes = {"/".join(p for p in str(path).split("/") if p): value for path, value in fields.items()}
+        if not writes:
+            return True
+        if "" in writes:
+            raise ValueError("LogJournal cannot write the database root")
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._counters["dropped"] += 1
+                return False
+            seq = self._seq + 1
+            now = time.time()
+            try:
+                line = json.dumps({"seq": seq, "t": now, "writes": writes},
+                                  separators=(",", ":"), default=str)
+                self._fh.write(line + "\n")
+                self._fh.flush()
+            except (OSError, TypeError, ValueError) as e:
+                self._counters["dropped"] += 1
+                self._last_error = f"append: {e}"
+                logger.error(f"Log journal append failed for {', '.join(writes)}: {e}")
+                return False
+            self._seq = seq
+            self._pending.append((seq, now, writes))
+            self._dirty = True
+            self._counters["appended"] += 1
+        return True
+
+    # ── Background flush ─────────────────────────
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            self.flush()
+
+    def sync(self):
+        """fsync everything appended so far (group commit)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                os.fsync(self._fh.fileno())
+            except OSError as e:
+                self._last_error = f"fsync: {e}"
+                logger.warning(f"Log journal fsync failed: {e}")
+
+    def flush(self, force=False):
+        """
+        fsync, then send pending entries in batches until the queue is empty
+        or a send fails. Returns the number of entries sent.
+        """
+        self.sync()
+        with self._flush_lock:
+            return self._send_pending(force)
+
+    def _send_pending(self, force):
+        sent = 0
+        while True:
+            if not force and time.monotonic() < self._next_attempt:
+                return sent
+            with self._lock:
+                entries = [self._pending[i] for i in range(min(self.batch_size, len(self._pending)))]
+            if not entries:
+                return sent
+            batch = WriteBatch(self._root_ref())
+            for _, _, writes in entries:
+                for path, value in writes.items():
+                    batch.put(path, value)
+            try:
+                batch.commit()
+            except Exception as e:
+                with self._lock:
+                    self._counters["flush_failures"] += 1
+                    self._last_error = f"flush: {e}"
+                    self._next_attempt = time.monotonic() + self._backoff
+                    self._backoff = min(self.retry_max, self._backoff * 2)
+                logger.warning(f"Log journal flush of {len(entries)} entries failed ({e}); will retry")
+                return sent
+            last_seq = entries[-1][0]
+            self._write_ack(last_seq)
+            with self._lock:
+                for _ in entries:
+                    self._pending.popleft()
+                self._acked = last_seq
+                self._counters["flushed"] += len(entries)
+                self._counters["flushes"] += 1
+                self._backoff = self.retry_min
+                self._next_attempt = 0.0
+                if not self._pending:
+                    self._truncate()
+            sent += len(entries)
+
+    def close(self, timeout=2.0):
+        """Stop the flush thread after a last flush attempt; pending entries stay in the journal."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        try:
+            self.flush(force=True)
+        finally:
+            with self._lock:
+                self._fh.close()
+
+    def stats(self):
+        with self._lock:
+            oldest = self._pending[0][1] if self._pending else None
+            return {
+                "path": self.path,
+                "depth": len(self._pending),
+                "lag_s": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+                "last_seq": self._seq,
+                "acked_seq": self._acked,
+                "last_error": self._last_error,
+                **self._counters,
+            }
+
+    # ── Journal files ────────────────────────────
+
+    def _read_ack(self):
+        try:
+            with open(self.ack_path, encoding="utf-8") as fh:
+                return int(fh.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_ack(self, seq):
+        tmp = f"{self.ack_path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                fh.write(str(seq))
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self.ack_path)
+        except OSError as e:
+            # Entries are still sent; after a restart they would be sent again.
+            self._last_error = f"ack: {e}"
+            logger.warning(f"Could not write log journal ack {self.ack_path}: {e}")
+
+    def _replay(self):
+        """Load entries after the ack into the queue; returns the highest seq seen."""
+        last = self._acked
+        try:
+            fh = open(self.path, encoding="utf-8")
+        except OSError:
+            return last
+        with fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                    seq = int(entry["seq"])
+                    # Journals written before multi-path entries hold one path/value per line.
+                    writes = entry["writes"] if "writes" in entry else {entry["path"]: entry["value"]}
+                    if not isinstance(writes, dict):
+                        raise TypeError("writes is not an object")
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Skipping unreadable log journal line in {self.path}")
+                    continue
+                last = max(last, seq)
+                if seq > self._acked:
+                    self._pending.append((seq, float(entry.get("t") or time.time()), writes))
+                    self._counters["replayed"] += 1
+        if self._pending:
+            logger.info(f"Log journal: replaying {len(self._pending)} unsent entries from {self.path}")
+        return last
+
+    def _truncate(self):
+        # Caller holds the lock and the queue is empty: every line is acked.
+        try:
+            self._fh.truncate(0)
+            self._fh.seek(0)
+        except OSError as e:
+            self._last_error = f"truncate: {e}"
+
+
+class _JournalRef:
+    """``db_ref``-shaped view of one path whose ``set`` appends to the journal."""
+
+    __slots__ = ("_journal", "_parts")
+
+    def __init__(self, journal, parts):
+        self._journal = journal
+        self._parts = parts
+
+    def child(self, path):
+        return _JournalRef(self._journal, self._parts + [p for p in str(path).split("/") if p])
+
+    def set(self, value):
+        self._journal.append("/".join(self._parts), value)
+
+    def update(self, fields):
+        base = "/".join(self._parts)
+        return self._journal.append_update(
+            {(f"{base}/{field}" if base else str(field)): value for field, value in fields.items()}
+        )
@@ -3,6 +3,12 @@ QR Code Module for Workplace Intelligence Platform with Hybrid Face–QR Authent
 =============================================
 Handles QR generation, validation, state management, twin detection,
 and security alerts for the dual-authentication (QR + Face) gate system.
+In single-frame mode the gate also reads the QR from the kiosk's camera
+frame server-side (``decode_qr_from_frame``, OpenCV QRCodeDetector).
+
+Payloads are signed (v2, see qr_signing.py) when QR_SIGNING_KEY is set, so
+``validate_qr_token`` rejects forged or edited codes before any DB read;
+unsigned v1 codes keep working.
 
 QR States:
     UNUSED           → Fresh QR, never scanned
@@ -18,12 +24,21 @@ import logging
 from datetime import datetime, timedelta
 from io import BytesIO
 import base64
+import threading
 
 try:
     import qrcode
 except ImportError:
     qrcode = None
 
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from qr_signing import build_qr_payload, verify_qr_signature
+from event_partitions import write_event
+
 logger = logging.getLogger(__name__)
 
 # ──────────────────────────────────────────────
@@ -51,6 +66,12 @@ _VALID_TRANSITIONS = {
     QR_INVALIDATED:      [],   # terminal
 }
 
+# Why update_qr_state failed (QrStateError.code)
+QR_UPDATE_CONFLICT = "conflict"            # state changed since the caller read it (another gate won)
+QR_UPDATE_INVALID = "invalid_transition"   # not allowed from the current state
+QR_UPDATE_NOT_FOUND = "not_found"          # no such visit
+QR_UPDATE_DB_ERROR = "db_error"            # database call failed
+
 
 # ──────────────────────────────────────────────
 # QR Generation
@@ -67,6 +88,7 @@ def generate_qr_payload(visitor_id, visit_id, visit_date, token):
 
     Keys are kept short to minimise QR complexity:
         v = visitor_id,  i = visit_id,  k = token,  e = expiry
+    plus q = version and s = signature for v2 (QR_SIGNING_KEY set).
     """
     try:
         date_obj = datetime.strptime(str(visit_date), "%Y-%m-%d")
@@ -74,13 +96,7 @@ def generate_qr_payload(visitor_id, visit_id, visit_date, token):
     except (ValueError, TypeError):
         expiry = datetime.now() + timedelta(hours=QR_EXPIRY_HOURS)
 
-    payload = {
-        "v": str(visitor_id),
-        "i": str(visit_id),
-        "k": str(token),
-        "e": expiry.strftime("%Y-%m-%d %H:%M:%S"),
-    }
-    return json.dumps(payload, separators=(",", ":"))
+    return build_qr_payload(visitor_id, visit_id, token, expiry.strftime("%Y-%m-%d %H:%M:%S"))
 
 
 def generate_qr_image_base64(payload_string):
@@ -121,10 +137,19 @@ def create_qr_for_visit(visitor_id, visit_id, visit_date, token=None):
     -------
     tuple (token, payload_string, image_base64, firebase_data_dict)
     """
+    token, payload_string, firebase_data = build_qr_record(visitor_id, visit_id, visit_date, token=token)
+    return token, payload_string, generate_qr_image_base64(payload_string), firebase_data
+
+
+def build_qr_record(visitor_id, visit_id, visit_date, token=None):
+    """
+    create_qr_for_visit without the PNG: (token, payload_string, firebase_data_dict).
+
+    Used where many visits are seeded at once (protocol_replay.py).
+    """
     if token is None:
         token = generate_qr_token()
     payload_string = generate_qr_payload(visitor_id, visit_id, visit_date, token)
-    image_base64 = generate_qr_image_base64(payload_string)
 
     try:
         date_obj = datetime.strptime(str(visit_date), "%Y-%m-%d")
@@ -149,13 +174,30 @@ def create_qr_for_visit(visitor_id, visit_id, visit_date, token=None):
         },
     }
 
-    return token, payload_string, image_base64, firebase_data
+    return token, payload_string, firebase_data
 
 
 # ──────────────────────────────────────────────
 # QR Parsing & Validation
 # ──────────────────────────────────────────────
 
+def parse_timestamp(value):
+    """
+    ``datetime.strptime(value, "%Y-%m-%d %H:%M:%S")``, the format of every
+    stored gate timestamp, without strptime's regex machinery on the common
+    zero-padded form (it runs several times per scan). Anything else goes
+    through strptime, so accepted inputs and ValueError are unchanged.
+    """
+    if isinstance(value, str) and len(value) == 19 and value[10] == " ":
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None and parsed.tzinfo is None:
+            return parsed
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+
 def parse_qr_payload(qr_string):
     """
     Parse the raw QR string into a dict.
@@ -166,6 +208,8 @@ def parse_qr_payload(qr_string):
         return None, "Empty or invalid QR data"
     try:
         data = json.loads(qr_string)
+        if not isinstance(data, dict):
+            return None, "Invalid QR format – not a visit code"
         required = {"v", "i", "k", "e"}
         if not required.issubset(data.keys()):
             return None, "Invalid QR format – missing required fields"
@@ -174,6 +218,49 @@ def parse_qr_payload(qr_string):
         return None, f"Cannot decode QR: {exc}"
 
 
+# QRCodeDetector keeps per-call state, so each request thread gets its own.
+_qr_detector_local = threading.local()
+
+
+def _qr_detector():
+    detector = getattr(_qr_detector_local, "detector", None)
+    if detector is None:
+        detector = _qr_detector_local.detector = cv2.QRCodeDetector()
+    return detector
+
+
+def decode_qr_from_frame(cv2_img, source=None):
+    """
+    Text of a QR code visible in a BGR camera frame, or None.
+
+    *source* is the frame_upload.JpegSource of a reduced-resolution decode: when
+    a QR is located but too small to read at that scale, its region is decoded
+    again from the full-resolution JPEG.
+    """
+    if cv2 is None or cv2_img is None or getattr(cv2_img, "size", 0) == 0:
+        return None
+    detector = _qr_detector()
+    try:
+        text, points, _ = detector.detectAndDecode(cv2_img)
+    except cv2.error as exc:
+        logger.debug(f"QR decode failed on frame: {exc}")
+        return None
+    if text:
+        return text
+    if points is None or source is None:
+        return None
+    x, y, w, h = cv2.boundingRect(points.reshape(-1, 2).astype("float32"))
+    cropped = source.crop((x, y, w, h), margin=0.15)
+    if cropped is None:
+        return None
+    try:
+        text, _, _ = detector.detectAndDecode(cropped[0])
+    except cv2.error as exc:
+        logger.debug(f"QR decode failed on full-resolution crop: {exc}")
+        return None
+    return text or None
+
+
 def validate_qr_token(qr_data, db_ref):
     """
     Validate a parsed QR payload against Firebase.
@@ -193,9 +280,14 @@ def validate_qr_token(qr_data, db_ref):
     if not all([visitor_id, visit_id, token, expiry_str]):
         return False, None, None, None, "Incomplete QR data"
 
+    # ── Signature check (v2): forged / edited codes never reach the DB ──
+    signed_ok, signature_err = verify_qr_signature(qr_data)
+    if not signed_ok:
+        return False, None, None, None, signature_err
+
     # ── Expiry check ──
     try:
-        expiry_dt = datetime.strptime(expiry_str, "%Y-%m-%d %H:%M:%S")
+        expiry_dt = parse_timestamp(expiry_str)
         if datetime.now() > expiry_dt:
             return False, visitor_id, visit_id, None, "QR code has expired"
     except ValueError:
@@ -233,7 +325,7 @@ def validate_qr_token(qr_data, db_ref):
         last_scan = qr_state.get("checkin_scan_time") or qr_state.get("checkout_scan_time")
         if last_scan:
             try:
-                elapsed = (datetime.now() - datetime.strptime(last_scan, "%Y-%m-%d %H:%M:%S")).total_seconds()
+                elapsed = (datetime.now() - parse_timestamp(last_scan)).total_seconds()
                 if elapsed < QR_SCAN_COOLDOWN_SECONDS:
                     wait = int(QR_SCAN_COOLDOWN_SECONDS - elapsed)
                     return False, visitor_id, visit_id, visit_data, f"Cooldown active – wait {wait}s before scanning again"
@@ -261,60 +353,150 @@ def get_qr_state(visitor_id, visit_id, db_ref):
         return {"status": QR_UNUSED, "scan_count": 0}
 
 
+class QrStateError(str):
+    """Error message returned by update_qr_state; ``code`` is one of the QR_UPDATE_* constants."""
+
+    def __new__(cls, message, code):
+        error = super().__new__(cls, message)
+        error.code = code
+        return error
+
+
+class _QrTransitionRejected(Exception):
+    """Raised inside a qr_state transaction to abort it without writing."""
+
+    def __init__(self, message, code=QR_UPDATE_INVALID):
+        super().__init__(message)
+        self.code = code
+
+
+def _next_qr_state(current, new_status, auth_method, reason, allow_missing):
+    """Transaction body: the qr_state that follows *current*, or raise _QrTransitionRejected."""
+    if current is None and not allow_missing:
+        raise _QrTransitionRejected(None)
+    current = current if isinstance(current, dict) else {}
+    cur_status = current.get("status", QR_UNUSED)
+
+    allowed = _VALID_TRANSITIONS.get(cur_status, [])
+    if new_status not in allowed:
+        raise _QrTransitionRejected(f"Invalid QR transition {cur_status} → {new_status}")
+
+    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    update = {"status": new_status, "scan_count": current.get("scan_count", 0) + 1}
+
+    if auth_method:
+        update["auth_method"] = auth_method
+
+    if new_status == QR_CHECKIN_USED:
+        update["checkin_scan_time"] = now_str
+    elif new_status == QR_CHECKOUT_USED:
+        update["checkout_scan_time"] = now_str
+    elif new_status == QR_ASSUMED_SCANNED:
+        update["checkin_scan_time"] = now_str
+        update["auth_method"] = "face_only"
+    elif new_status == QR_INVALIDATED:
+        update["invalidated_at"] = now_str
+        update["invalidated_reason"] = reason or "Unknown"
+    return {**current, **update}
+
+
 def update_qr_state(visitor_id, visit_id, new_status, db_ref,
-                     auth_method=None, reason=None):
+                     auth_method=None, reason=None, claim=None, expected_status=None):
     """
     Transition QR to *new_status* with validation.
 
-    Returns (success: bool, error_msg: str | None)
-    """
-    try:
-        visit_ref = db_ref.child(f"visitors/{visitor_id}/visits/{visit_id}")
-        if not visit_ref.get():
-            msg = f"Visit {visit_id} not found for visitor {visitor_id}"
-            logger.warning(msg)
-            return False, msg
-        ref = visit_ref.child("qr_state")
-        current = ref.get() or {}
-        cur_status = current.get("status", QR_UNUSED)
-
-        allowed = _VALID_TRANSITIONS.get(cur_status, [])
-        if new_status not in allowed:
-            msg = f"Invalid QR transition {cur_status} → {new_status}"
-            logger.warning(msg)
-            return False, msg
-
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        scan_count = current.get("scan_count", 0)
+    The check against _VALID_TRANSITIONS and the write are one compare-and-set
+    (``Reference.transaction`` on ``qr_state``): when two gates scan the same
+    QR at once, exactly one transition succeeds and the other sees the new
+    state and is rejected. The visit is only read separately for legacy
+    visits that have no ``qr_state`` yet.
 
-        update = {"status": new_status, "scan_count": scan_count + 1}
+    *claim* (a dict), when given, receives the qr_state before ("previous")
+    and after ("claimed") the transition, for rollback_qr_claim.
 
-        if auth_method:
-            update["auth_method"] = auth_method
+    *expected_status* is the status the caller decided on. If the stored
+    status differs, another gate got there first and the transition is
+    rejected with QR_UPDATE_CONFLICT.
 
-        if new_status == QR_CHECKIN_USED:
-            update["checkin_scan_time"] = now_str
-        elif new_status == QR_CHECKOUT_USED:
-            update["checkout_scan_time"] = now_str
-        elif new_status == QR_ASSUMED_SCANNED:
-            update["checkin_scan_time"] = now_str
-            update["auth_method"] = "face_only"
-        elif new_status == QR_INVALIDATED:
-            update["invalidated_at"] = now_str
-            update["invalidated_reason"] = reason or "Unknown"
+    Returns (success: bool, error: QrStateError | None)
+    """
+    def transition(current, allow_missing):
+        if expected_status is not None and (current is not None or allow_missing):
+            seen = (current if isinstance(current, dict) else {}).get("status", QR_UNUSED)
+            if seen != expected_status:
+                raise _QrTransitionRejected(
+                    f"QR state is {seen}, expected {expected_status}", QR_UPDATE_CONFLICT
+                )
+        new_state = _next_qr_state(current, new_status, auth_method, reason, allow_missing)
+        if claim is not None:
+            claim.update(previous=current, claimed=new_state)
+        return new_state
 
-        ref.update(update)
+    try:
+        ref = db_ref.child(f"visitors/{visitor_id}/visits/{visit_id}/qr_state")
+        try:
+            ref.transaction(lambda current: transition(current, False))
+        except _QrTransitionRejected as rejected:
+            if rejected.args[0]:
+                raise
+            if not db_ref.child(f"visitors/{visitor_id}/visits/{visit_id}").get():
+                msg = f"Visit {visit_id} not found for visitor {visitor_id}"
+                logger.warning(msg)
+                return False, QrStateError(msg, QR_UPDATE_NOT_FOUND)
+            ref.transaction(lambda current: transition(current, True))
         logger.info(f"QR state → {new_status} for visitor={visitor_id} visit={visit_id}")
         return True, None
 
+    except _QrTransitionRejected as rejected:
+        msg = rejected.args[0]
+        logger.warning(msg)
+        return False, QrStateError(msg, rejected.code)
     except Exception as exc:
         logger.error(f"Error updating QR state: {exc}")
-        return False, str(exc)
+        return False, QrStateError(str(exc), QR_UPDATE_DB_ERROR)
 
 
-def invalidate_qr(visitor_id, visit_id, reason, db_ref):
+def invalidate_qr(visitor_id, visit_id, reason, db_ref, claim=None):
     """Short-hand: force-invalidate a QR (stolen, face-override, etc.)."""
-    return update_qr_state(visitor_id, visit_id, QR_INVALIDATED, db_ref, reason=reason)
+    return update_qr_state(visitor_id, visit_id, QR_INVALIDATED, db_ref, reason=reason, claim=claim)
+
+
+def _stored_form(state):
+    # Firebase drops null fields, so compare states without them.
+    if not isinstance(state, dict):
+        return state
+    return {k: v for k, v in state.items() if v is not None}
+
+
+def rollback_qr_claim(visitor_id, visit_id, claim, db_ref):
+    """
+    Undo a transition made by ``update_qr_state(..., claim=claim)`` whose
+    follow-up writes failed, so the visitor can simply retry.
+
+    Also a compare-and-set: the previous state is restored only while the
+    stored qr_state is still the one this claim wrote; if another gate has
+    moved it on since, that later state is kept.
+
+    Returns (success: bool, error_msg: str | None)
+    """
+    if "claimed" not in claim:
+        return False, "Nothing was claimed"
+
+    def restore(current):
+        if _stored_form(current) != _stored_form(claim["claimed"]):
+            raise _QrTransitionRejected("QR state changed after the claim; not rolled back")
+        return claim["previous"]
+
+    try:
+        db_ref.child(f"visitors/{visitor_id}/visits/{visit_id}/qr_state").transaction(restore)
+        logger.info(f"QR state claim rolled back for visitor={visitor_id} visit={visit_id}")
+        return True, None
+    except _QrTransitionRejected as rejected:
+        logger.warning(rejected.args[0])
+        return False, rejected.args[0]
+    except Exception as exc:
+        logger.error(f"Error rolling back QR state: {exc}")
+        return False, str(exc)
 
 
 # ──────────────────────────────────────────────
@@ -349,7 +531,8 @@ def log_qr_scan(visitor_id, visit_id, scan_type, db_ref, **extra):
 
 def log_security_alert(alert_type, db_ref, **fields):
     """
-    Write a top-level security alert (visible in admin dashboard).
+    Write a security alert under ``security_alerts/<YYYY-MM-DD>/`` and count
+    it in that day's summary (see event_partitions.py).
 
     alert_type examples: QR_FACE_MISMATCH, QR_STOLEN, TWIN_DETECTED
     """
@@ -358,7 +541,7 @@ def log_security_alert(alert_type, db_ref, **fields):
         key = datetime.now().strftime("%Y-%m-%d_%H-%M-%S_%f")
         entry = {"alert_type": alert_type, "timestamp": now_str}
         entry.update(fields)
-        db_ref.child(f"security_alerts/{key}").set(entry)
+        write_event(db_ref, "security_alerts", key, entry)
         logger.warning(f"SECURITY ALERT: {alert_type} | {fields}")
         return True
     except Exception as exc:
@@ -370,44 +553,23 @@ def log_security_alert(alert_type, db_ref, **fields):
 # Twin / Multi-Match Detection
 # ──────────────────────────────────────────────
 
-def find_all_face_matches(live_embedding, all_visitors, threshold=0.6):
+def find_all_face_matches(live_embedding, all_visitors, threshold=0.6, top_k=None):
     """
     Compare *live_embedding* against every stored visitor embedding.
 
+    *all_visitors* is either a resident ``face_index.FaceIndex`` (preferred —
+    one vectorised pass, no string parsing) or a raw ``visitors`` dict, which
+    is indexed on the fly. *top_k* caps the number of candidates kept.
+
     Returns a **sorted** list of dicts (closest first):
         [{"visitor_id", "distance", "name", "blacklisted"}, …]
+    The list is a ``face_index.FaceMatchResult``, so the same single scan also
+    carries ``best_distance``, ``twin_gap``, ``candidates``, ``scanned`` and
+    ``elapsed_ms`` for deny messages and metrics.
     """
-    import numpy as np
-
-    live_flat = np.asarray(live_embedding).flatten()
-    if live_flat.size != 128:
-        return []
-
-    matches = []
-    for vid, vdata in all_visitors.items():
-        if not isinstance(vdata, dict):
-            continue
-        basic = vdata.get("basic_info", {})
-        emb_str = basic.get("embedding")
-        if not emb_str:
-            continue
-        try:
-            stored = np.array([float(x) for x in emb_str.strip().split()])
-            if stored.size != 128:
-                continue
-            dist = float(np.linalg.norm(live_flat - stored))
-            if dist <= threshold:
-                matches.append({
-                    "visitor_id": vid,
-                    "distance": dist,
-                    "name": basic.get("name", "Unknown"),
-                    "blacklisted": str(basic.get("blacklisted", "no")).lower() in ("yes", "true", "1"),
-                })
-        except Exception:
-            continue
-
-    matches.sort(key=lambda m: m["distance"])
-    return matches
+    from face_index import match_faces
+
+    return match_faces(live_embedding, all_visitors, threshold=threshold, k=top_k)
 
 
 def detect_twin(matches, strong_threshold=0.45):
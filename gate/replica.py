@@ -0,0 +1,315 @@
+"""
+Local replica of one Realtime Database node for the gate.
+=============================================
+Subscribes to the node with ``Reference.listen`` (firebase_admin streaming, or
+``InMemoryDBRef.listen`` in mock mode), applies put/patch events to an
+in-memory copy and serves reads from it, so request handlers never wait on the
+network for visitor data.
+
+Events are applied copy-on-write below the node's top level: every dict on
+the written path is replaced by a shallow copy, never changed in place. A
+subtree handed out by ``snapshot()`` therefore stays as it was when read, and
+read-only callers can skip the deep copy that ``get()`` makes.
+
+Every applied event bumps ``version`` and is fanned out to subscribers with the
+set of top-level keys (visitor ids) it touched, so caches such as the face
+index can invalidate incrementally instead of reloading the whole tree.
+
+A ready replica is only trusted while it is *fresh*: the listener is open (for
+firebase_admin, its stream thread is still running) and an event arrived
+within ``max_staleness`` seconds. The SDK drops the stream's keep-alives, so
+a quiet node and a silently dead stream look alike. Once the bound passes,
+``ReplicaReader`` reads the database directly and ``needs_resync()`` asks the
+owner to re-bind. The new listener's initial "put" makes the replica fresh
+again.
+"""
+
+import copy
+import logging
+import threading
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _split(path):
+    return [p for p in str(path or "").split("/") if p]
+
+
+def copy_tree(value):
+    """Deep copy of database data (dicts, lists, scalars); several times faster than copy.deepcopy."""
+    if isinstance(value, dict):
+        return {key: copy_tree(child) for key, child in value.items()}
+    if isinstance(value, list):
+        return [copy_tree(child) for child in value]
+    if isinstance(value, _SCALARS):
+        return value
+    return copy.deepcopy(value)
+
+
+class TreeReplica:
+    """
+    In-memory mirror of the node at *path*, kept current by a change feed.
+
+    Until the initial "put" arrives (``ready`` is False), and whenever the
+    replica is not ``fresh()``, readers should fall back to the live database;
+    ``ReplicaReader`` does this automatically. *max_staleness* (seconds, 0 =
+    trust a ready replica forever) bounds the time since the last event;
+    *retry_interval* is the least time between re-binds of a dead listener.
+    """
+
+    def __init__(self, path="visitors", max_staleness=0.0, retry_interval=5.0):
+        self.path = "/".join(_split(path))
+        self.max_staleness = max(0.0, float(max_staleness))
+        self.retry_interval = max(0.0, float(retry_interval))
+        self._lock = threading.RLock()
+        self._tree = {}
+        self._registration = None
+        self._subscribers = []
+        self.source = None
+        self.ready = False
+        self.version = 0
+        self.events_applied = 0
+        self.last_event_at = None
+        self.bound_at = None
+        self.resyncs = 0
+        self._ref = None
+
+    # ── Lifecycle ────────────────────────────────
+
+    def bind(self, ref, source=None):
+        """
+        Start mirroring *ref* (a reference to ``self.path``). Any previous
+        listener is closed first. *source* identifies the backing database so
+        callers can detect when it has been swapped.
+        """
+        self.close()
+        with self._lock:
+            self.source = source
+            self._tree = {}
+            self.ready = False
+            self.bound_at = time()
+        self._ref = ref
+        self._registration = ref.listen(self._on_event)
+        return self
+
+    def resync(self):
+        """Re-bind the last bound ref: a fresh listener re-sends the whole node."""
+        if self._ref is None:
+            return self
+        self.resyncs += 1
+        logger.warning(f"Replica of {self.path} is stale (lag {self.lag()}s); re-syncing")
+        return self.bind(self._ref, source=self.source)
+
+    def close(self):
+        registration, self._registration = self._registration, None
+        if registration is not None:
+            try:
+                registration.close()
+            except Exception as exc:
+                logger.warning(f"Replica listener close failed: {exc}")
+        with self._lock:
+            self.ready = False
+
+    def subscribe(self, callback):
+        """
+        Register ``callback(changed_keys)`` to run after each applied event
+        (under the replica lock). *changed_keys* is a set of top-level keys, or
+        None if the whole node was replaced.
+        """
+        self._subscribers.append(callback)
+
+    # ── Event handling ───────────────────────────
+
+    def _on_event(self, event):
+        try:
+            self.apply(event.event_type, event.path, event.data)
+        except Exception as exc:
+            logger.error(f"Replica failed to apply {event.event_type} at {event.path}: {exc}")
+
+    def apply(self, event_type, path, data):
+        """Apply one put/patch event (path relative to the mirrored node)."""
+        parts = _split(path)
+        with self._lock:
+            if event_type == "put":
+                self._put(parts, data)
+                changed = {parts[0]} if parts else None
+            elif event_type == "patch":
+                changed = set()
+                for key, value in (data or {}).items():
+                    sub = parts + _split(key)
+                    self._put(sub, value)
+                    if sub:
+                        changed.add(sub[0])
+                if not parts and not changed:
+                    return
+            else:
+                return
+            self.ready = True
+            self.version += 1
+            self.events_applied += 1
+            self.last_event_at = time()
+            for callback in list(self._subscribers):
+                try:
+                    callback(changed)
+                except Exception as exc:
+                    logger.error(f"Replica subscriber failed: {exc}")
+
+    def _put(self, parts, value):
+        if not parts:
+            self._tree = value if isinstance(value, dict) else {}
+            return
+        node = self._tree
+        for key in parts[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = {}
+            else:
+                child = dict(child)  # copy-on-write: snapshots keep the old node
+            node[key] = child
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+            self._prune(parts[:-1])
+        else:
+            node[parts[-1]] = value
+
+    def _prune(self, parts):
+        # Firebase has no empty objects: drop parents left empty by a delete.
+        while parts:
+            node = self._tree
+            for key in parts[:-1]:
+                node = node.get(key, {})
+            if node.get(parts[-1]) == {}:
+                node.pop(parts[-1], None)
+                parts = parts[:-1]
+            else:
+                break
+
+    # ── Freshness ────────────────────────────────
+
+    def healthy(self):
+        """Listener open, and its stream thread (firebase_admin) still running."""
+        registration = self._registration
+        if registration is None:
+            return False
+        thread = getattr(registration, "_thread", None)
+        return thread is None or thread.is_alive()
+
+    def lag(self, now=None):
+        """Seconds since the last applied event (or the last bind, before any event)."""
+        since = self.last_event_at if self.last_event_at is not None else self.bound_at
+        if since is None:
+            return None
+        return max(0.0, (now if now is not None else time()) - since)
+
+    def fresh(self, now=None):
+        """True when reads may be served from memory: ready, healthy and within max_staleness."""
+        if not self.ready or not self.healthy():
+            return False
+        if self.max_staleness <= 0:
+            return True
+        lag = self.lag(now)
+        return lag is not None and lag <= self.max_staleness
+
+    def needs_resync(self, now=None):
+        """Bound, but the listener died or nothing arrived within max_staleness since the last event or bind."""
+        if self._ref is None:
+            return False
+        now = now if now is not None else time()
+        since_bind = now - (self.bound_at or now)
+        if not self.healthy():
+            return since_bind >= self.retry_interval
+        if self.max_staleness <= 0:
+            return False
+        lag = self.lag(now)
+        return lag is not None and lag > self.max_staleness and since_bind > self.max_staleness
+
+    # ── Reads ────────────────────────────────────
+
+    def get(self, path=None):
+        """Deep copy of the value at *path* (relative to the node), or None."""
+        with self._lock:
+            node = self._tree
+            for key in _split(path):
+                if not isinstance(node, dict) or key not in node:
+                    return None
+                node = node[key]
+            return copy_tree(node)
+
+    def snapshot(self, path=None):
+        """
+        Value at *path* without copying it, or None. Read-only: it is shared
+        with the replica and other readers, but later events never change it.
+        The node itself (empty *path*) is changed in place, so it comes back
+        as a shallow copy.
+        """
+        parts = _split(path)
+        with self._lock:
+            if not parts:
+                return dict(self._tree)
+            node = self._tree
+            for key in parts:
+                if not isinstance(node, dict) or key not in node:
+                    return None
+                node = node[key]
+            return node
+
+    def peek(self, key=None):
+        """
+        Live (uncopied) top-level child, or the whole tree when *key* is None.
+        Read-only; meant for subscribers, which run under the replica lock.
+        """
+        with self._lock:
+            return self._tree if key is None else self._tree.get(key)
+
+    def stats(self):
+        now = time()
+        with self._lock:
+            lag = self.lag(now)
+            return {
+                "path": self.path,
+                "ready": self.ready,
+                "fresh": self.fresh(now),
+                "healthy": self.healthy(),
+                "lag_s": round(lag, 3) if lag is not None else None,
+                "max_staleness_s": self.max_staleness,
+                "version": self.version,
+                "events_applied": self.events_applied,
+                "resyncs": self.resyncs,
+                "size": len(self._tree),
+                "last_event_at": self.last_event_at,
+            }
+
+
+class ReplicaReader:
+    """
+    Read-only reference rooted at the database root. Paths under the replica's
+    node are served from memory while it is fresh; everything else (or any read
+    before the initial sync or past the staleness bound) goes to *fallback_ref*.
+    With *shared* the replica's values are returned uncopied (see
+    ``TreeReplica.snapshot``); the caller must not modify them.
+    """
+
+    def __init__(self, replica, fallback_ref, path=(), shared=False):
+        self._replica = replica
+        self._fallback = fallback_ref
+        self._path = tuple(path)
+        self._shared = shared
+
+    def child(self, path):
+        return ReplicaReader(self._replica, self._fallback, self._path + tuple(_split(path)), self._shared)
+
+    def get(self):
+        prefix = tuple(_split(self._replica.path))
+        n = len(prefix)
+        if self._path[:n] == prefix and self._replica.fresh():
+            rel = "/".join(self._path[n:])
+            return self._replica.snapshot(rel) if self._shared else self._replica.get(rel)
+        ref = self._fallback.child("/".join(self._path)) if self._path else self._fallback
+        return ref.get()
@@ -0,0 +1,87 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(_REPO_ROOT))
+
+from ann_index import IVFFaceIndex  # noqa: E402
+from embedding_codec import encode_embedding  # noqa: E402
+from face_index import FaceIndex  # noqa: E402
+
+
+def _clustered(n, seed=3):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 1, (20, 128))
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    data = 0.6 * centres[rng.integers(0, 20, n)] + rng.normal(0, 0.05, (n, 128))
+    return data.astype(np.float32)
+
+
+def _visitors(data, blacklisted=()):
+    return {
+        f"v{i}": {"basic_info": {
+            "name": f"v{i}",
+            "embedding": encode_embedding(row),
+            "blacklisted": "yes" if i in blacklisted else "no",
+        }}
+        for i, row in enumerate(data)
+    }
+
+
+class IVFFaceIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.data = _clustered(2000)
+        self.visitors = _visitors(self.data, blacklisted={17})
+        self.exact = FaceIndex.from_visitors(self.visitors)
+        self.ivf = IVFFaceIndex.from_visitors(
+            self.visitors, nlist=32, nprobe=4, min_train_size=500, background=False
+        )
+
+    def test_trained_index_scans_a_fraction_and_reranks_exactly(self):
+        self.assertTrue(self.ivf.stats()["trained"])
+        q = self.data[123] + 0.01
+        got = self.ivf.match(q, threshold=0.6, k=5)
+        want = self.exact.match(q, threshold=0.6, k=5)
+        self.assertLess(got.scanned, len(self.exact))
+        self.assertEqual(got.best["visitor_id"], want.best["visitor_id"])
+        # Same exact float64 distance for the same row.
+        self.assertEqual(got.best_distance, want.best_distance)
+        # Blacklisted rows are always scored, whichever lists were probed.
+        self.assertEqual(got.best_blacklisted, want.best_blacklisted)
+
+    def test_probing_every_list_equals_brute_force(self):
+        self.ivf.nprobe = 32
+        for i in (0, 500, 1999):
+            q = self.data[i] + 0.02
+            got = [c["visitor_id"] for c in self.ivf.match(q, k=5).candidates]
+            want = [c["visitor_id"] for c in self.exact.match(q, k=5).candidates]
+            self.assertEqual(got, want)
+
+    def test_rows_added_and_removed_after_training(self):
+        new_vec = self.data[5] + 0.001
+        self.ivf.upsert("new", {"basic_info": {"name": "new", "embedding": encode_embedding(new_vec)}})
+        self.assertEqual(self.ivf.match(new_vec, k=1).best["visitor_id"], "new")
+        self.ivf.remove("new")
+        self.ivf.remove("v5")
+        best = self.ivf.match(self.data[5], k=1).best
+        self.assertNotIn(best["visitor_id"], ("new", "v5"))
+        # v1999 was swapped into v5's row; it must still be found via its list.
+        self.assertEqual(self.ivf._rows["v1999"], 5)
+        self.assertEqual(self.ivf.match(self.data[1999], k=1).best["visitor_id"], "v1999")
+
+    def test_small_index_stays_exhaustive(self):
+        small = IVFFaceIndex.from_visitors(_visitors(self.data[:100]), min_train_size=500, background=False)
+        self.assertFalse(small.stats()["trained"])
+        self.assertEqual(small.match(self.data[3], k=1).scanned, 100)
+
+    def test_background_rebuild(self):
+        ivf = IVFFaceIndex.from_visitors(self.visitors, nlist=16, min_train_size=500, background=True)
+        self.assertTrue(ivf.wait_until_trained(timeout=30))
+        self.assertEqual(ivf.match(self.data[42], k=1).best["visitor_id"], "v42")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,6 +36,7 @@ def load_gate_app_module():
     module = importlib.util.module_from_spec(spec)
     sys.modules[spec.name] = module
     spec.loader.exec_module(module)
+    module.init_gate()
     return module
 
 
@@ -135,7 +136,8 @@ class GateEdgeCaseTests(unittest.TestCase):
         self.assertIn("QR invalid:", res.get("message", ""))
 
     def _minimal_jpeg_data_url(self):
-        img = np.zeros((64, 64, 3), dtype=np.uint8)
+        # Textured mid-grey frame so it passes the frame quality gate (a black frame is "too_dark").
+        img = np.random.default_rng(0).integers(60, 200, (64, 64, 3), dtype=np.uint8)
         ok, buf = cv2.imencode(".jpg", img)
         self.assertTrue(ok)
         return "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode("ascii")
@@ -518,6 +520,16 @@ class GateEdgeCaseTests(unittest.TestCase):
         )
         self.assertEqual(resp3.status_code, 200)
 
+    def test_cached_route_urls_match_url_for(self):
+        from flask import url_for
+        params = {"name": "Zoë O'Neil & co/+?=#", "action": "checked out", "duration": "1h 2m", "visitor_id": "v 1%"}
+        for base_url in ("http://localhost", "http://localhost/gate"):
+            with self.gate.app.test_request_context("/", base_url=base_url):
+                self.assertEqual(self.gate.route_url("checkin_success", **params),
+                                 url_for("checkin_success", **params))
+                self.assertEqual(self.gate.route_url("feedback_form", visitor_id="v 1%"),
+                                 url_for("feedback_form", visitor_id="v 1%"))
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
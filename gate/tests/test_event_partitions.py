@@ -0,0 +1,103 @@
+import sys
+import unittest
+from pathlib import Path
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from event_partitions import day_range, read_events, read_summaries, summarize, write_event  # noqa: E402
+from migrate_event_partitions import migrate  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+from write_batch import WriteBatch  # noqa: E402
+
+STREAM = "research_protocol_events"
+
+
+def _event(kind, mode="DUAL"):
+    return {"event": kind, "auth_mode": mode, "timestamp": "-"}
+
+
+class EventPartitionTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def setUp(self):
+        self.db = self.gate.InMemoryDBRef({"research_protocol_events": {}, "security_alerts": {}})
+
+    def test_events_land_in_day_partitions_with_summaries(self):
+        write_event(self.db, STREAM, "2026-03-01_09-00-00_000001", _event("arrival"))
+        write_event(self.db, STREAM, "2026-03-01_17-00-00_000001", _event("departure", "FACE_ONLY"))
+        # Same-day increments in one batch add up instead of overwriting each other.
+        batch = WriteBatch(self.db)
+        write_event(batch, STREAM, "2026-03-02_09-00-00_000001", _event("arrival"))
+        write_event(batch, STREAM, "2026-03-02_09-30-00_000001", _event("arrival"))
+        batch.commit()
+
+        self.assertEqual(self.db.child(f"{STREAM}/2026-03-01/2026-03-01_09-00-00_000001/event").get(), "arrival")
+        self.assertEqual(read_summaries(self.db, STREAM, "2026-03-01", "2026-03-02"), {
+            "2026-03-01": {"total": 2, "by_type": {"arrival": 1, "departure": 1},
+                           "by_auth_mode": {"DUAL": 1, "FACE_ONLY": 1}},
+            "2026-03-02": {"total": 2, "by_type": {"arrival": 2}, "by_auth_mode": {"DUAL": 2}},
+        })
+        self.assertEqual(summarize(self.db.child(f"{STREAM}/2026-03-02").get(), STREAM),
+                         read_summaries(self.db, STREAM, "2026-03-02")["2026-03-02"])
+
+    def test_range_scan_reads_only_requested_days(self):
+        for day in ("2026-02-28", "2026-03-01", "2026-03-03"):
+            write_event(self.db, STREAM, f"{day}_12-00-00_000000", _event("arrival"))
+        rows = read_events(self.db, STREAM, "2026-03-01", "2026-03-03")
+        self.assertEqual([day for day, _, _ in rows], ["2026-03-01", "2026-03-03"])
+        self.assertEqual(read_events(self.db, STREAM, "2026-03-02"), [])
+        self.assertEqual(day_range("2026-02-27", "2026-03-01"), ["2026-02-27", "2026-02-28", "2026-03-01"])
+
+    def test_migration_moves_flat_records_and_rebuilds_summaries(self):
+        flat = {
+            "2026-01-05_10-00-00_000001": _event("arrival"),
+            "2026-01-05_18-00-00_000001": _event("invalidation", "FACE_ONLY"),
+            "2026-01-06_10-00-00_000001": _event("arrival"),
+            "bogus": _event("arrival"),
+        }
+        self.db.child(STREAM).set(dict(flat))
+        self.db.child("security_alerts/2026-01-05_11-00-00_000001").set({"alert_type": "QR_FACE_MISMATCH"})
+        write_event(self.db, STREAM, "2026-01-06_12-00-00_000001", _event("departure"))
+
+        dry = migrate(self.db, dry_run=True)
+        self.assertEqual(dry[STREAM]["moved"], 3)
+        self.assertIn("2026-01-05_10-00-00_000001", self.db.child(STREAM).get())
+
+        stats = migrate(self.db, chunk_size=2)
+        self.assertEqual((stats[STREAM]["moved"], stats[STREAM]["unrecognized"]), (3, 1))
+        self.assertEqual(sorted(self.db.child(STREAM).get()), ["2026-01-05", "2026-01-06", "bogus"])
+        self.assertEqual([k for _, k, _ in read_events(self.db, STREAM, "2026-01-05", "2026-01-06")], [
+            "2026-01-05_10-00-00_000001", "2026-01-05_18-00-00_000001",
+            "2026-01-06_10-00-00_000001", "2026-01-06_12-00-00_000001",
+        ])
+        summaries = read_summaries(self.db, STREAM, "2026-01-05", "2026-01-06")
+        self.assertEqual(summaries["2026-01-06"]["by_type"], {"arrival": 1, "departure": 1})
+        self.assertEqual(summaries["2026-01-05"]["by_auth_mode"], {"DUAL": 1, "FACE_ONLY": 1})
+        self.assertEqual(read_summaries(self.db, "security_alerts", "2026-01-05")["2026-01-05"],
+                         {"total": 1, "by_type": {"QR_FACE_MISMATCH": 1}})
+
+        # Re-running finds nothing left to move and counts nothing twice.
+        self.assertEqual(migrate(self.db)[STREAM]["moved"], 0)
+        self.assertEqual(read_summaries(self.db, STREAM, "2026-01-05", "2026-01-06"), summaries)
+
+    def test_rebuilding_summaries_leaves_today_to_the_gates(self):
+        write_event(self.db, STREAM, "2026-01-05_10-00-00_000001", _event("arrival"))
+        write_event(self.db, STREAM, "2026-01-06_10-00-00_000001", _event("arrival"))
+        self.db.child(f"{STREAM}_daily/2026-01-05/total").set(7)  # drifted (e.g. a replayed journal batch)
+        self.db.child(f"{STREAM}_daily/2026-01-06/total").set(7)  # a live gate's increments in flight
+
+        stats = migrate(self.db, rebuild_summaries=True, today="2026-01-06")
+        self.assertTrue(stats[STREAM]["skipped_today"])
+        self.assertEqual(self.db.child(f"{STREAM}_daily/2026-01-05/total").get(), 1)
+        self.assertEqual(self.db.child(f"{STREAM}_daily/2026-01-06/total").get(), 7)
+
+        migrate(self.db, rebuild_summaries=True, include_today=True, today="2026-01-06")
+        self.assertEqual(self.db.child(f"{STREAM}_daily/2026-01-06/total").get(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
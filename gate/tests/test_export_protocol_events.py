@@ -0,0 +1,160 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+import export_protocol_events as exporter  # noqa: E402
+from event_partitions import iter_event_pages, write_event  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+STREAM = "research_protocol_events"
+
+
+def _key(day, i):
+    return f"{day}_10-00-{i:02d}_000000"
+
+
+def _event(day, i, kind="arrival"):
+    return {"event": kind, "auth_mode": "DUAL", "protocol_config": "hybrid",
+            "timestamp": f"{day} 10:00:{i:02d}", "visitor_id": f"v{i}", "visit_id": f"visit{i}", "ip": "10.0.0.1"}
+
+
+class _CountingRef:
+    """Root ref wrapper that records the size of every read."""
+
+    def __init__(self, ref, reads):
+        self._ref, self._reads = ref, reads
+
+    def child(self, path):
+        return _CountingRef(self._ref.child(path), self._reads)
+
+    def get(self):
+        value = self._ref.get()
+        self._reads.append(len(value) if isinstance(value, dict) else 1)
+        return value
+
+
+class EventPagingTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def setUp(self):
+        self.db = self.gate.InMemoryDBRef({STREAM: {}})
+        for day in ("2026-03-01", "2026-03-02"):
+            for i in range(7):
+                write_event(self.db, STREAM, _key(day, i), _event(day, i))
+
+    def test_pages_follow_key_order_within_the_range(self):
+        pages = list(iter_event_pages(self.db, STREAM, after_key=_key("2026-03-01", 4),
+                                      until_key=_key("2026-03-02", 5), page_size=3))
+        keys = [k for page in pages for k, _ in page]
+        self.assertEqual(keys, [_key("2026-03-01", 5), _key("2026-03-01", 6)]
+                         + [_key("2026-03-02", i) for i in range(6)])
+        self.assertTrue(all(len(page) <= 3 for page in pages))
+
+    def test_skipped_days_are_not_read(self):
+        reads = []
+        list(iter_event_pages(_CountingRef(self.db, reads), STREAM, after_key="2026-03-02", page_size=3))
+        self.assertNotIn(14, reads)  # never the whole stream
+        self.assertEqual(reads[0], 2)  # the day list
+
+
+@unittest.skipIf(exporter.pa is None, "pyarrow not installed")
+class ParquetExportTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        # The database's clock, which stamps written_at.
+        self.server_now = datetime(2026, 3, 1, 10, 1, 0)
+        self.db = self.gate.InMemoryDBRef({STREAM: {}}, clock=lambda: self.server_now.timestamp())
+        for i in range(7):
+            write_event(self.db, STREAM, _key("2026-03-01", i), _event("2026-03-01", i))
+
+    def _write_at(self, server_now, key, entry):
+        self.server_now = server_now
+        write_event(self.db, STREAM, key, entry)
+
+    def test_typed_columns_in_one_row_group_per_page(self):
+        out = os.path.join(self.dir, "events.parquet")
+        stats = exporter.export_events(self.db, out, page_size=3)
+        self.assertEqual((stats["rows"], stats["row_groups"]), (7, 3))
+        parquet = exporter.pq.ParquetFile(out)
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        table = parquet.read()
+        self.assertEqual(table.schema, exporter.export_schema())
+        self.assertEqual(str(table.schema.field("timestamp").type), "timestamp[ms]")
+        row = table.slice(2, 1).to_pylist()[0]
+        self.assertEqual(row["event_key"], _key("2026-03-01", 2))
+        self.assertEqual(row["timestamp"], datetime(2026, 3, 1, 10, 0, 2))
+        self.assertEqual((row["auth_mode"], row["protocol_config"], row["reason"]), ("DUAL", "hybrid", None))
+
+        arrow_out = os.path.join(self.dir, "events.arrow")
+        exporter.export_events(self.db, arrow_out, fmt="arrow", page_size=3)
+        with exporter.pa.OSFile(arrow_out, "rb") as fh:
+            self.assertEqual(exporter.pa.ipc.open_file(fh).read_all().num_rows, 7)
+
+    def test_checkpoint_exports_only_new_settled_events(self):
+        checkpoint = os.path.join(self.dir, "checkpoint.json")
+        now = datetime(2026, 3, 1, 12, 0, 0)
+        first = exporter.export_since_checkpoint(self.db, checkpoint, out_dir=self.dir, now=now, page_size=4)
+        self.assertEqual(first["rows"], 7)
+        self.assertEqual(exporter.load_checkpoint(checkpoint)["last_key"], _key("2026-03-01", 6))
+
+        self.assertEqual(exporter.export_since_checkpoint(self.db, checkpoint, out_dir=self.dir, now=now)["rows"], 0)
+
+        self._write_at(datetime(2026, 3, 1, 11, 0, 1), "2026-03-01_11-00-00_000000",
+                       _event("2026-03-01", 8, "departure"))
+        self._write_at(datetime(2026, 3, 1, 11, 58, 1), "2026-03-01_11-58-00_000000",
+                       _event("2026-03-01", 9))  # not settled yet
+        second = exporter.export_since_checkpoint(self.db, checkpoint, out_dir=self.dir, now=now)
+        self.assertEqual(second["rows"], 1)
+        self.assertNotEqual(second["path"], first["path"])
+        self.assertEqual(exporter.pq.read_table(second["path"]).column("event").to_pylist(), ["departure"])
+        self.assertEqual(exporter.load_checkpoint(checkpoint)["exported_rows"], 8)
+        self.assertFalse([f for f in os.listdir(self.dir) if f.endswith(".tmp")])
+
+    def test_events_the_journal_delivers_late_are_exported_by_the_next_run(self):
+        checkpoint = os.path.join(self.dir, "checkpoint.json")
+        exporter.export_since_checkpoint(self.db, checkpoint, out_dir=self.dir, now=datetime(2026, 3, 1, 12, 0, 0))
+        self.assertEqual(exporter.load_checkpoint(checkpoint)["last_key"], _key("2026-03-01", 6))
+
+        # A gate's journal flushes after an outage: old keys, late writes.
+        self._write_at(datetime(2026, 3, 1, 12, 30, 0), "2026-03-01_09-30-00_000000",
+                       _event("2026-03-01", 30, "departure"))
+        self._write_at(datetime(2026, 3, 1, 12, 38, 0), "2026-03-01_09-38-00_000000",
+                       _event("2026-03-01", 38))  # written inside the settle window
+        self._write_at(datetime(2026, 3, 1, 12, 20, 0), "2026-03-01_11-40-00_000000",
+                       _event("2026-03-01", 40))
+
+        second = exporter.export_since_checkpoint(self.db, checkpoint, out_dir=self.dir,
+                                                  now=datetime(2026, 3, 1, 12, 40, 0))
+        self.assertEqual((second["rows"], second["late_rows"]), (2, 1))
+        self.assertEqual(sorted(exporter.pq.read_table(second["path"]).column("event_key").to_pylist()),
+                         ["2026-03-01_09-30-00_000000", "2026-03-01_11-40-00_000000"])
+        self.assertEqual(exporter.load_checkpoint(checkpoint)["last_key"], "2026-03-01_11-40-00_000000")
+
+        third = exporter.export_since_checkpoint(self.db, checkpoint, out_dir=self.dir,
+                                                 now=datetime(2026, 3, 1, 12, 50, 0))
+        self.assertEqual((third["rows"], third["late_rows"]), (1, 1))
+        self.assertEqual(exporter.pq.read_table(third["path"]).column("event_key").to_pylist(),
+                         ["2026-03-01_09-38-00_000000"])
+        self.assertEqual(exporter.load_checkpoint(checkpoint)["exported_rows"], 10)
+        fourth = exporter.export_since_checkpoint(self.db, checkpoint, out_dir=self.dir,
+                                                  now=datetime(2026, 3, 1, 13, 0, 0))
+        self.assertEqual(fourth["rows"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
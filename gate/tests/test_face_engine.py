@@ -0,0 +1,297 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(_REPO_ROOT))
+
+from face_engine import FaceEngine, FaceEngineResult, FaceTrack  # noqa: E402
+from frame_upload import JpegSource  # noqa: E402
+from stage_order import AdaptiveStageOrder  # noqa: E402
+
+
+class _Cascade:
+    def __init__(self, rects=(), delay=0.0):
+        self.rects = np.array(rects, dtype=np.int32).reshape(-1, 4)
+        self.delay = delay
+        self.calls = 0
+
+    def detectMultiScale(self, gray, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.rects
+
+
+class _Rect:
+    def __init__(self, l, t, r, b):
+        self._l, self._t, self._r, self._b = l, t, r, b
+
+    def left(self):
+        return self._l
+
+    def top(self):
+        return self._t
+
+    def right(self):
+        return self._r
+
+    def bottom(self):
+        return self._b
+
+
+class _Hog:
+    def __init__(self, faces=(), delay=0.0):
+        self.faces = [_Rect(*f) for f in faces]
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, img, upsample):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.faces
+
+
+class _YuNet:
+    def __init__(self, dets):
+        self.dets = np.array(dets, dtype=np.float32).reshape(-1, 15) if dets else None
+        self.sizes = []
+
+    def setInputSize(self, size):
+        self.sizes.append(size)
+
+    def detect(self, img):
+        return 1, self.dets
+
+
+def _yunet_row(x, y, w, h, score):
+    return [x, y, w, h] + [0.0] * 10 + [score]
+
+
+class _Predictor:
+    def __init__(self):
+        self.rects = []
+
+    def __call__(self, rgb, rect):
+        self.rects.append(rect)
+        return "shape"
+
+
+class _Recognizer:
+    def __init__(self):
+        self.calls = 0
+
+    def compute_face_descriptor(self, rgb, shape):
+        self.calls += 1
+        return [0.1] * 128
+
+
+class FaceEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.predictor = _Predictor()
+        self.recognizer = _Recognizer()
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def _engine(self, **kwargs):
+        kwargs.setdefault("rectangle", lambda *box: box)
+        return FaceEngine(self.predictor, self.recognizer, **kwargs)
+
+    def test_primary_hit_computes_one_descriptor(self):
+        hog = _Hog()
+        engine = self._engine(cascade=_Cascade([(100, 80, 120, 120), (10, 10, 40, 40)]), hog_detector=hog)
+        result = engine.embed(self.frame)
+        self.assertEqual(result.stage, "haar")
+        self.assertEqual(result.box, (100, 80, 120, 120))
+        self.assertEqual(self.predictor.rects, [(100, 80, 220, 200)])
+        self.assertEqual(self.recognizer.calls, 1)
+        self.assertEqual(hog.calls, 0)
+        self.assertEqual([t["stage"] for t in result.timings], ["haar", "embed"])
+        self.assertEqual(result.embedding.shape, (128,))
+
+    def test_fallback_box_is_mapped_back_to_original_pixels(self):
+        big = np.zeros((960, 1280, 3), dtype=np.uint8)  # working frame is half size
+        engine = self._engine(cascade=_Cascade(), hog_detector=_Hog([(50, 40, 150, 140)]))
+        result = engine.embed(big)
+        self.assertEqual(result.stage, "hog")
+        self.assertEqual(result.box, (100, 80, 200, 200))
+        self.assertEqual(self.recognizer.calls, 1)
+
+    def test_fallbacks_stop_when_budget_is_spent(self):
+        hog = _Hog(delay=0.05)
+        engine = self._engine(cascade=_Cascade(delay=0.05), hog_detector=hog, budget_ms=20)
+        result = engine.embed(self.frame)
+        self.assertIsNone(result.embedding)
+        self.assertTrue(result.budget_exhausted)
+        # Primary stage always runs; nothing after it fits in a 20 ms budget.
+        self.assertEqual([t["stage"] for t in result.timings], ["haar"])
+        self.assertEqual(hog.calls, 0)
+        self.assertEqual(self.recognizer.calls, 0)
+
+    def test_no_face_runs_each_stage_once(self):
+        cascade, hog = _Cascade(), _Hog()
+        result = self._engine(cascade=cascade, hog_detector=hog, budget_ms=10_000).embed(self.frame)
+        self.assertEqual([t["stage"] for t in result.timings], ["haar", "hog", "haar_eq", "hog_up1"])
+        self.assertEqual(cascade.calls + hog.calls, 4)
+        self.assertFalse(result.budget_exhausted)
+        self.assertIn("hog_up1=", result.summary())
+
+
+    def test_small_face_in_reduced_decode_uses_full_resolution_crop(self):
+        full = np.random.default_rng(0).integers(60, 200, (960, 1280, 3), dtype=np.uint8)
+        source = JpegSource(cv2.imencode(".jpg", full)[1].tobytes(), 2)
+        reduced = np.zeros((480, 640, 3), dtype=np.uint8)
+        seen = []
+        self.recognizer.compute_face_descriptor = lambda rgb, shape: seen.append(rgb.shape) or [0.1] * 128
+
+        self._engine(cascade=_Cascade([(100, 80, 60, 60)])).embed(reduced, source=source)
+        # Box x2 = (200, 160, 120, 120), crop padded by half a box on each side.
+        self.assertEqual(seen[-1], (240, 240, 3))
+        self.assertEqual(self.predictor.rects[-1], (60, 60, 180, 180))
+
+        # Large enough for the 150 px descriptor chip: the reduced frame is used as-is.
+        self._engine(cascade=_Cascade([(100, 80, 200, 200)])).embed(reduced, source=source)
+        self.assertEqual(seen[-1], (480, 640, 3))
+        self.assertEqual(self.predictor.rects[-1], (100, 80, 300, 280))
+
+
+class FaceTrackTests(unittest.TestCase):
+    def setUp(self):
+        self.predictor = _Predictor()
+        self.recognizer = _Recognizer()
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def test_previous_box_seeds_a_single_roi_pass(self):
+        cascade, hog = _Cascade([(60, 60, 120, 120)]), _Hog()
+        engine = FaceEngine(self.predictor, self.recognizer, cascade=cascade, hog_detector=hog,
+                            rectangle=lambda *box: box)
+        # ROI = box padded by half its size: (40, 20)-(280, 260); the detector box is ROI-relative.
+        result = engine.embed(self.frame, hint_box=(100, 80, 120, 120))
+        self.assertEqual(result.stage, "track")
+        self.assertEqual(result.box, (100, 80, 120, 120))
+        self.assertEqual((cascade.calls, hog.calls), (1, 0))
+        self.assertEqual(result.detector_calls, 1)
+
+        # Face gone from the ROI: the full stage list runs after the ROI pass.
+        cascade.rects = np.zeros((0, 4), dtype=np.int32)
+        lost = engine.embed(self.frame, hint_box=(100, 80, 120, 120))
+        self.assertIsNone(lost.box)
+        self.assertEqual([t["stage"] for t in lost.timings], ["track", "haar", "hog", "haar_eq", "hog_up1"])
+
+    def _result(self, box, value, stage="yunet"):
+        result = FaceEngineResult()
+        result.box, result.stage = box, stage
+        result.embedding = None if value is None else np.full(128, value)
+        result.timings = [{"stage": stage, "ms": 1.0, "found": box is not None}]
+        return result
+
+    def test_embeddings_of_the_same_face_are_averaged(self):
+        track = FaceTrack(window=3)
+        track.update(self._result((10, 10, 50, 50), 0.10))
+        avg = track.update(self._result((12, 10, 50, 50), 0.12, stage="track"))
+        self.assertAlmostEqual(float(avg[0]), 0.11)
+        self.assertEqual(track.box, (12, 10, 50, 50))
+
+        # Far from the running mean (norm 0.5 * sqrt(128)): a different face, start over.
+        avg = track.update(self._result((12, 10, 50, 50), 0.60, stage="track"))
+        self.assertAlmostEqual(float(avg[0]), 0.60)
+
+        for _ in range(3):
+            track.update(self._result(None, None))
+        self.assertIsNone(track.box)
+        stats = track.stats()
+        self.assertEqual((stats["frames"], stats["tracked"], stats["detector_calls"]), (6, 2, 6))
+        self.assertEqual(stats["lost"], 2)
+
+
+class QuickCheckTests(unittest.TestCase):
+    def setUp(self):
+        self.predictor = _Predictor()
+        self.recognizer = _Recognizer()
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def _engine(self, dets):
+        yunet = _YuNet(dets)
+        engine = FaceEngine(self.predictor, self.recognizer, yunet=yunet, rectangle=lambda *b: b)
+        return engine, yunet
+
+    def test_single_pass_at_small_size_without_descriptor(self):
+        # 640x480 frame -> 320x240 detector input; centred face 40% of the width.
+        engine, yunet = self._engine([_yunet_row(96, 60, 128, 128, 0.95)])
+        check = engine.quick_check(self.frame)
+        self.assertTrue(check.face_detected)
+        self.assertEqual(yunet.sizes, [(320, 240)])
+        self.assertEqual(check.box, (192, 120, 256, 256))
+        self.assertIsNone(check.hint)
+        self.assertGreater(check.quality, 0.8)
+        self.assertEqual(self.recognizer.calls, 0)
+        self.assertEqual(self.predictor.rects, [])
+        self.assertEqual(check.to_dict()["detector"], "yunet")
+
+    def test_positioning_hints(self):
+        cases = [
+            ([_yunet_row(150, 110, 30, 30, 0.9)], "closer"),
+            ([_yunet_row(0, 0, 260, 230, 0.9)], "back"),
+            ([_yunet_row(0, 90, 100, 100, 0.9)], "Center"),
+            ([_yunet_row(96, 60, 128, 128, 0.5)], "lighting"),
+            ([_yunet_row(96, 60, 128, 128, 0.9), _yunet_row(10, 10, 60, 60, 0.9)], "one person"),
+        ]
+        for dets, expected in cases:
+            check = self._engine(dets)[0].quick_check(self.frame)
+            self.assertTrue(check.face_detected)
+            self.assertIn(expected, check.hint)
+
+    def test_no_face(self):
+        check = self._engine([])[0].quick_check(self.frame)
+        self.assertFalse(check.face_detected)
+        self.assertEqual(check.quality, 0.0)
+
+
+class AdaptiveStageOrderTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "stats.json")
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _engine(self, ordering):
+        # Haar never finds this kiosk's faces; HOG does.
+        return FaceEngine(
+            _Predictor(), _Recognizer(), cascade=_Cascade(delay=0.002),
+            hog_detector=_Hog([(100, 100, 200, 200)]), rectangle=lambda *box: box,
+            budget_ms=10_000, ordering=ordering,
+        )
+
+    def test_default_order_until_measured(self):
+        engine = self._engine(AdaptiveStageOrder())
+        self.assertEqual(engine.stats()["stage_order"], ["haar", "hog", "haar_eq", "hog_up1"])
+
+    def test_learns_to_run_the_successful_stage_first_and_persists(self):
+        ordering = AdaptiveStageOrder(path=self.path, save_every=10)
+        engine = self._engine(ordering)
+        for _ in range(40):
+            engine.embed(self.frame)
+        self.assertEqual(engine.stats()["stage_order"][0], "hog")
+        last = engine.embed(self.frame)
+        self.assertEqual([t["stage"] for t in last.timings], ["hog", "embed"])
+        self.assertIsNotNone(engine.stats()["median_ms_to_embedding"])
+
+        self.assertTrue(ordering.save())
+        restarted = self._engine(AdaptiveStageOrder(path=self.path))
+        self.assertEqual(restarted.stats()["stage_order"][0], "hog")
+
+    def test_unreadable_stats_file_is_ignored(self):
+        with open(self.path, "w", encoding="utf-8") as fh:
+            fh.write("{not json")
+        ordering = AdaptiveStageOrder(path=self.path)
+        self.assertEqual(ordering.snapshot(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
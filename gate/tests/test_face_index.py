@@ -0,0 +1,137 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# face_index.py lives at the repo root; qr_module.py lives in gate/.
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from face_index import FaceIndex, parse_embedding  # noqa: E402
+from embedding_codec import encode_embedding, is_legacy_embedding  # noqa: E402
+from qr_module import find_all_face_matches  # noqa: E402
+
+
+def _emb(seed):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.1, 128)
+
+
+def _record(vec, name="Visitor", blacklisted="no"):
+    return {"basic_info": {
+        "name": name,
+        "blacklisted": blacklisted,
+        "embedding": " ".join(f"{x:.8f}" for x in vec),
+    }}
+
+
+def _reference_matches(live, visitors, threshold):
+    """The original per-visitor loop, kept as the oracle for the vectorised search."""
+    out = []
+    for vid, vdata in visitors.items():
+        stored = np.array([float(x) for x in vdata["basic_info"]["embedding"].split()])
+        dist = float(np.linalg.norm(np.asarray(live).flatten() - stored))
+        if dist <= threshold:
+            out.append((vid, dist))
+    return sorted(out, key=lambda m: m[1])
+
+
+class FaceIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.vecs = {f"v{i}": _emb(i) for i in range(40)}
+        self.visitors = {vid: _record(v, name=vid) for vid, v in self.vecs.items()}
+
+    def test_search_matches_reference_loop(self):
+        index = FaceIndex.from_visitors(self.visitors)
+        live = self.vecs["v7"] + 0.01
+        expected = _reference_matches(live, self.visitors, threshold=1.5)
+        got = index.search(live, threshold=1.5)
+        self.assertEqual([m["visitor_id"] for m in got], [vid for vid, _ in expected])
+        for m, (_, dist) in zip(got, expected):
+            self.assertAlmostEqual(m["distance"], dist, places=5)
+
+    def test_top_k_returns_k_closest(self):
+        index = FaceIndex.from_visitors(self.visitors)
+        live = self.vecs["v3"]
+        got = index.search(live, k=3)
+        self.assertEqual(len(got), 3)
+        self.assertEqual(got[0]["visitor_id"], "v3")
+        full = index.search(live)
+        self.assertEqual([m["visitor_id"] for m in got], [m["visitor_id"] for m in full[:3]])
+
+    def test_incremental_upsert_remove_and_sync(self):
+        index = FaceIndex.from_visitors(self.visitors)
+        self.assertEqual(len(index), 40)
+
+        index.remove("v0")
+        self.assertNotIn("v0", index)
+        self.assertEqual(index.search(self.vecs["v39"], k=1)[0]["visitor_id"], "v39")
+
+        index.upsert("v5", _record(self.vecs["v5"], name="v5", blacklisted="yes"))
+        self.assertTrue(index.search(self.vecs["v5"], k=1)[0]["blacklisted"])
+
+        changed = index.sync(self.visitors)
+        # v0 re-added, v5 blacklist flag reverted; nothing else re-parsed.
+        self.assertEqual(changed, 2)
+        self.assertEqual(len(index), 40)
+        self.assertEqual(index.sync(self.visitors), 0)
+
+    def test_unusable_embeddings_are_skipped(self):
+        visitors = dict(self.visitors)
+        visitors["bad_len"] = {"basic_info": {"embedding": "0.1 0.2 0.3"}}
+        visitors["bad_text"] = {"basic_info": {"embedding": "x " * 128}}
+        visitors["no_emb"] = {"basic_info": {"name": "No face"}}
+        visitors["not_dict"] = "junk"
+        index = FaceIndex.from_visitors(visitors)
+        self.assertEqual(len(index), 40)
+        self.assertIsNone(parse_embedding("0.1 0.2"))
+
+    def test_match_reports_best_distance_and_twin_gap_from_one_pass(self):
+        visitors = dict(self.visitors)
+        visitors["v5"] = _record(self.vecs["v5"], name="v5", blacklisted="yes")
+        index = FaceIndex.from_visitors(visitors)
+        live = self.vecs["v9"] + 0.5  # far from everyone
+        result = index.match(live, threshold=0.1, k=3)
+        self.assertEqual(list(result), [])
+        self.assertEqual(result.scanned, 40)
+        self.assertEqual(len(result.candidates), 3)
+        expected = _reference_matches(live, visitors, threshold=99)
+        self.assertAlmostEqual(result.best_distance, expected[0][1], places=5)
+        self.assertAlmostEqual(result.twin_gap, expected[1][1] - expected[0][1], places=5)
+        self.assertEqual(result.best_blacklisted["visitor_id"], "v5")
+        self.assertGreaterEqual(result.elapsed_ms, 0.0)
+
+    def test_match_on_empty_index(self):
+        result = FaceIndex().match(self.vecs["v1"], threshold=0.6)
+        self.assertEqual(result.best_distance, 999.0)
+        self.assertIsNone(result.best)
+        self.assertEqual(result.twin_gap, float("inf"))
+
+    def test_compact_and_legacy_embeddings_decode_identically(self):
+        vec = self.vecs["v2"]
+        encoded = encode_embedding(vec)
+        self.assertFalse(is_legacy_embedding(encoded))
+        self.assertTrue(is_legacy_embedding(self.visitors["v2"]["basic_info"]["embedding"]))
+        self.assertLess(len(encoded), len(self.visitors["v2"]["basic_info"]["embedding"]) / 2)
+        np.testing.assert_array_equal(parse_embedding(encoded), vec.astype(np.float32))
+        self.assertIsNone(parse_embedding("f32v1:not-base64!"))
+        self.assertIsNone(parse_embedding(encode_embedding(vec[:64])))
+
+        mixed = dict(self.visitors)
+        mixed["v2"] = {"basic_info": {"name": "v2", "embedding": encoded}}
+        got = FaceIndex.from_visitors(mixed).search(vec, k=1)
+        self.assertEqual(got[0]["visitor_id"], "v2")
+        self.assertLess(got[0]["distance"], 1e-6)
+
+    def test_find_all_face_matches_accepts_dict_or_index(self):
+        live = self.vecs["v11"]
+        from_dict = find_all_face_matches(live, self.visitors, threshold=0.6)
+        from_index = find_all_face_matches(live, FaceIndex.from_visitors(self.visitors), threshold=0.6)
+        self.assertEqual(from_dict, from_index)
+        self.assertEqual(from_dict[0]["visitor_id"], "v11")
+
+
+if __name__ == "__main__":
+    unittest.main()
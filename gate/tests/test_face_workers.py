@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(_REPO_ROOT))
+
+from face_workers import FaceWorkerPool, FaceWorkerPoolBusy  # noqa: E402
+from stage_order import AdaptiveStageOrder  # noqa: E402
+
+
+class _Result:
+    def __init__(self, embedding, found):
+        self.embedding = embedding
+        self.timings = [{"stage": "fake", "ms": 1.0, "found": found}]
+        self.elapsed_ms = 1.0
+
+
+class _FakeEngine:
+    """Stands in for FaceEngine in worker processes (no dlib here): embedding = frame mean."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def embed(self, frame):
+        time.sleep(self.delay)
+        mean = float(frame.mean())
+        if mean == 0:
+            return _Result(None, False)
+        return _Result(np.full(128, mean), True)
+
+
+def make_fake_engine(delay=0.0):
+    return _FakeEngine(delay)
+
+
+class FaceWorkerPoolTests(unittest.TestCase):
+    def test_frames_round_trip_through_shared_memory(self):
+        ordering = AdaptiveStageOrder()
+        pool = FaceWorkerPool(2, make_fake_engine, ordering=ordering, result_timeout=60)
+        try:
+            frame = np.full((240, 320, 3), 7, dtype=np.uint8)
+            emb = pool.embed(frame)
+            self.assertEqual(emb.shape, (128,))
+            self.assertAlmostEqual(float(emb[0]), 7.0)
+            self.assertIsNone(pool.embed(np.zeros((240, 320, 3), dtype=np.uint8)))
+
+            stats = pool.stats()
+            self.assertEqual(stats["completed"], 2)
+            self.assertEqual(stats["in_flight"], 0)
+            self.assertEqual(stats["queue_depth"], 0)
+            # Worker stage timings are folded into the app's ordering.
+            self.assertEqual(ordering.snapshot()["fake"]["attempts"], 2)
+        finally:
+            pool.shutdown()
+
+    def test_saturated_pool_rejects_instead_of_queueing(self):
+        pool = FaceWorkerPool(
+            1, make_fake_engine, factory_kwargs={"delay": 0.5},
+            max_pending=1, submit_timeout=0.05, result_timeout=60,
+        ).start()
+        frame = np.full((32, 32, 3), 1, dtype=np.uint8)
+        try:
+            pool.embed(frame)  # warm-up: worker spawned and models "loaded"
+            worker = threading.Thread(target=pool.embed, args=(frame,))
+            worker.start()
+            time.sleep(0.1)
+            self.assertEqual(pool.stats()["in_flight"], 1)
+            with self.assertRaises(FaceWorkerPoolBusy):
+                pool.embed(frame)
+            worker.join()
+            self.assertEqual(pool.stats()["rejected"], 1)
+        finally:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
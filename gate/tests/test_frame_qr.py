@@ -0,0 +1,110 @@
+import json
+import sys
+import unittest
+import unittest.mock
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from frame_upload import decode_frame_reduced  # noqa: E402
+from qr_module import decode_qr_from_frame  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+
+def _frame_with_qr(payload, module_px=6, size=(480, 640), seed=0):
+    """Gradient + sensor noise frame with a QR (plus quiet zone) pasted in the upper right."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(40, 200, size[1], dtype=np.float32)
+    y = np.linspace(0, 40, size[0], dtype=np.float32)[:, None]
+    base = (x[None, :] + y)[..., None].repeat(3, axis=2)
+    frame = np.clip(base + rng.normal(0, 10, size + (3,)), 0, 255).astype(np.uint8)
+    if payload:
+        qr = cv2.QRCodeEncoder.create().encode(payload)
+        qr = cv2.copyMakeBorder(qr, 4, 4, 4, 4, cv2.BORDER_CONSTANT, value=255)
+        qr = cv2.resize(qr, (qr.shape[1] * module_px, qr.shape[0] * module_px), interpolation=cv2.INTER_NEAREST)
+        h, w = qr.shape
+        frame[10:10 + h, size[1] - w - 10:size[1] - 10] = cv2.cvtColor(qr, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+def _jpeg(frame):
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+PAYLOAD = json.dumps({"v": "visitor_x", "i": "visit_x", "k": "unknown_token_32bytes_url_safe_xxxxxxxxxx",
+                      "e": "2099-01-01 00:00:00"}, separators=(",", ":"))
+
+
+class DecodeQrFromFrameTests(unittest.TestCase):
+    def test_reads_qr_and_ignores_frames_without_one(self):
+        self.assertEqual(decode_qr_from_frame(_frame_with_qr(PAYLOAD)), PAYLOAD)
+        self.assertIsNone(decode_qr_from_frame(_frame_with_qr("")))
+        self.assertIsNone(decode_qr_from_frame(None))
+
+    def test_small_qr_in_reduced_decode_is_read_from_full_resolution(self):
+        frame = np.full((1080, 1920, 3), 128, dtype=np.uint8)
+        qr = _frame_with_qr(PAYLOAD, module_px=5, size=(300, 300))
+        frame[100:400, 1200:1500] = qr
+        reduced, source = decode_frame_reduced(_jpeg(frame), 640)
+        self.assertEqual(source.factor, 2)
+        self.assertIsNone(decode_qr_from_frame(reduced))
+        self.assertEqual(decode_qr_from_frame(reduced, source=source), PAYLOAD)
+
+
+class SingleFrameCheckinTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        visit_ref.update({"status": "approved", "visit_approved": True})
+        self.qr_payload = visit_ref.get()["qr_payload"]
+
+    def _post(self, frame, **fields):
+        return self.client.post("/checkin_verify_and_log", data=_jpeg(frame), content_type="image/jpeg",
+                                query_string={"action": "checkin", **fields}).get_json()
+
+    def test_qr_and_face_from_one_frame(self):
+        fake_matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        with unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=fake_matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128) as embed, \
+             unittest.mock.patch.object(self.gate, "validate_qr_token", wraps=self.gate.validate_qr_token) as validate:
+            body = self._post(_frame_with_qr(self.qr_payload))
+        self.assertEqual(body["status"], "granted")
+        self.assertEqual(body["qr_source"], "frame")
+        self.assertEqual(embed.call_count, 1)
+        self.assertEqual(validate.call_args[0][0]["i"], "visit_demo_1")
+        visit = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1").get()
+        self.assertEqual(visit["status"], "checked_in")
+
+    def test_foreign_qr_in_frame_is_denied(self):
+        with unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128):
+            body = self._post(_frame_with_qr(PAYLOAD, seed=1), kiosk_id="foreign")
+        self.assertEqual(body["status"], "denied")
+        self.assertTrue(body["rescan_qr"])
+        self.assertEqual(body["qr_source"], "frame")
+
+    def test_frame_without_qr_falls_back_to_face_only(self):
+        with unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=None) as embed:
+            body = self._post(_frame_with_qr("", seed=2), kiosk_id="no-qr")
+        self.assertEqual(body["status"], "waiting")
+        self.assertNotIn("qr_source", body)
+        embed.assert_called_once()
+
+    def test_explicit_qr_data_skips_frame_decode(self):
+        with unittest.mock.patch.object(self.gate, "decode_qr_from_frame") as decode, \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=None):
+            self._post(_frame_with_qr(PAYLOAD, seed=3), qr_data=self.qr_payload, kiosk_id="explicit")
+        decode.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
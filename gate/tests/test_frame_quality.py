@@ -0,0 +1,96 @@
+import base64
+import sys
+import unittest
+import unittest.mock
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from frame_quality import FrameQualityGate  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+
+def _textured(seed=0, lo=60, hi=200, size=(240, 320)):
+    return np.random.default_rng(seed).integers(lo, hi, size + (3,), dtype=np.uint8)
+
+
+def _bands():
+    frame = np.full((240, 320, 3), 60, dtype=np.uint8)
+    frame[:, 80:160] = 200
+    frame[:, 240:] = 200
+    return frame
+
+
+class FrameQualityGateTests(unittest.TestCase):
+    def setUp(self):
+        self.gate = FrameQualityGate()
+
+    def test_rejections_by_reason(self):
+        cases = {
+            "too_dark": np.full((240, 320, 3), 10, dtype=np.uint8),
+            "too_bright": np.full((240, 320, 3), 250, dtype=np.uint8),
+            "low_contrast": np.full((240, 320, 3), 128, dtype=np.uint8),
+            "blurry": cv2.GaussianBlur(_bands(), (0, 0), 10),
+        }
+        for reason, frame in cases.items():
+            verdict = self.gate.assess(frame)
+            self.assertFalse(verdict.ok, reason)
+            self.assertEqual(verdict.reason, reason)
+            self.assertTrue(verdict.hint)
+        self.assertTrue(self.gate.assess(_textured()).ok)
+        stats = self.gate.stats()
+        self.assertEqual(stats["checked"], 5)
+        self.assertEqual(stats["passed"], 1)
+        self.assertEqual(stats["rejected"]["blurry"], 1)
+
+    def test_motion_and_unchanged_are_per_kiosk(self):
+        scene = (_bands() // 2 + _textured(1, 0, 100)).astype(np.uint8)
+        shifted = np.roll(scene, 80, axis=1)
+        self.assertTrue(self.gate.assess(scene, kiosk_id="k1").ok)
+        self.assertEqual(self.gate.assess(shifted, kiosk_id="k1").reason, "motion")
+        # Another kiosk has no history, so no motion verdict.
+        self.assertTrue(self.gate.assess(shifted, kiosk_id="k2").ok)
+
+        # Same scene again after the detector found no face: retried by default...
+        self.gate.record_outcome("k2", False)
+        self.assertTrue(self.gate.assess(shifted, kiosk_id="k2").ok)
+
+        # ...skipped only when opted in, and not forever.
+        gate = FrameQualityGate(recheck_every=5)
+        gate.assess(shifted, kiosk_id="k2")
+        gate.record_outcome("k2", False)
+        verdict = gate.assess(shifted, kiosk_id="k2")
+        self.assertEqual(verdict.reason, "unchanged")
+        self.assertNotIn("Step in front", verdict.hint)
+        reasons = [gate.assess(shifted, kiosk_id="k2").reason for _ in range(4)]
+        self.assertIn(None, reasons)
+
+
+class GateFrameQualityWiringTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+
+    def test_dark_frame_never_reaches_the_face_pipeline(self):
+        ok, buf = cv2.imencode(".jpg", np.full((120, 160, 3), 5, dtype=np.uint8))
+        data_url = "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode("ascii")
+        with unittest.mock.patch.object(self.gate, "get_face_embedding") as embed:
+            resp = self.client.post("/checkin_verify_and_log", json={"image": data_url, "kiosk_id": "dark"})
+        body = resp.get_json()
+        self.assertEqual(body["status"], "waiting")
+        self.assertEqual(body["quality_reason"], "too_dark")
+        embed.assert_not_called()
+        self.assertGreaterEqual(self.gate.frame_quality.stats()["rejected"]["too_dark"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import base64
+import io
+import sys
+import unittest
+import unittest.mock
+from pathlib import Path
+
+import cv2
+import numpy as np
+from flask import Flask
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from frame_upload import (  # noqa: E402
+    FrameUploadError,
+    decode_frame,
+    decode_frame_reduced,
+    jpeg_size,
+    read_frame_upload,
+    reduction_factor,
+)
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+
+def _jpeg_bytes():
+    img = np.random.default_rng(0).integers(60, 200, (64, 64, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+class ReadFrameUploadTests(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.jpeg = _jpeg_bytes()
+
+    def test_json_multipart_and_raw_yield_the_same_frame(self):
+        data_url = "data:image/jpeg;base64," + base64.b64encode(self.jpeg).decode("ascii")
+        requests = [
+            {"json": {"image": data_url, "action": "checkin"}},
+            {"data": {"image": (io.BytesIO(self.jpeg), "frame.jpg"), "action": "checkin"},
+             "content_type": "multipart/form-data"},
+            {"data": self.jpeg, "content_type": "image/jpeg", "query_string": {"action": "checkin"}},
+        ]
+        for kwargs in requests:
+            with self.app.test_request_context("/", method="POST", **kwargs) as ctx:
+                fields, frame_bytes = read_frame_upload(ctx.request)
+            self.assertEqual(fields, {"action": "checkin"})
+            self.assertEqual(frame_bytes, self.jpeg)
+            self.assertEqual(decode_frame(frame_bytes).shape, (64, 64, 3))
+
+    def test_missing_and_malformed_frames(self):
+        with self.app.test_request_context("/", method="POST", json={"qr_data": "x"}) as ctx:
+            self.assertEqual(read_frame_upload(ctx.request), ({"qr_data": "x"}, None))
+        with self.app.test_request_context("/", method="POST", json={"image": "no-comma"}) as ctx:
+            with self.assertRaises(FrameUploadError):
+                read_frame_upload(ctx.request)
+        with self.app.test_request_context("/", method="POST", data=b"", content_type="image/jpeg") as ctx:
+            self.assertEqual(read_frame_upload(ctx.request), ({}, None))
+        self.assertIsNone(decode_frame(b"not a jpeg"))
+
+
+class ReducedDecodeTests(unittest.TestCase):
+    def test_factor_keeps_long_side_above_target(self):
+        self.assertEqual(reduction_factor(1920, 1080, 640), 2)
+        self.assertEqual(reduction_factor(3840, 2160, 640), 4)
+        self.assertEqual(reduction_factor(1920, 1080, 320), 4)
+        self.assertEqual(reduction_factor(640, 480, 640), 1)
+        self.assertEqual(reduction_factor(8000, 6000, 320), 8)
+
+    def test_large_jpeg_is_decoded_reduced_with_a_source(self):
+        img = np.random.default_rng(0).integers(60, 200, (1080, 1920, 3), dtype=np.uint8)
+        jpeg = cv2.imencode(".jpg", img)[1].tobytes()
+        self.assertEqual(jpeg_size(jpeg), (1920, 1080))
+        reduced, source = decode_frame_reduced(jpeg, 640)
+        self.assertEqual(reduced.shape, (540, 960, 3))
+        self.assertEqual(source.factor, 2)
+        crop, x0, y0, scale = source.crop((100, 100, 40, 40))
+        self.assertEqual((x0, y0, scale), (160, 160, 1))
+        self.assertEqual(crop.shape, (160, 160, 3))
+
+    def test_crop_decodes_at_the_coarsest_scale_that_keeps_min_side(self):
+        img = np.random.default_rng(0).integers(60, 200, (2160, 3840, 3), dtype=np.uint8)
+        reduced, source = decode_frame_reduced(cv2.imencode(".jpg", img)[1].tobytes(), 640)
+        self.assertEqual((reduced.shape, source.factor), ((540, 960, 3), 4))
+        # 100 px box -> 400 px at full resolution: 200 px at 1/2 still covers 150.
+        crop, x0, y0, scale = source.crop((100, 100, 100, 100), min_side=150)
+        self.assertEqual((x0, y0, scale, crop.shape), (100, 100, 2, (400, 400, 3)))
+        # 30 px box -> 120 px at full resolution: nothing coarser than full resolution will do.
+        self.assertEqual(source.crop((100, 100, 30, 30), min_side=150)[3], 1)
+
+    def test_small_or_non_jpeg_frames_decode_as_is(self):
+        small = _jpeg_bytes()
+        self.assertEqual(decode_frame_reduced(small, 640)[0].shape, (64, 64, 3))
+        self.assertIsNone(decode_frame_reduced(small, 640)[1])
+        png = cv2.imencode(".png", np.zeros((1080, 1920, 3), dtype=np.uint8))[1].tobytes()
+        self.assertIsNone(jpeg_size(png))
+        self.assertEqual(decode_frame_reduced(png, 640)[0].shape, (1080, 1920, 3))
+        self.assertEqual(decode_frame_reduced(b"garbage", 640), (None, None))
+
+
+class GateBinaryUploadTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+
+    def _approved_qr(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        visit_ref.update({"status": "approved", "visit_approved": True})
+        return visit_ref.get()["qr_payload"]
+
+    def test_multipart_and_raw_checkin(self):
+        fake_matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        with unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=fake_matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128) as embed:
+            resp = self.client.post("/checkin_verify_and_log", data={
+                "image": (io.BytesIO(_jpeg_bytes()), "frame.jpg"),
+                "qr_data": self._approved_qr(),
+                "action": "checkin",
+            }, content_type="multipart/form-data")
+            self.assertEqual(resp.get_json()["status"], "granted")
+            self.assertEqual(embed.call_args[0][0].shape, (64, 64, 3))
+
+            resp = self.client.post(
+                "/checkin_verify_and_log", data=_jpeg_bytes(), content_type="image/jpeg",
+                query_string={"qr_data": self._approved_qr(), "action": "checkin"},
+            )
+            self.assertEqual(resp.get_json()["status"], "granted")
+
+    def test_raw_body_that_is_not_an_image(self):
+        resp = self.client.post("/checkin_verify_and_log", data=b"garbage", content_type="image/jpeg")
+        self.assertEqual(resp.get_json()["message"], "Unable to decode image.")
+        resp = self.client.post("/api/check_face", data=b"", content_type="image/jpeg")
+        self.assertEqual(resp.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
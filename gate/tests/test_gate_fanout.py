@@ -0,0 +1,135 @@
+import sys
+import threading
+import unittest
+import unittest.mock
+from datetime import date
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from gate_fanout import GateFanout  # noqa: E402
+from event_partitions import read_events  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+
+def _jpeg(seed=0):
+    img = np.random.default_rng(seed).integers(60, 200, (120, 160, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+class GateFanoutTests(unittest.TestCase):
+    def setUp(self):
+        self.fanout = GateFanout(max_workers=1)
+        self.addCleanup(self.fanout.shutdown, True)
+
+    def test_cancel_queued_and_running_tasks(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow(cancelled):
+            started.set()
+            release.wait(5)
+            return "stopped" if cancelled.is_set() else "done"
+
+        running = self.fanout.submit(slow, cancellable=True)
+        queued = self.fanout.submit(lambda: "never")
+        self.assertTrue(started.wait(5))
+        self.assertTrue(queued.cancel())
+        self.assertTrue(running.cancel())
+        release.set()
+        self.assertEqual(running.result(5), "stopped")
+        self.assertFalse(running.cancel())  # already finished
+        stats = self.fanout.stats()
+        self.assertEqual(stats["submitted"], 2)
+        self.assertEqual(stats["cancelled_before_start"], 1)
+        self.assertEqual(stats["cancelled_running"], 1)
+
+
+class ParallelGateDecisionTests(unittest.TestCase):
+    """The docs/TEST_PLAN.md gate outcomes are the same with and without GATE_PARALLEL."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        self.visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        self.visit_ref.update({"status": "approved", "visit_approved": True})
+        self.qr_payload = self.visit_ref.get()["qr_payload"]
+
+    def _post(self, qr_data, seed=0, kiosk_id="fanout"):
+        return self.client.post("/checkin_verify_and_log", data=_jpeg(seed), content_type="image/jpeg",
+                                query_string={"qr_data": qr_data, "action": "checkin",
+                                              "kiosk_id": kiosk_id}).get_json()
+
+    def test_bad_qr_cancels_face_work_and_writes_nothing(self):
+        # TEST_PLAN 5.3: invalid QR denied, visit status not modified.
+        release, finished = threading.Event(), threading.Event()
+        outcome = []
+        real_frame_embedding = self.gate.frame_embedding
+        real_denied = self.gate.qr_denied_response
+
+        def held_screen(cv2_img, kiosk_id):
+            release.wait(5)  # face task parked until the request has decided
+            return None
+
+        def recording_frame_embedding(*args, **kwargs):
+            outcome.append(real_frame_embedding(*args, **kwargs))
+            finished.set()
+            return outcome[-1]
+
+        def denied_then_release(msg):
+            release.set()
+            return real_denied(msg)
+
+        forged = self.qr_payload.replace(self.gate.DEMO_QR_FIXED_TOKEN, "forged_token")
+        with unittest.mock.patch.object(self.gate, "screen_frame", side_effect=held_screen), \
+             unittest.mock.patch.object(self.gate, "frame_embedding", side_effect=recording_frame_embedding), \
+             unittest.mock.patch.object(self.gate, "qr_denied_response", side_effect=denied_then_release), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128) as embed:
+            body = self._post(forged)
+            self.assertTrue(finished.wait(5))
+        self.assertEqual(body["status"], "denied")
+        self.assertTrue(body["rescan_qr"])
+        embed.assert_not_called()
+        self.assertEqual(outcome[0][1]["message"], "Cancelled.")
+        self.assertEqual(self.visit_ref.get()["status"], "approved")
+        self.assertFalse(self.gate.db_ref.child("security_alerts").get())
+
+    def test_qr_face_mismatch_is_identical_sequential_and_parallel(self):
+        # TEST_PLAN 5.1: right face, wrong QR → denial + QR_FACE_MISMATCH alert.
+        other_face = [{"visitor_id": "visitor_demo_2", "distance": 0.30, "name": "Diya", "blacklisted": False}]
+        bodies = []
+        for parallel in (False, True):
+            self.setUp()
+            with unittest.mock.patch.object(self.gate, "GATE_PARALLEL", parallel), \
+                 unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=other_face), \
+                 unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128):
+                bodies.append(self._post(self.qr_payload, seed=int(parallel)))
+            alerts = read_events(self.gate.db_ref, "security_alerts", date.today())
+            self.assertEqual([a["alert_type"] for _, _, a in alerts], ["QR_FACE_MISMATCH"])
+            self.assertEqual(self.visit_ref.get()["status"], "approved")
+        self.assertEqual(bodies[0], bodies[1])
+        self.assertEqual(bodies[0]["status"], "denied")
+
+    def test_visitor_record_is_prefetched_once(self):
+        # TEST_PLAN 1.4: check-in granted, visit → checked_in.
+        matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        with unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128), \
+             unittest.mock.patch.object(self.gate, "read_reference", wraps=self.gate.read_reference) as reads:
+            body = self._post(self.qr_payload)
+        self.assertEqual(body["status"], "granted")
+        self.assertEqual(self.visit_ref.get()["status"], "checked_in")
+        visitor_reads = [c for c in reads.call_args_list if c.args == ("visitors/visitor_demo_1",)]
+        self.assertEqual(len(visitor_reads), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
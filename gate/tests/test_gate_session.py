@@ -0,0 +1,112 @@
+import sys
+import unittest
+import unittest.mock
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from face_engine import FaceEngine  # noqa: E402
+from gate_session import GateSessionStore  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+from test_face_engine import _Cascade, _Hog, _Predictor, _Recognizer  # noqa: E402
+
+
+def _jpeg_bytes(seed=0):
+    img = np.random.default_rng(seed).integers(60, 200, (64, 64, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+class GateSessionStoreTests(unittest.TestCase):
+    def test_terminal_decision_and_rescan_close_the_session(self):
+        store = GateSessionStore()
+        s = store.open("k1", "1.2.3.4", "checkin", "qr", (True, "v", "visit", {}, None))
+        store.record(s, "waiting")
+        self.assertIs(store.get(s.session_id), s)
+        store.record(s, "granted")
+        self.assertIsNone(store.get(s.session_id))
+        stats = store.stats()
+        self.assertEqual((stats["frames"], stats["decided"], stats["frames_per_decision"]), (2, 1, 2.0))
+
+    def test_one_session_per_kiosk_and_idle_expiry(self):
+        store = GateSessionStore(ttl_seconds=60)
+        first = store.open("k1", "ip", "checkin", None, (False, None, None, None, None))
+        second = store.open("k1", "ip", "checkin", None, (False, None, None, None, None))
+        self.assertIsNone(store.get(first.session_id))
+        second.last_seen -= 61
+        self.assertIsNone(store.get(second.session_id))
+        self.assertEqual(store.stats()["expired"], 1)
+
+
+class GateSessionEndpointTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        visit_ref.update({"status": "approved", "visit_approved": True})
+        self.qr_payload = visit_ref.get()["qr_payload"]
+
+    def _frame(self, session_id, seed=0):
+        # A new frame each time: an identical no-face frame is skipped by the quality gate.
+        return self.client.post(f"/gate/session/{session_id}/frame", data=_jpeg_bytes(seed), content_type="image/jpeg")
+
+    def test_qr_validated_once_then_frames_only_matched(self):
+        fake_matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        with unittest.mock.patch.object(self.gate, "validate_qr_token", wraps=self.gate.validate_qr_token) as validate, \
+             unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=fake_matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", side_effect=[None, None, [0.01] * 128]):
+            opened = self.client.post("/gate/session", json={
+                "qr_data": self.qr_payload, "action": "checkin", "kiosk_id": "k-session",
+            }).get_json()
+            self.assertEqual(opened["status"], "open")
+            self.assertTrue(opened["has_qr"])
+            sid = opened["session_id"]
+
+            statuses = [self._frame(sid, seed).get_json()["status"] for seed in range(3)]
+        self.assertEqual(statuses, ["waiting", "waiting", "granted"])
+        self.assertEqual(validate.call_count, 1)
+
+        # The decision closed the session.
+        resp = self._frame(sid)
+        self.assertEqual(resp.status_code, 404)
+        self.assertTrue(resp.get_json()["session_expired"])
+
+    def test_frames_after_the_first_only_search_around_the_tracked_face(self):
+        # 64x64 frames are upscaled 7.5x to the 480 px working size.
+        cascade, hog = _Cascade([(120, 120, 240, 240)]), _Hog()
+        engine = FaceEngine(_Predictor(), _Recognizer(), cascade=cascade, hog_detector=hog,
+                            rectangle=lambda *box: box)
+        sid = self.client.post("/gate/session", json={"qr_data": self.qr_payload}).get_json()["session_id"]
+        with unittest.mock.patch.object(self.gate, "face_engine", engine), \
+             unittest.mock.patch.object(self.gate, "face_pool", None), \
+             unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=[]):
+            for _ in range(4):
+                self.assertEqual(self._frame(sid).get_json()["status"], "denied")
+        track = self.gate.gate_sessions.get(sid).track.stats()
+        self.assertEqual(track["frames"], 4)
+        self.assertEqual(track["tracked"], 3)
+        self.assertEqual(track["detector_calls"], 4)
+        self.assertEqual(hog.calls, 0)
+
+    def test_invalid_qr_is_rejected_at_open(self):
+        body = self.client.post("/gate/session", json={"qr_data": "not-a-qr", "action": "checkin"}).get_json()
+        self.assertEqual(body["status"], "denied")
+        self.assertTrue(body["rescan_qr"])
+
+    def test_session_is_bound_to_the_opening_client(self):
+        sid = self.client.post("/gate/session", json={"qr_data": self.qr_payload}).get_json()["session_id"]
+        resp = self.client.post(f"/gate/session/{sid}/frame", data=_jpeg_bytes(), content_type="image/jpeg",
+                                environ_base={"REMOTE_ADDR": "10.9.9.9"})
+        self.assertEqual(resp.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
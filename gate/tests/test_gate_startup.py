@@ -0,0 +1,50 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+
+# What multiprocessing's "spawn" start method does in a face worker: re-run the
+# launching script (python app.py) under the name __mp_main__, with the parent's sys.path.
+_WORKER_IMPORT = """
+import json, runpy, sys
+import firebase_admin
+ns = runpy.run_path(sys.argv[1], run_name="__mp_main__")
+replica = ns["_visitors_replica"]
+print(json.dumps({
+    "db_ref": ns["db_ref"] is None,
+    "log_journal": ns["log_journal"] is None,
+    "replica_unbound": replica.source is None and not replica.ready,
+    "face_engine": ns["face_engine"] is None,
+    "face_pool": ns["face_pool"] is None,
+    "firebase_apps": len(firebase_admin._apps),
+}))
+"""
+
+
+class SpawnedWorkerImportTests(unittest.TestCase):
+    def test_spawned_worker_does_not_open_the_journal_or_the_replica(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = os.path.join(tmp, "gate_log_journal.jsonl")
+            env = dict(os.environ, USE_MOCK_DATA="False", GATE_LOG_WRITE_BEHIND="1",
+                       GATE_LOG_JOURNAL_PATH=journal, FACE_WORKERS="2",
+                       PYTHONPATH=os.pathsep.join([str(_GATE_DIR), str(_GATE_DIR.parent)]))
+            proc = subprocess.run(
+                [sys.executable, "-c", _WORKER_IMPORT, str(_GATE_DIR / "app.py")],
+                cwd=tmp, env=env, capture_output=True, text=True, timeout=120,
+            )
+            self.assertEqual(proc.returncode, 0, proc.stderr)
+            state = json.loads(proc.stdout.strip().splitlines()[-1])
+            self.assertEqual(state, {
+                "db_ref": True, "log_journal": True, "replica_unbound": True,
+                "face_engine": True, "face_pool": True, "firebase_apps": 0,
+            })
+            self.assertEqual(os.listdir(tmp), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
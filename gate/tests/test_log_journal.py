@@ -0,0 +1,169 @@
+import os
+import sys
+import tempfile
+import unittest
+import unittest.mock
+from datetime import date
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from log_journal import LogJournal  # noqa: E402
+from event_partitions import read_events, read_summaries, write_event  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+
+class _FailingRoot:
+    def __init__(self):
+        self.calls = 0
+
+    def update(self, writes):
+        self.calls += 1
+        raise ConnectionError("offline")
+
+
+class LogJournalTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "journal", "gate_logs.jsonl")
+        self.db = self.gate.InMemoryDBRef({"visitors": {}})
+
+    def _journal(self, root=None, **kwargs):
+        journal = LogJournal(self.path, root or self.db, start=False, **kwargs)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_appends_are_sent_as_batched_multi_path_updates(self):
+        journal = self._journal(batch_size=2)
+        journal.child("security_alerts").child("a1").set({"alert_type": "X"})
+        journal.child("research_protocol_events/e1").set({"event": "arrival"})
+        journal.child("visitors/v1/visits/x/qr_scan_log/s1").set({"scan_type": "rejected"})
+        self.assertIsNone(self.db.child("security_alerts").get())
+        self.assertEqual(journal.stats()["depth"], 3)
+
+        with unittest.mock.patch.object(self.db, "update", wraps=self.db.update) as updates:
+            self.assertEqual(journal.flush(), 3)
+        self.assertEqual(updates.call_count, 2)
+        self.assertEqual(self.db.child("security_alerts/a1/alert_type").get(), "X")
+        self.assertEqual(self.db.child("visitors/v1/visits/x/qr_scan_log/s1/scan_type").get(), "rejected")
+        stats = journal.stats()
+        self.assertEqual((stats["depth"], stats["flushed"], stats["acked_seq"]), (0, 3, 3))
+        self.assertEqual(os.path.getsize(self.path), 0)  # fully acked journal is truncated
+
+    def test_failed_flush_keeps_entries_and_backs_off(self):
+        root = _FailingRoot()
+        journal = self._journal(root=root, retry_min=60)
+        journal.child("security_alerts/a1").set({"alert_type": "X"})
+        self.assertEqual(journal.flush(), 0)
+        self.assertEqual(journal.flush(), 0)  # still backing off: no second attempt
+        self.assertEqual(root.calls, 1)
+        stats = journal.stats()
+        self.assertEqual((stats["depth"], stats["flush_failures"]), (1, 1))
+        self.assertIn("offline", stats["last_error"])
+        self.assertGreaterEqual(stats["lag_s"], 0.0)
+
+        journal._root_ref = lambda: self.db  # connection restored
+        self.assertEqual(journal.flush(force=True), 1)
+        self.assertEqual(self.db.child("security_alerts/a1/alert_type").get(), "X")
+
+    def test_unsent_entries_replay_after_a_crash(self):
+        crashed = LogJournal(self.path, _FailingRoot(), start=False)
+        crashed.child("research_protocol_events/e1").set({"event": "arrival"})
+        crashed.child("research_protocol_events/e2").set({"event": "departure"})
+        crashed._fh.close()  # process dies: no close(), no flush
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write('{"seq": 3, "path": "research_protocol_ev')  # torn last append
+
+        journal = self._journal()
+        stats = journal.stats()
+        self.assertEqual((stats["replayed"], stats["depth"], stats["last_seq"]), (2, 2, 2))
+        journal.child("research_protocol_events/e3").set({"event": "invalidation"})
+        self.assertEqual(journal.flush(), 3)
+        events = self.db.child("research_protocol_events").get()
+        self.assertEqual(sorted(e["event"] for e in events.values()), ["arrival", "departure", "invalidation"])
+
+        # Everything is acked now: a restart replays nothing.
+        journal.close()
+        self.assertEqual(self._journal().stats()["replayed"], 0)
+
+    def test_events_beyond_max_pending_are_dropped_and_counted(self):
+        journal = self._journal(root=_FailingRoot(), max_pending=2)
+        results = [journal.append(f"security_alerts/a{i}", {"i": i}) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(journal.stats()["dropped"], 2)
+
+    def test_a_multi_path_update_is_queued_dropped_and_sent_as_one_entry(self):
+        journal = self._journal(batch_size=1, max_pending=2)
+        day = date.today().isoformat()
+        write_event(journal, "security_alerts", "a1", {"alert_type": "X", "timestamp": f"{day} 10:00:00"})
+        journal.child("security_alerts_misc/m1").set({"i": 1})
+        self.assertEqual(journal.stats()["depth"], 2)
+        # Queue full: the whole record + counters update is refused, not a part of it.
+        self.assertFalse(journal.update({"a/1": 1, "b/1": 2}))
+        self.assertEqual((journal.stats()["depth"], journal.stats()["dropped"]), (2, 1))
+
+        with unittest.mock.patch.object(self.db, "update", wraps=self.db.update) as updates:
+            self.assertEqual(journal.flush(), 2)
+        self.assertEqual(updates.call_count, 2)  # batch_size=1 entry, never a fraction of one
+        first = updates.call_args_list[0].args[0]
+        self.assertTrue(any(path.startswith("security_alerts_daily/") for path in first), first)
+        summary = read_summaries(self.db, "security_alerts", day)
+        self.assertEqual(list(summary.values()), [{"total": 1, "by_type": {"X": 1}}])
+
+    def test_single_path_lines_from_an_older_journal_still_replay(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w", encoding="utf-8") as fh:
+            fh.write('{"seq":1,"t":1.0,"path":"security_alerts_misc/a1","value":{"i":1}}\n')
+        journal = self._journal()
+        self.assertEqual(journal.flush(), 1)
+        self.assertEqual(self.db.child("security_alerts_misc/a1/i").get(), 1)
+
+
+class GateWriteBehindTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def test_denied_scan_logs_go_through_the_journal(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        visit_ref.update({"status": "approved", "visit_approved": True})
+        journal = LogJournal(os.path.join(tmp.name, "gate_logs.jsonl"), self.gate.db_reference, start=False)
+        self.addCleanup(journal.close)
+
+        other_face = [{"visitor_id": "visitor_demo_2", "distance": 0.30, "name": "Diya", "blacklisted": False}]
+        jpeg = cv2.imencode(".jpg", np.random.default_rng(7).integers(60, 200, (120, 160, 3), dtype=np.uint8))[1]
+        with unittest.mock.patch.object(self.gate, "log_journal", journal), \
+             unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=other_face), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128):
+            body = self.client.post("/checkin_verify_and_log", data=jpeg.tobytes(), content_type="image/jpeg",
+                                    query_string={"qr_data": visit_ref.get()["qr_payload"], "action": "checkin",
+                                                  "kiosk_id": "journal"}).get_json()
+            # Alert record with its summary counters (one entry), and the scan log entry.
+            self.assertEqual(self.client.get("/debug_gate").get_json()["log_journal"]["depth"], 2)
+        self.assertEqual(body["status"], "denied")
+        self.assertFalse(self.gate.db_ref.child("security_alerts").get())
+
+        self.assertEqual(journal.flush(), 2)
+        alerts = read_events(self.gate.db_ref, "security_alerts", date.today())
+        self.assertEqual([a["alert_type"] for _, _, a in alerts], ["QR_FACE_MISMATCH"])
+        self.assertEqual(len(visit_ref.child("qr_scan_log").get()), 1)
+        summary = read_summaries(self.gate.db_ref, "security_alerts", date.today())
+        self.assertEqual(list(summary.values()), [{"total": 1, "by_type": {"QR_FACE_MISMATCH": 1}}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+import protocol_replay  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+DAY = "2026-03-02"
+
+
+def _vector(seed):
+    vec = np.random.default_rng(seed).normal(0, 1, 128)
+    return (0.9 * vec / np.linalg.norm(vec)).tolist()
+
+
+def _event(at, action, face, qr, label):
+    return {"t": f"{DAY} {at}", "action": action, "face": face, "qr": qr, "label": label}
+
+
+class ProtocolReplayTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def test_same_trace_gives_each_mode_its_own_outcomes(self):
+        population = {
+            "day": DAY,
+            "visitors": {
+                "alice": {"embedding": _vector(1)},
+                "bob": {"embedding": _vector(2)},
+                "carol": {"embedding": _vector(3), "blacklisted": True},
+            },
+            "outsiders": {"mallory": _vector(4)},
+        }
+        trace = [
+            _event("09:00:00", "checkin", "mallory", "alice", "stolen_qr"),
+            _event("09:10:00", "checkin", "alice", "alice", "legit_qr"),
+            _event("09:20:00", "checkin", "bob", None, "legit_face_only"),
+            _event("09:30:00", "checkin", "carol", "carol", "blacklisted"),
+            _event("11:00:00", "checkout", "alice", "alice", "legit_qr"),
+            _event("11:05:00", "checkout", "bob", None, "legit_face_only"),
+        ]
+        results = protocol_replay.replay(self.gate, population, trace, noise=0.1)
+
+        def summary(mode):
+            stats = results[mode]
+            return (stats["outcomes"]["granted"], stats["outcomes"]["checked_out"],
+                    stats["outcomes"]["denied"], stats["invalidations"])
+
+        self.assertEqual(summary("hybrid"), (1, 1, 4, 1))
+        self.assertEqual(summary("face_only"), (2, 2, 2, 0))
+        # qr_only lets the stolen QR in, so its owner is then "already checked in".
+        self.assertEqual(summary("qr_only"), (1, 1, 4, 1))
+        self.assertEqual(results["qr_only"]["by_label"]["stolen_qr"], {"granted": 1})
+        self.assertEqual(results["hybrid"]["by_label"]["blacklisted"], {"denied": 1, "invalidations": 1})
+        self.assertEqual(results["hybrid"]["alerts"], {"QR_NO_FACE_MATCH": 1})
+
+        # Settings and the clock are the gate's own again after the replay.
+        self.assertIs(self.gate.datetime, datetime)
+        self.assertEqual(self.gate.AUTH_MODE, "hybrid")
+
+    def test_trace_timestamps_drive_qr_cooldown(self):
+        population = {"day": DAY, "visitors": {"alice": {"embedding": _vector(1)}}}
+        trace = [
+            _event("09:10:00", "checkin", "alice", "alice", "in"),
+            _event("09:10:30", "checkout", "alice", "alice", "too_soon"),
+            _event("09:12:00", "checkout", "alice", "alice", "out"),
+        ]
+        stats = protocol_replay.replay_mode(self.gate, population, trace, "hybrid", noise=0.1)
+        self.assertEqual(stats["by_label"], {"in": {"granted": 1}, "too_soon": {"denied": 1},
+                                             "out": {"checked_out": 1}})
+
+    def test_synthetic_workload_threat_counts(self):
+        population, trace = protocol_replay.synthetic_workload(60, day=DAY, seed=3)
+        again = protocol_replay.synthetic_workload(60, day=DAY, seed=3)
+        self.assertEqual(again[1], trace)
+        results = protocol_replay.replay(self.gate, population, trace)
+
+        for mode, stats in results.items():
+            self.assertEqual(sum(stats["outcomes"].values()), len(trace), mode)
+            self.assertEqual(stats["outcomes"]["error"], 0, mode)
+            impostors = stats["by_label"].get("impostor_face", {})
+            self.assertFalse(impostors.get("granted"), mode)
+
+        def grants(mode, label):
+            counts = results[mode]["by_label"].get(label, {})
+            return counts.get("granted", 0) + counts.get("checked_out", 0)
+
+        self.assertEqual(grants("hybrid", "stolen_qr"), 0)
+        self.assertEqual(grants("qr_only", "stolen_qr"), results["qr_only"]["by_label"]["stolen_qr"]["granted"])
+        self.assertGreater(grants("qr_only", "stolen_qr"), 0)
+        self.assertEqual(grants("hybrid", "legit_face_only"), 0)
+        self.assertGreater(grants("face_only", "legit_face_only"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
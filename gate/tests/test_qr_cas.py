@@ -0,0 +1,202 @@
+import sys
+import threading
+import unittest
+from datetime import datetime
+import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from qr_module import (  # noqa: E402
+    QR_CHECKIN_USED, QR_INVALIDATED, QR_UNUSED, QR_UPDATE_CONFLICT, QR_UPDATE_DB_ERROR, QR_UPDATE_INVALID,
+    QR_UPDATE_NOT_FOUND, QrStateError, parse_timestamp, rollback_qr_claim, update_qr_state,
+)
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+SCANS = 8
+
+
+def _jpeg(seed=0):
+    img = np.random.default_rng(seed).integers(60, 200, (120, 160, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+class QrCompareAndSetTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        self.visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        self.visit_ref.update({"status": "approved", "visit_approved": True})
+
+    def test_transaction_aborts_without_writing_when_callback_raises(self):
+        ref = self.visit_ref.child("qr_state")
+        before = ref.get()
+        with self.assertRaises(RuntimeError):
+            ref.transaction(lambda current: (_ for _ in ()).throw(RuntimeError("abort")))
+        self.assertEqual(ref.get(), before)
+        self.assertEqual(ref.transaction(lambda current: {**current, "scan_count": 5})["scan_count"], 5)
+
+    def test_parallel_transitions_of_one_qr_have_one_winner(self):
+        start = threading.Barrier(SCANS, timeout=5)
+
+        def scan(_):
+            start.wait()
+            return update_qr_state("visitor_demo_1", "visit_demo_1", QR_CHECKIN_USED, self.gate.db_ref,
+                                   auth_method="qr_and_face")
+
+        with ThreadPoolExecutor(SCANS) as pool:
+            results = list(pool.map(scan, range(SCANS)))
+        self.assertEqual([ok for ok, _ in results].count(True), 1)
+        self.assertTrue(all("Invalid QR transition" in err for ok, err in results if not ok))
+        state = self.visit_ref.child("qr_state").get()
+        self.assertEqual(state["status"], QR_CHECKIN_USED)
+        self.assertEqual(state["scan_count"], 1)
+
+    def test_legacy_visit_without_qr_state_and_missing_visit(self):
+        self.visit_ref.child("qr_state").set(None)
+        self.assertEqual(update_qr_state("visitor_demo_1", "visit_demo_1", QR_INVALIDATED, self.gate.db_ref,
+                                         reason="test"), (True, None))
+        self.assertEqual(self.visit_ref.child("qr_state/invalidated_reason").get(), "test")
+        ok, err = update_qr_state("visitor_demo_1", "no_such_visit", QR_CHECKIN_USED, self.gate.db_ref)
+        self.assertFalse(ok)
+        self.assertIn("not found", err)
+        self.assertEqual(err.code, QR_UPDATE_NOT_FOUND)
+        self.assertIsNone(self.gate.db_ref.child("visitors/visitor_demo_1/visits/no_such_visit").get())
+
+    def test_parallel_gate_scans_of_one_qr_grant_once(self):
+        qr_payload = self.visit_ref.get()["qr_payload"]
+        self.assertEqual(self.visit_ref.child("qr_state/status").get(), QR_UNUSED)
+        matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        validated = threading.Barrier(SCANS, timeout=5)
+        real_validate = self.gate.validate_qr_token
+
+        def validate_then_wait(*args, **kwargs):
+            # Every kiosk sees the QR as unused before any of them writes.
+            result = real_validate(*args, **kwargs)
+            validated.wait()
+            return result
+
+        def scan(i):
+            client = self.gate.app.test_client()
+            return client.post("/checkin_verify_and_log", data=_jpeg(i), content_type="image/jpeg",
+                               query_string={"qr_data": qr_payload, "action": "checkin",
+                                             "kiosk_id": f"cas-{i}"}).get_json()
+
+        with unittest.mock.patch.object(self.gate, "validate_qr_token", side_effect=validate_then_wait), \
+             unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128):
+            with ThreadPoolExecutor(SCANS) as pool:
+                bodies = list(pool.map(scan, range(SCANS)))
+
+        statuses = [b["status"] for b in bodies]
+        self.assertEqual(statuses.count("granted"), 1, bodies)
+        self.assertEqual(statuses.count("denied"), SCANS - 1, bodies)
+        # A scan that starts after the winner committed is told it is already checked in instead.
+        self.assertTrue(all("another gate" in b["message"] or "already checked in" in b["message"]
+                            for b in bodies if b["status"] == "denied"), bodies)
+        visit = self.visit_ref.get()
+        self.assertEqual(visit["qr_state"]["status"], QR_CHECKIN_USED)
+        self.assertEqual(visit["qr_state"]["scan_count"], 1)
+        self.assertEqual(len(visit["qr_scan_log"]), 1)
+        transactions = self.gate.db_ref.child("visitors/visitor_demo_1/transactions").get() or {}
+        self.assertEqual([t["action"] for t in transactions.values()].count("check_in"), 1)
+
+    def test_failed_commit_releases_the_qr_claim_so_a_retry_succeeds(self):
+        qr_payload = self.visit_ref.get()["qr_payload"]
+        matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        real_commit = self.gate.WriteBatch.commit
+        failures = [RuntimeError("firebase unavailable")]
+
+        def flaky_commit(batch):
+            if failures:
+                raise failures.pop()
+            return real_commit(batch)
+
+        def scan(i):
+            return self.client.post("/checkin_verify_and_log", data=_jpeg(i), content_type="image/jpeg",
+                                    query_string={"qr_data": qr_payload, "action": "checkin",
+                                                  "kiosk_id": f"retry-{i}"}).get_json()
+
+        with unittest.mock.patch.object(self.gate.WriteBatch, "commit", flaky_commit), \
+             unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128):
+            self.assertEqual(scan(1)["status"], "error")
+            self.assertEqual(self.visit_ref.child("qr_state/status").get(), QR_UNUSED)
+            self.assertEqual(self.visit_ref.child("status").get(), "approved")
+            self.assertEqual(scan(2)["status"], "granted")
+        self.assertEqual(self.visit_ref.child("qr_state/status").get(), QR_CHECKIN_USED)
+        self.assertEqual(self.visit_ref.child("qr_state/scan_count").get(), 1)
+
+    def test_update_failures_carry_a_reason_code(self):
+        ok, err = update_qr_state("visitor_demo_1", "visit_demo_1", QR_CHECKIN_USED, self.gate.db_ref,
+                                  expected_status=QR_CHECKIN_USED)
+        self.assertEqual((ok, err.code), (False, QR_UPDATE_CONFLICT))
+        self.assertEqual(self.visit_ref.child("qr_state/status").get(), QR_UNUSED)
+        ok, err = update_qr_state("visitor_demo_1", "visit_demo_1", "checkout_used", self.gate.db_ref,
+                                  expected_status=QR_UNUSED)
+        self.assertEqual((ok, err.code), (False, QR_UPDATE_INVALID))
+        with unittest.mock.patch.object(self.gate.InMemoryDBRef, "transaction",
+                                        side_effect=RuntimeError("firebase unavailable")):
+            ok, err = update_qr_state("visitor_demo_1", "visit_demo_1", QR_CHECKIN_USED, self.gate.db_ref)
+        self.assertEqual((ok, err.code), (False, QR_UPDATE_DB_ERROR))
+
+    def test_only_a_lost_race_is_reported_as_used_at_another_gate(self):
+        qr_payload = self.visit_ref.get()["qr_payload"]
+        matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+
+        def scan(i):
+            return self.client.post("/checkin_verify_and_log", data=_jpeg(i), content_type="image/jpeg",
+                                    query_string={"qr_data": qr_payload, "action": "checkin",
+                                                  "kiosk_id": f"reason-{i}"}).get_json()
+
+        with unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128):
+            with unittest.mock.patch.object(self.gate.InMemoryDBRef, "transaction",
+                                            side_effect=RuntimeError("firebase unavailable")):
+                body = scan(1)
+            self.assertEqual(body["status"], "error", body)
+            self.assertNotIn("another gate", body["message"])
+            self.assertEqual(self.visit_ref.child("status").get(), "approved")
+
+            rejected = (False, QrStateError("Invalid QR transition", QR_UPDATE_INVALID))
+            with unittest.mock.patch.object(self.gate, "update_qr_state", return_value=rejected):
+                body = scan(2)
+            self.assertEqual(body["status"], "denied", body)
+            self.assertNotIn("another gate", body["message"])
+            self.assertEqual(scan(3)["status"], "granted")
+
+    def test_rollback_keeps_a_later_transition(self):
+        claim = {}
+        self.assertTrue(update_qr_state("visitor_demo_1", "visit_demo_1", QR_CHECKIN_USED, self.gate.db_ref,
+                                        claim=claim)[0])
+        self.assertEqual(claim["previous"]["status"], QR_UNUSED)
+        invalidate = update_qr_state("visitor_demo_1", "visit_demo_1", QR_INVALIDATED, self.gate.db_ref,
+                                     reason="other gate")
+        self.assertTrue(invalidate[0])
+        ok, err = rollback_qr_claim("visitor_demo_1", "visit_demo_1", claim, self.gate.db_ref)
+        self.assertFalse(ok)
+        self.assertIn("changed", err)
+        self.assertEqual(self.visit_ref.child("qr_state/status").get(), QR_INVALIDATED)
+
+
+class ParseTimestampTests(unittest.TestCase):
+    def test_matches_strptime(self):
+        for text in ("2026-10-18 09:05:07", "2026-1-8 9:5:7", "2026-10-18 23:59:59"):
+            self.assertEqual(parse_timestamp(text), datetime.strptime(text, "%Y-%m-%d %H:%M:%S"))
+        for text in ("2026-10-18", "2026-10-18T09:05:07", "2026-10-18 09:05+01", "2026-02-30 10:00:00", ""):
+            with self.assertRaises(ValueError):
+                parse_timestamp(text)
+
+
+if __name__ == "__main__":
+    unittest.main()
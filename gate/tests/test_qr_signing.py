@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+import unittest
+import unittest.mock
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from qr_module import parse_qr_payload, validate_qr_token  # noqa: E402
+from qr_signing import build_qr_payload, verify_qr_signature  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+KEY = b"test-signing-key"
+EXPIRY = "2099-01-01 12:00:00"
+
+
+class _NoIODB:
+    """db_ref stand-in that fails the test on any read."""
+
+    def child(self, path):
+        raise AssertionError(f"unexpected DB read: {path}")
+
+
+class QrSigningTests(unittest.TestCase):
+    def test_v1_without_key_and_v2_with_key(self):
+        v1 = json.loads(build_qr_payload("vis", "visit", "tok", EXPIRY, key=b""))
+        self.assertEqual(set(v1), {"v", "i", "k", "e"})
+        v2 = json.loads(build_qr_payload("vis", "visit", "tok", EXPIRY, key=KEY))
+        self.assertEqual(v2["q"], 2)
+        self.assertEqual(verify_qr_signature(v2, key=KEY, require_signed=False), (True, None))
+
+    def test_tampered_or_wrongly_keyed_codes_fail(self):
+        signed = json.loads(build_qr_payload("vis", "visit", "tok", EXPIRY, key=KEY))
+        for field, value in (("v", "other"), ("i", "visit2"), ("k", "tok2"), ("e", "2100-01-01 00:00:00"),
+                             ("s", "AAAAAAAAAAAAAAAAAAAAAA"), ("s", "é" * 22)):
+            ok, err = verify_qr_signature({**signed, field: value}, key=KEY, require_signed=False)
+            self.assertFalse(ok, field)
+            self.assertIn("signature", err)
+        self.assertFalse(verify_qr_signature(signed, key=b"other-key", require_signed=False)[0])
+        self.assertFalse(verify_qr_signature({**signed, "q": 3}, key=KEY, require_signed=False)[0])
+
+    def test_unsigned_codes_pass_unless_required(self):
+        v1 = json.loads(build_qr_payload("vis", "visit", "tok", EXPIRY, key=b""))
+        self.assertTrue(verify_qr_signature(v1, key=KEY, require_signed=False)[0])
+        self.assertFalse(verify_qr_signature(v1, key=KEY, require_signed=True)[0])
+
+    def test_forged_and_garbled_codes_are_rejected_without_io(self):
+        signed = json.loads(build_qr_payload("vis", "visit", "tok", EXPIRY, key=KEY))
+        with unittest.mock.patch.dict(os.environ, {"QR_SIGNING_KEY": KEY.decode()}):
+            ok, vid, _, _, err = validate_qr_token({**signed, "k": "guessed"}, _NoIODB())
+        self.assertFalse(ok)
+        self.assertIsNone(vid)
+        self.assertIn("forgery", err)
+        self.assertEqual(parse_qr_payload("[1, 2]")[0], None)
+        self.assertEqual(parse_qr_payload("not json")[0], None)
+
+
+class GateSignedQrTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def _fresh_visit(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        visit_ref.update({"status": "approved", "visit_approved": True})
+        return visit_ref.get()
+
+    def _post(self, qr_payload):
+        jpeg = cv2.imencode(".jpg", np.random.default_rng(0).integers(60, 200, (120, 160, 3), dtype=np.uint8))[1]
+        matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        with unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128):
+            return self.client.post("/checkin_verify_and_log", data=jpeg.tobytes(), content_type="image/jpeg",
+                                    query_string={"qr_data": qr_payload, "action": "checkin"}).get_json()
+
+    def test_signed_and_legacy_codes_check_in(self):
+        with unittest.mock.patch.dict(os.environ, {"QR_SIGNING_KEY": KEY.decode()}):
+            visit = self._fresh_visit()
+            self.assertEqual(json.loads(visit["qr_payload"])["q"], 2)
+            self.assertEqual(self._post(visit["qr_payload"])["status"], "granted")
+
+            # A v1 code issued before the key was configured still works.
+            visit = self._fresh_visit()
+            legacy = build_qr_payload("visitor_demo_1", "visit_demo_1", visit["qr_token"],
+                                      visit["qr_expires_at"], key=b"")
+            self.assertEqual(self._post(legacy)["status"], "granted")
+
+            # Edited expiry on a signed code: denied before any visit lookup.
+            visit = self._fresh_visit()
+            edited = json.dumps({**json.loads(visit["qr_payload"]), "e": "2099-12-31 00:00:00"})
+            body = self._post(edited)
+            self.assertEqual(body["status"], "denied")
+            self.assertTrue(body["rescan_qr"])
+            self.assertIn("forgery", body["message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import sys
+import threading
+import unittest
+from pathlib import Path
+from time import time
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR))
+
+from replica import TreeReplica, ReplicaReader  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+
+class TreeReplicaTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def setUp(self):
+        self.db = self.gate.InMemoryDBRef({
+            "visitors": {"v1": {"basic_info": {"name": "A"}, "visits": {"x": {"status": "pending"}}}},
+            "security_alerts": {},
+        })
+        self.replica = TreeReplica("visitors")
+        self.changes = []
+        self.replica.subscribe(self.changes.append)
+        self.replica.bind(self.db.child("visitors"), source=self.db)
+
+    def test_initial_put_makes_replica_ready(self):
+        self.assertTrue(self.replica.ready)
+        self.assertEqual(self.replica.get("v1/basic_info/name"), "A")
+        self.assertEqual(self.changes, [None])
+
+    def test_put_patch_and_delete_events_are_applied(self):
+        v0 = self.replica.version
+        self.db.child("visitors/v2/basic_info").set({"name": "B"})
+        self.db.child("visitors/v1/visits/x").update({"status": "checked_in"})
+        self.db.child("visitors/v1/visits/x").set(None)
+        self.assertEqual(self.replica.get("v2/basic_info/name"), "B")
+        self.assertIsNone(self.replica.get("v1/visits/x"))
+        self.assertEqual(self.replica.version, v0 + 3)
+        self.assertEqual(self.changes[1:], [{"v2"}, {"v1"}, {"v1"}])
+
+    def test_writes_outside_node_are_ignored_and_root_writes_resend(self):
+        self.db.child("security_alerts/a1").set({"type": "X"})
+        self.assertEqual(len(self.changes), 1)
+        self.db.set({"visitors": {"v9": {"basic_info": {"name": "Z"}}}})
+        self.assertEqual(set(self.replica.get()), {"v9"})
+        self.assertIsNone(self.changes[-1])
+
+    def test_reads_are_copies(self):
+        record = self.replica.get("v1")
+        record["basic_info"]["name"] = "mutated"
+        self.assertEqual(self.replica.get("v1/basic_info/name"), "A")
+
+    def test_snapshots_are_not_changed_by_later_events(self):
+        record = self.replica.snapshot("v1")
+        visits = self.replica.snapshot("v1/visits")
+        self.db.child("visitors/v1/visits/x").update({"status": "checked_in"})
+        self.db.child("visitors/v1/basic_info").set({"name": "B"})
+        self.assertEqual(record["visits"]["x"]["status"], "pending")
+        self.assertEqual(visits, {"x": {"status": "pending"}})
+        self.assertEqual(record["basic_info"]["name"], "A")
+        self.assertEqual(self.replica.snapshot("v1/visits/x/status"), "checked_in")
+        shared = ReplicaReader(self.replica, self.db, shared=True)
+        self.assertIs(shared.child("visitors/v1").get(), self.replica.snapshot("v1"))
+
+    def test_reader_serves_from_replica_and_falls_back_elsewhere(self):
+        reader = ReplicaReader(self.replica, self.db)
+        self.db.child("security_alerts/a1").set({"type": "X"})
+        self.assertEqual(reader.child("visitors/v1/basic_info/name").get(), "A")
+        self.assertEqual(reader.child("security_alerts/a1/type").get(), "X")
+        self.replica.close()
+        self.db.child("visitors/v1/basic_info").update({"name": "Live"})
+        self.assertEqual(reader.child("visitors/v1/basic_info/name").get(), "Live")
+
+    def test_stale_replica_falls_back_to_the_db_until_resynced(self):
+        replica = TreeReplica("visitors", max_staleness=30).bind(self.db.child("visitors"), source=self.db)
+        reader = ReplicaReader(replica, self.db)
+        self.assertTrue(replica.fresh())
+        self.assertFalse(replica.needs_resync())
+        # Stream went quiet: a write the replica never saw is read from the DB.
+        replica.close()
+        replica._registration = self.db.child("visitors").listen(lambda event: None)
+        replica.ready = True
+        replica.last_event_at = replica.bound_at = time() - 60
+        self.db.child("visitors/v1/basic_info").update({"name": "Live"})
+        self.assertFalse(replica.fresh())
+        self.assertEqual(reader.child("visitors/v1/basic_info/name").get(), "Live")
+        self.assertTrue(replica.needs_resync())
+
+        replica.resync()
+        self.assertEqual(replica.stats()["resyncs"], 1)
+        self.assertTrue(replica.fresh())
+        self.assertLess(replica.stats()["lag_s"], 5)
+        self.assertEqual(replica.get("v1/basic_info/name"), "Live")
+
+    def test_dead_listener_thread_is_not_trusted(self):
+        class _DeadStream:
+            _thread = threading.Thread(target=lambda: None)
+
+            def close(self):
+                pass
+
+        _DeadStream._thread.start()
+        _DeadStream._thread.join()
+        replica = TreeReplica("visitors", retry_interval=0).bind(self.db.child("visitors"), source=self.db)
+        replica._registration = _DeadStream()
+        self.assertTrue(replica.ready)
+        self.assertFalse(replica.healthy())
+        self.assertFalse(replica.fresh())
+        self.assertTrue(replica.needs_resync())
+        self.assertTrue(replica.resync().fresh())
+
+
+class GateReplicaWiringTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+
+    def test_replica_rebinds_when_db_ref_swapped(self):
+        replica = self.gate.get_visitors_replica()
+        self.assertIs(replica.source, self.gate.db_ref)
+        self.assertTrue(replica.ready)
+        self.assertIn("visitor_demo_1", replica.get())
+
+    def test_stale_gate_replica_resyncs_in_the_background(self):
+        replica = self.gate.get_visitors_replica()
+        resyncs = replica.resyncs
+        replica.last_event_at = replica.bound_at = time() - self.gate.REPLICA_MAX_STALENESS_SECONDS - 1
+        self.assertGreater(self.gate.app.test_client().get("/debug_gate").get_json()["replica"]["lag_s"],
+                           self.gate.REPLICA_MAX_STALENESS_SECONDS)
+        self.gate.get_visitors_replica()
+        self.gate._visitors_resync["thread"].join(5)
+        stats = self.gate.get_visitors_replica().stats()
+        self.assertEqual(stats["resyncs"], resyncs + 1)
+        self.assertTrue(stats["fresh"])
+
+    def test_face_index_follows_change_feed(self):
+        index = self.gate.get_face_index()
+        self.assertIn("visitor_demo_1", index)
+        emb = self.gate._mock_embedding(42)
+        self.gate.db_ref.child("visitors/visitor_new/basic_info").set({"name": "New", "embedding": emb})
+        self.assertIn("visitor_new", self.gate.get_face_index())
+        self.gate.db_ref.child("visitors/visitor_new").set(None)
+        self.assertNotIn("visitor_new", self.gate.get_face_index())
+
+
+if __name__ == "__main__":
+    unittest.main()
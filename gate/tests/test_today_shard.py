@@ -0,0 +1,109 @@
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+from embedding_codec import encode_embedding  # noqa: E402
+from face_index import FaceIndex  # noqa: E402
+from today_shard import TodayShard, TieredMatcher, visitor_expected_on  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+TODAY = datetime.now().strftime("%Y-%m-%d")
+TOMORROW = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def _vec(seed):
+    v = np.random.default_rng(seed).normal(0, 1, 128)
+    return v / np.linalg.norm(v)
+
+
+def _visitor(seed, visit_date=TODAY, status="approved"):
+    return {
+        "basic_info": {"name": f"p{seed}", "embedding": encode_embedding(_vec(seed))},
+        "visits": {"visit_1": {"visit_date": visit_date, "status": status}},
+    }
+
+
+class TodayShardTests(unittest.TestCase):
+    def setUp(self):
+        self.visitors = {
+            "today_a": _visitor(1),
+            "today_b": _visitor(2, status="checked_in"),
+            "tomorrow": _visitor(3, visit_date=TOMORROW),
+            "rejected": _visitor(4, status="rejected"),
+        }
+        self.shard = TodayShard()
+        self.shard.rebuild(self.visitors)
+        self.matcher = TieredMatcher(
+            self.shard, FaceIndex.from_visitors(self.visitors),
+            is_ambiguous=lambda r: r.best_distance > 0.45,
+        )
+
+    def test_membership(self):
+        self.assertTrue(visitor_expected_on(self.visitors["today_b"], TODAY))
+        self.assertFalse(visitor_expected_on(self.visitors["rejected"], TODAY))
+        self.assertEqual(len(self.shard), 2)
+        self.assertIn("today_a", self.shard.index)
+        self.assertNotIn("tomorrow", self.shard.index)
+
+    def test_incremental_apply(self):
+        self.shard.apply("tomorrow", _visitor(3, visit_date=TODAY))
+        self.assertIn("tomorrow", self.shard.index)
+        self.shard.apply("today_a", _visitor(1, status="checked_out"))
+        self.assertNotIn("today_a", self.shard.index)
+        self.shard.apply("today_b", None)
+        self.assertNotIn("today_b", self.shard.index)
+
+    def test_tier1_hit_and_fallbacks_are_counted(self):
+        hit = self.matcher.match(_vec(1), threshold=0.6)
+        self.assertEqual(hit.tier, 1)
+        self.assertEqual(hit[0]["visitor_id"], "today_a")
+
+        miss = self.matcher.match(_vec(3), threshold=0.6)
+        self.assertEqual(miss.tier, 2)
+        self.assertEqual(miss[0]["visitor_id"], "tomorrow")
+
+        # Weak tier-1 match (above the accept distance) is confirmed on the full index.
+        weak = _vec(2) + 0.5 * _vec(99)
+        self.matcher.match(weak, threshold=2.0)
+
+        stats = self.matcher.stats()
+        self.assertEqual(stats["lookups"], 3)
+        self.assertEqual(stats["tier1_hits"], 1)
+        self.assertEqual(stats["tier1_misses"], 1)
+        self.assertEqual(stats["tier1_ambiguous"], 1)
+        self.assertAlmostEqual(stats["tier1_hit_rate"], 1 / 3, places=3)
+
+
+class GateTodayShardWiringTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+
+    def test_shard_follows_change_feed_and_date_rollover(self):
+        matcher = self.gate.get_face_matcher()
+        self.assertEqual(len(matcher.shard), 2)
+
+        self.gate.db_ref.child("visitors/visitor_demo_2/visits/visit_demo_2").update({"status": "checked_out"})
+        self.assertNotIn("visitor_demo_2", matcher.shard.index)
+
+        self.gate.db_ref.child("visitors/visitor_new").set(_visitor(7))
+        self.assertIn("visitor_new", matcher.shard.index)
+
+        matcher.shard.date = "2000-01-01"
+        self.gate.get_face_matcher()
+        self.assertEqual(matcher.shard.date, TODAY)
+        self.assertEqual(set(matcher.shard.index._ids), {"visitor_demo_1", "visitor_new"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import sys
+import unittest
+import unittest.mock
+from datetime import date
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+_GATE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_GATE_DIR.parent))
+sys.path.insert(0, str(_GATE_DIR))
+
+import qr_module  # noqa: E402
+from write_batch import WriteBatch  # noqa: E402
+from event_partitions import read_events  # noqa: E402
+from test_edge_cases_mock import load_gate_app_module  # noqa: E402
+
+
+def _jpeg(seed=0):
+    img = np.random.default_rng(seed).integers(60, 200, (120, 160, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+class WriteBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.gate = load_gate_app_module()
+        self.db = self.gate.InMemoryDBRef({"visitors": {"v1": {"visits": {"a": {"status": "approved", "purpose": "x"}}}}})
+
+    def test_nested_writes_fold_into_non_overlapping_paths(self):
+        batch = WriteBatch(self.db)
+        visit = batch.child("visitors/v1/visits/a")
+        visit.update({"status": "checked_in"})
+        visit.child("qr_state").update({"status": "checkin_used"})
+        batch.child("visitors/v1/transactions/t1").set({"action": "check_in"})
+        batch.child("visitors/v1/transactions/t1/note").set("late")
+        batch.child("logs").set({"old": 1})
+        batch.child("logs/new").set(2)
+        self.assertEqual(sorted(batch.paths()), [
+            "logs",
+            "visitors/v1/transactions/t1",
+            "visitors/v1/visits/a/qr_state/status",
+            "visitors/v1/visits/a/status",
+        ])
+        # Nothing is written until commit.
+        self.assertEqual(self.db.child("visitors/v1/visits/a/status").get(), "approved")
+        self.assertEqual(batch.commit(), 4)
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(self.db.child("visitors/v1/visits/a").get(),
+                         {"status": "checked_in", "purpose": "x", "qr_state": {"status": "checkin_used"}})
+        self.assertEqual(self.db.child("visitors/v1/transactions/t1").get(), {"action": "check_in", "note": "late"})
+        self.assertEqual(self.db.child("logs").get(), {"old": 1, "new": 2})
+
+        # A later set replaces pending writes underneath it.
+        batch.child("visitors/v1/visits/a/status").set("x")
+        batch.child("visitors/v1/visits/a").set({"status": "checked_out"})
+        self.assertEqual(batch.paths(), ["visitors/v1/visits/a"])
+
+    def test_multi_location_update_reaches_listeners_after_all_writes(self):
+        seen = []
+
+        def listener(event):
+            # Every path of the update is already applied when the event fires.
+            seen.append((event.event_type, event.path, event.data, self.db.child("visitors/v1/visits/a").get()))
+
+        self.db.child("visitors").listen(listener)
+        seen.clear()
+        self.db.update({"visitors/v1/visits/a/status": "checked_in", "visitors/v1/visits/a/purpose": None})
+        # One "patch" for the whole update, as Firebase delivers it.
+        self.assertEqual(seen, [("patch", "/", {"v1/visits/a/status": "checked_in", "v1/visits/a/purpose": None},
+                                 {"status": "checked_in"})])
+
+
+class AtomicGrantTests(unittest.TestCase):
+    """A granted check-in / check-out is one root update and re-reads nothing it already has."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gate = load_gate_app_module()
+        cls.client = cls.gate.app.test_client()
+
+    def setUp(self):
+        self.gate.db_ref = self.gate.InMemoryDBRef(self.gate.build_mock_gate_data())
+        self.visit_ref = self.gate.db_ref.child("visitors/visitor_demo_1/visits/visit_demo_1")
+        self.visit_ref.update({"status": "approved", "visit_approved": True})
+        self.qr_payload = self.visit_ref.get()["qr_payload"]
+        self.gate.get_face_matcher()
+
+    def _count_writes(self):
+        return unittest.mock.patch.object(type(self.gate.db_ref), "update", autospec=True,
+                                          side_effect=type(self.gate.db_ref).update)
+
+    def _assert_one_root_update(self, updates, context):
+        root_updates = [c for c in updates.call_args_list if c.args[0]._path == ()]
+        self.assertEqual(len(root_updates), 1, context)
+
+    def _post(self, seed, action="checkin"):
+        matches = [{"visitor_id": "visitor_demo_1", "distance": 0.30, "name": "Aarav", "blacklisted": False}]
+        with unittest.mock.patch.object(self.gate, "find_all_face_matches", return_value=matches), \
+             unittest.mock.patch.object(self.gate, "get_face_embedding", return_value=[0.01] * 128), \
+             unittest.mock.patch.object(self.gate, "CHECKIN_COOLDOWN_SECONDS", 0), \
+             unittest.mock.patch.object(qr_module, "QR_SCAN_COOLDOWN_SECONDS", 0), \
+             unittest.mock.patch.object(self.gate, "send_feedback_email", return_value=(True, None)), \
+             unittest.mock.patch.object(self.gate, "get_qr_state") as qr_state_reads, \
+             self._count_writes() as updates:
+            body = self.client.post("/checkin_verify_and_log", data=_jpeg(seed), content_type="image/jpeg",
+                                    query_string={"qr_data": self.qr_payload, "action": action,
+                                                  "kiosk_id": f"batch-{seed}"}).get_json()
+        self._assert_one_root_update(updates, body)
+        qr_state_reads.assert_not_called()
+        return body
+
+    def test_checkin_and_checkout_each_commit_once(self):
+        self.assertEqual(self._post(0)["status"], "granted")
+        visit = self.visit_ref.get()
+        self.assertEqual(visit["status"], "checked_in")
+        self.assertEqual(visit["qr_state"]["status"], self.gate.QR_CHECKIN_USED)
+        self.assertEqual(len(visit["qr_scan_log"]), 1)
+
+        self.assertEqual(self._post(1, "checkout")["status"], "checked_out")
+        visit = self.visit_ref.get()
+        self.assertEqual(visit["status"], "checked_out")
+        self.assertEqual(visit["qr_state"]["status"], self.gate.QR_CHECKOUT_USED)
+        self.assertEqual(len(visit["qr_scan_log"]), 2)
+        events = read_events(self.gate.db_ref, "research_protocol_events", date.today())
+        self.assertEqual(sorted(e["event"] for _, _, e in events), ["arrival", "departure"])
+
+    def test_stolen_qr_invalidation_is_part_of_the_checkout_write(self):
+        self.assertEqual(self._post(0)["status"], "granted")
+        visit = self.visit_ref.get()
+        with self.gate.app.test_request_context(), \
+             unittest.mock.patch.object(self.gate, "send_feedback_email", return_value=(True, None)), \
+             self._count_writes() as updates:
+            body = self.gate.process_checkout(
+                "visitor_demo_1", "visit_demo_1", "Aarav", "", visit["check_in_time"], visit["duration"],
+                0.3, "127.0.0.1", visit["purpose"], visit.get("employee_name"), auth_mode="FACE_ONLY",
+                has_qr=False, auth_mode_config="hybrid", visit_data=visit).get_json()
+        self._assert_one_root_update(updates, body)
+        self.assertEqual(body["status"], "checked_out")
+        self.assertEqual(self.visit_ref.get()["qr_state"]["status"], self.gate.QR_INVALIDATED)
+        alerts = read_events(self.gate.db_ref, "security_alerts", date.today())
+        self.assertEqual([a["alert_type"] for _, _, a in alerts], ["QR_POSSIBLY_STOLEN"])
+        events = read_events(self.gate.db_ref, "research_protocol_events", date.today())
+        self.assertEqual(sorted(e["event"] for _, _, e in events), ["arrival", "departure", "invalidation"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+"Expected today" shard for gate face matching.
+=============================================
+Most faces presented at the gate belong to visitors with a visit scheduled
+for today. ``TodayShard`` keeps a small exact ``FaceIndex`` of just those
+visitors; ``TieredMatcher`` tries it first and only falls back to the full
+index on a miss or an ambiguous (twin) tier-1 result.
+
+The shard is rebuilt when the date rolls over and is updated per visitor from
+the replica change feed, so registrations and host approvals show up without a
+rebuild. Tier-1 hit/miss counters are exposed via ``stats()``.
+"""
+
+import threading
+from datetime import datetime
+from time import perf_counter
+
+from face_index import FaceIndex
+
+# Visit statuses that mean "may present at the gate today".
+EXPECTED_STATUSES = frozenset({"registered", "approved", "checked_in"})
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def visitor_expected_on(visitor_data, date_str):
+    """True if any visit of this visitor is on *date_str* in an expected status."""
+    if not isinstance(visitor_data, dict):
+        return False
+    visits = visitor_data.get("visits") or {}
+    if not isinstance(visits, dict):
+        return False
+    for visit in visits.values():
+        if not isinstance(visit, dict):
+            continue
+        if visit.get("visit_date") != date_str:
+            continue
+        if str(visit.get("status", "registered")).strip().lower() in EXPECTED_STATUSES:
+            return True
+    return False
+
+
+class TodayShard:
+    """Exact face index restricted to visitors expected on ``self.date``."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.index = FaceIndex(capacity=64)
+        self.date = None
+        self.rebuilds = 0
+
+    def rebuild(self, all_visitors, date_str=None):
+        date_str = date_str or _today()
+        with self._lock:
+            expected = {
+                vid: vdata for vid, vdata in (all_visitors or {}).items()
+                if visitor_expected_on(vdata, date_str)
+            }
+            self.index.sync(expected)
+            self.date = date_str
+            self.rebuilds += 1
+
+    def apply(self, visitor_id, visitor_data):
+        """Incremental update for one visitor (None = deleted)."""
+        with self._lock:
+            if self.date is None:
+                return
+            if visitor_data is not None and visitor_expected_on(visitor_data, self.date):
+                self.index.upsert(visitor_id, visitor_data)
+            else:
+                self.index.remove(visitor_id)
+
+    def is_current(self):
+        return self.date == _today()
+
+    def __len__(self):
+        return len(self.index)
+
+
+class TieredMatcher:
+    """
+    Two-tier matcher with the same ``match()`` contract as FaceIndex.
+
+    *is_ambiguous(result)* decides whether a tier-1 hit must be confirmed
+    against the full index (the gate passes its twin detector).
+    """
+
+    def __init__(self, shard, full_index, is_ambiguous=None):
+        self.shard = shard
+        self.full = full_index
+        self.is_ambiguous = is_ambiguous or (lambda result: False)
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "tier1_hits": 0, "tier1_misses": 0, "tier1_ambiguous": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.counters["lookups"] += 1
+            self.counters[key] += 1
+
+    def match(self, live_embedding, threshold=None, k=5):
+        started = perf_counter()
+        if len(self.shard):
+            hot = self.shard.index.match(live_embedding, threshold=threshold, k=k)
+            if hot:
+                if not self.is_ambiguous(hot):
+                    self._count("tier1_hits")
+                    hot.tier = 1
+                    hot.elapsed_ms = (perf_counter() - started) * 1000.0
+                    return hot
+                self._count("tier1_ambiguous")
+            else:
+                self._count("tier1_misses")
+        else:
+            self._count("tier1_misses")
+        result = self.full.match(live_embedding, threshold=threshold, k=k)
+        result.tier = 2
+        result.elapsed_ms = (perf_counter() - started) * 1000.0
+        return result
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["lookups"]
+        counters["tier1_hit_rate"] = round(counters["tier1_hits"] / lookups, 4) if lookups else None
+        counters["shard_size"] = len(self.shard)
+        counters["shard_date"] = self.shard.date
+        return counters
@@ -0,0 +1,121 @@
+"""
+Multi-location write batch for the gate's grant path.
+=============================================
+A granted check-in used to make a separate Firebase call for every record it
+touched: the QR state transition (two reads plus an update), the scan log, the
+visit update, the transaction entry and the protocol event. Check-out added the
+QR state read, an invalidation and a security alert, so a grant cost 6-9
+sequential round trips.
+
+``WriteBatch`` stands in for ``db_ref`` in those helpers. ``batch.child(path)``
+records ``set`` / ``update`` calls instead of sending them, and ``commit()``
+applies all of them with one multi-location ``update()`` on the root ref.
+Firebase applies such an update atomically, and ``InMemoryDBRef.update``
+mirrors that in mock mode. Either every record of the grant is written or none
+is, and the whole grant costs one round trip.
+
+Reads through a batch ref go to the underlying database and do not see
+pending writes. The QR state transition is not batched: it is a
+compare-and-set of its own (see qr_module.update_qr_state) that decides
+whether the grant happens at all.
+"""
+
+from event_partitions import increment, is_increment
+from replica import copy_tree
+
+
+def _split(path):
+    return [p for p in str(path or "").split("/") if p]
+
+
+def _combine(old, new):
+    """Two pending server-side increments of one path add up; otherwise the later write wins."""
+    if is_increment(old) and is_increment(new):
+        return increment(old[".sv"]["increment"] + new[".sv"]["increment"])
+    return copy_tree(new)
+
+
+class WriteBatch:
+    """Pending writes keyed by absolute path, flushed by ``commit()`` as one update."""
+
+    def __init__(self, root_ref):
+        self._root = root_ref
+        self._writes = {}
+
+    def child(self, path):
+        return _BatchRef(self, _split(path))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def paths(self):
+        return list(self._writes)
+
+    def put(self, path, value):
+        """Replace the value at *path* (Firebase ``set`` semantics)."""
+        parts = _split(path)
+        if not parts:
+            raise ValueError("WriteBatch cannot replace the database root")
+        key = "/".join(parts)
+        # A pending write above this path absorbs it, so no two keys overlap
+        # (Firebase rejects multi-location updates with ancestor/descendant keys).
+        for existing in self._writes:
+            if key.startswith(existing + "/"):
+                node = self._writes[existing]
+                if not isinstance(node, dict):
+                    node = self._writes[existing] = {}
+                for part in parts[len(existing.split("/")):-1]:
+                    child = node.get(part)
+                    if not isinstance(child, dict):
+                        child = node[part] = {}
+                    node = child
+                node[parts[-1]] = _combine(node.get(parts[-1]), value)
+                return
+        for existing in [k for k in self._writes if k.startswith(key + "/")]:
+            del self._writes[existing]
+        self._writes[key] = _combine(self._writes.get(key), value)
+
+    def merge(self, path, fields):
+        """Merge *fields* into the node at *path* (Firebase ``update`` semantics)."""
+        base = "/".join(_split(path))
+        for field, value in fields.items():
+            self.put(f"{base}/{field}" if base else str(field), value)
+
+    def update(self, fields):
+        """Multi-location update relative to the root (keys are paths), like ``Reference.update``."""
+        self.merge("", fields)
+
+    def commit(self):
+        """Apply every pending write in one atomic update; returns how many paths were written."""
+        if not self._writes:
+            return 0
+        writes, self._writes = self._writes, {}
+        self._root.update(writes)
+        return len(writes)
+
+
+class _BatchRef:
+    """``db_ref``-shaped view of one path: writes go to the batch, reads to the database."""
+
+    __slots__ = ("_batch", "_parts")
+
+    def __init__(self, batch, parts):
+        self._batch = batch
+        self._parts = parts
+
+    @property
+    def path(self):
+        return "/".join(self._parts)
+
+    def child(self, path):
+        return _BatchRef(self._batch, self._parts + _split(path))
+
+    def set(self, value):
+        self._batch.put(self.path, value)
+
+    def update(self, fields):
+        self._batch.merge(self.path, fields)
+
+    def get(self):
+        ref = self._batch._root
+        return ref.child(self.path).get() if self._parts else ref.get()
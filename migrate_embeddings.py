@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+One-time script: Rewrite stored face embeddings in the compact float32 format.
+Converts visitors/*/basic_info/embedding from space-separated decimal text to
+"f32v1:" + base64(float32 LE) (see embedding_codec.py). Gate and registration
+read both formats, so this can run while the apps are live.
+
+Run from project root:
+  python migrate_embeddings.py                 # migrate in chunks of 200 visitors
+  python migrate_embeddings.py --chunk-size 50
+  python migrate_embeddings.py --dry-run       # count only, write nothing
+
+Uses: admin/firebase_credentials.json and FIREBASE_DATABASE_URL in admin/.env
+Visitor ids are listed with a shallow read, then each chunk reads only its
+embedding nodes and is written back as one multi-path update.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "admin"))
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), "admin", ".env"))
+except ImportError:
+    pass
+
+import firebase_admin
+from firebase_admin import credentials, db
+
+from embedding_codec import decode_embedding, encode_embedding, is_legacy_embedding
+
+
+def migrate(visitors_ref, chunk_size=200, dry_run=False):
+    """Rewrite legacy embeddings under *visitors_ref* (a db.Reference). Returns a stats dict."""
+    stats = {"visitors": 0, "migrated": 0, "already_current": 0, "missing": 0, "unreadable": 0, "chunks": 0}
+    visitor_ids = sorted((visitors_ref.get(shallow=True) or {}).keys())
+    stats["visitors"] = len(visitor_ids)
+
+    for start in range(0, len(visitor_ids), chunk_size):
+        chunk = visitor_ids[start:start + chunk_size]
+        updates = {}
+        for vid in chunk:
+            raw = visitors_ref.child(f"{vid}/basic_info/embedding").get()
+            if not raw:
+                stats["missing"] += 1
+                continue
+            if not is_legacy_embedding(raw):
+                stats["already_current"] += 1
+                continue
+            vec = decode_embedding(raw, dim=None)
+            if vec is None or vec.size == 0:
+                stats["unreadable"] += 1
+                print(f"  ! {vid}: embedding could not be parsed; left unchanged")
+                continue
+            updates[f"{vid}/basic_info/embedding"] = encode_embedding(vec)
+        stats["chunks"] += 1
+        if updates and not dry_run:
+            visitors_ref.update(updates)
+        stats["migrated"] += len(updates)
+        print(f"  chunk {stats['chunks']}: {len(updates)} of {len(chunk)} visitor(s) rewritten")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate visitor embeddings to the compact float32 format.")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Visitors per multi-path update (default 200)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        print("ERROR: --chunk-size must be at least 1.")
+        sys.exit(1)
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    cred_path = os.path.join(base, "admin", "firebase_credentials.json")
+    if not os.path.exists(cred_path):
+        print("ERROR: admin/firebase_credentials.json not found.")
+        sys.exit(1)
+
+    database_url = os.environ.get("FIREBASE_DATABASE_URL", "").strip().rstrip("/")
+    if not database_url:
+        print("ERROR: FIREBASE_DATABASE_URL not set. Set it in admin/.env")
+        sys.exit(1)
+    if not database_url.startswith("https://"):
+        database_url = "https://visitor-management-8f5b4-default-rtdb.firebaseio.com"
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred, {"databaseURL": database_url + "/"})
+
+    stats = migrate(db.reference("visitors"), chunk_size=args.chunk_size, dry_run=args.dry_run)
+    verb = "Would rewrite" if args.dry_run else "Rewrote"
+    print(
+        f"{verb} {stats['migrated']} embedding(s) across {stats['visitors']} visitor(s) "
+        f"({stats['already_current']} already current, {stats['missing']} without embedding, "
+        f"{stats['unreadable']} unreadable)."
+    )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        if "404" in str(e) or "NotFound" in type(e).__name__:
+            print("Firebase returned 404. Check FIREBASE_DATABASE_URL and that the Realtime Database exists.")
+        else:
+            print(f"Error: {e}")
+        sys.exit(1)
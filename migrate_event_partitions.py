@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+One-time script: Move research_protocol_events and security_alerts into day partitions.
+Rewrites flat <stream>/<YYYY-MM-DD_HH-MM-SS_ffffff> records to
+<stream>/<YYYY-MM-DD>/<key> (see event_partitions.py). Each chunk is moved with
+one multi-path update that writes the new location, deletes the old one and
+adds the moved records to their day's <stream>_daily/<YYYY-MM-DD> summary with
+server-side increments. The move can run while gates are live and can be
+re-run safely.
+
+--rebuild-summaries recounts each day from its records with a read followed by
+a set, so increments written by a gate in between are lost. It skips today
+unless --include-today is given; stop the gates before using that.
+
+Run from project root:
+  python migrate_event_partitions.py                      # both streams, chunks of 200 records
+  python migrate_event_partitions.py --stream security_alerts
+  python migrate_event_partitions.py --rebuild-summaries  # also recount every existing day but today
+  python migrate_event_partitions.py --rebuild-summaries --include-today  # gates stopped
+  python migrate_event_partitions.py --dry-run            # count only, write nothing
+
+Uses: admin/firebase_credentials.json and FIREBASE_DATABASE_URL in admin/.env
+Record keys are listed with a shallow read; each chunk then reads only its records.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "admin"))
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), "admin", ".env"))
+except ImportError:
+    pass
+
+import firebase_admin
+from firebase_admin import credentials, db
+
+from event_partitions import STREAMS, day_of_key, is_day, summarize, summary_increments, summary_stream
+
+
+def _child_keys(ref):
+    try:
+        data = ref.get(shallow=True)
+    except TypeError:  # references without shallow reads (in-memory demo DB)
+        data = ref.get()
+    return sorted((data or {}).keys()) if isinstance(data, dict) else []
+
+
+def migrate_stream(root_ref, stream, chunk_size=200, dry_run=False, rebuild_summaries=False,
+                   include_today=False, today=None):
+    """Partition one stream under *root_ref* (a db.Reference to the root). Returns a stats dict."""
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    stats = {"moved": 0, "already_partitioned_days": 0, "unrecognized": 0, "summaries": 0, "chunks": 0,
+             "skipped_today": False}
+    keys = _child_keys(root_ref.child(stream))
+    days = {k for k in keys if is_day(k)}
+    stats["already_partitioned_days"] = len(days)
+    legacy = []
+    for key in keys:
+        if key in days:
+            continue
+        if day_of_key(key) is None:
+            stats["unrecognized"] += 1
+            print(f"  ! {stream}/{key}: key does not start with a date; left unchanged")
+            continue
+        legacy.append(key)
+
+    counted = set()
+    for start in range(0, len(legacy), chunk_size):
+        chunk = legacy[start:start + chunk_size]
+        updates, moved_by_day = {}, {}
+        for key in chunk:
+            record = root_ref.child(f"{stream}/{key}").get()
+            if record is None:
+                continue
+            day = day_of_key(key)
+            updates[f"{stream}/{day}/{key}"] = record
+            updates[f"{stream}/{key}"] = None
+            moved_by_day.setdefault(day, [])
+            if isinstance(record, dict):  # summarize() skips anything else too
+                moved_by_day[day].append(record)
+            counted.add(day)
+        moved = len(updates) // 2
+        for day, records in moved_by_day.items():
+            updates.update(summary_increments(stream, day, records))
+        stats["chunks"] += 1
+        if updates and not dry_run:
+            root_ref.update(updates)
+        stats["moved"] += moved
+        print(f"  {stream} chunk {stats['chunks']}: {moved} of {len(chunk)} record(s) moved")
+
+    rebuild = (days | counted) if rebuild_summaries else set()
+    if today in rebuild and not include_today:
+        rebuild.discard(today)
+        stats["skipped_today"] = True
+        print(f"  {stream}: summary of {today} not rebuilt while gates may be writing it (--include-today)")
+    for day in sorted(rebuild):
+        if not dry_run:
+            records = root_ref.child(f"{stream}/{day}").get() or {}
+            root_ref.child(f"{summary_stream(stream)}/{day}").set(summarize(records, stream))
+    stats["summaries"] = len(counted | rebuild)
+    return stats
+
+
+def migrate(root_ref, streams=STREAMS, chunk_size=200, dry_run=False, rebuild_summaries=False,
+            include_today=False, today=None):
+    return {
+        stream: migrate_stream(root_ref, stream, chunk_size=chunk_size, dry_run=dry_run,
+                               rebuild_summaries=rebuild_summaries, include_today=include_today, today=today)
+        for stream in streams
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition protocol events and security alerts by day.")
+    parser.add_argument("--stream", choices=STREAMS, action="append",
+                        help="Stream to migrate (repeatable; default: both)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Records per multi-path update (default 200)")
+    parser.add_argument("--rebuild-summaries", action="store_true",
+                        help="Recount the daily summary of every partitioned day from its records (not today)")
+    parser.add_argument("--include-today", action="store_true",
+                        help="With --rebuild-summaries, also recount today (stop the gates first)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+    if args.chunk_size < 1:
+        print("ERROR: --chunk-size must be at least 1.")
+        sys.exit(1)
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    cred_path = os.path.join(base, "admin", "firebase_credentials.json")
+    if not os.path.exists(cred_path):
+        print("ERROR: admin/firebase_credentials.json not found.")
+        sys.exit(1)
+
+    database_url = os.environ.get("FIREBASE_DATABASE_URL", "").strip().rstrip("/")
+    if not database_url:
+        print("ERROR: FIREBASE_DATABASE_URL not set. Set it in admin/.env")
+        sys.exit(1)
+    if not database_url.startswith("https://"):
+        database_url = "https://visitor-management-8f5b4-default-rtdb.firebaseio.com"
+
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred, {"databaseURL": database_url + "/"})
+
+    results = migrate(db.reference(), streams=args.stream or STREAMS, chunk_size=args.chunk_size,
+                      dry_run=args.dry_run, rebuild_summaries=args.rebuild_summaries,
+                      include_today=args.include_today)
+    verb = "Would move" if args.dry_run else "Moved"
+    for stream, stats in results.items():
+        print(
+            f"{stream}: {verb.lower()} {stats['moved']} record(s); "
+            f"{stats['summaries']} daily summar{'y' if stats['summaries'] == 1 else 'ies'} written; "
+            f"{stats['already_partitioned_days']} day(s) already partitioned, {stats['unrecognized']} unrecognized key(s)."
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        if "404" in str(e) or "NotFound" in type(e).__name__:
+            print("Firebase returned 404. Check FIREBASE_DATABASE_URL and that the Realtime Database exists.")
+        else:
+            print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Offline replay of gate traffic under the three AUTH_MODE protocols.
+=============================================
+Comparing hybrid, face_only and qr_only used to mean running the live gate
+once per mode. This script replays one trace of arrival / departure attempts
+against each mode instead. Every attempt goes through the gate's real
+decision logic (gate_decision, the body of /checkin_verify_and_log, with the
+qr_module state machine and compare-and-set transitions) on a fresh
+InMemoryDBRef seeded from the same population. The result is per-mode
+grant / deny / invalidation counts, overall and per trace label.
+
+What is bypassed:
+  - Frame decode and face detection: each attempt carries a precomputed
+    128-D probe vector (the enrolled vector of the presented identity plus
+    --probe-noise, drawn before the timed loop), handed to gate_decision in
+    place of the step-A face task.
+  - The wall clock: gate and qr_module read a simulated clock that is set to
+    each attempt's timestamp, so QR expiry, the scan cooldown and the
+    check-in / check-out cooldown behave as they would have at that time.
+  - The write-behind journal and GATE_PARALLEL: logs go straight to the
+    in-memory DB (invalidations are counted from research_protocol_events_daily)
+    and every step runs on the replay thread.
+
+Population (JSON):
+  {"day": "YYYY-MM-DD",
+   "visitors":  {"<id>": {"embedding": [128 floats], "blacklisted": false, "name": "..."}},
+   "outsiders": {"<id>": [128 floats]}}          # faces that never registered
+Every visitor gets one approved visit on "day".
+
+Trace (JSON lines, oldest first):
+  {"t": "YYYY-MM-DD HH:MM:SS", "action": "checkin" | "checkout" | "auto",
+   "face": "<visitor or outsider id>" | null, "qr": "<visitor id whose QR is shown>" | null,
+   "label": "stolen_qr", "kiosk": "gate-1"}
+"qr_payload" (a raw QR string) and "embedding" (a probe vector) override "qr" / "face".
+
+Run from project root:
+  python protocol_replay.py --synthetic 2000                        # generated population + trace, all modes
+  python protocol_replay.py --synthetic 2000 --save-synthetic replay_data/
+  python protocol_replay.py --population pop.json --trace trace.jsonl --modes hybrid qr_only
+  python protocol_replay.py --synthetic 500 --json replay_results.json
+
+events/s is per mode: one mode's attempts replay in order on one thread
+(each depends on the state the previous ones left); --jobs runs the modes
+side by side in separate processes.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import numpy as np
+
+_REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+_GATE_DIR = os.path.join(_REPO_ROOT, "gate")
+for _path in (_REPO_ROOT, _GATE_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+from embedding_codec import encode_embedding  # noqa: E402
+from event_partitions import summary_stream  # noqa: E402
+
+MODES = ("hybrid", "face_only", "qr_only")
+OUTCOMES = ("granted", "checked_out", "denied", "waiting", "error")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+EMBEDDING_DIM = 128
+
+# Synthetic workload: share of registered visitors per role (see synthetic_workload)
+DEFAULT_MIX = {
+    "legit_qr": 0.55,          # own QR + face in and out
+    "legit_face_only": 0.12,   # never shows the QR
+    "qr_in_face_out": 0.05,    # QR at check-in, face only at check-out
+    "twin": 0.04,              # legit_qr, with a registered near-identical sibling
+    "stolen_qr": 0.07,         # outsider shows the visitor's QR with their own face first
+    "lookalike_qr": 0.04,      # outsider resembling the visitor shows the visitor's QR
+    "lookalike_face": 0.04,    # outsider resembling the visitor, face only
+    "qr_replay": 0.05,         # visitor's QR re-used by an outsider after check-out
+    "blacklisted": 0.04,       # blacklisted visitor with own QR + face
+}
+
+
+# ──────────────────────────────────────────────
+# Gate module + simulated clock
+# ──────────────────────────────────────────────
+
+def load_gate():
+    """Load gate/app.py in USE_MOCK_DATA mode (logs written synchronously)."""
+    os.environ["USE_MOCK_DATA"] = "True"
+    os.environ["GATE_LOG_WRITE_BEHIND"] = "0"
+    spec = importlib.util.spec_from_file_location("gate_app_replay", os.path.join(_GATE_DIR, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.init_gate()
+    return module
+
+
+def _simulated_datetime(start):
+    """datetime subclass whose now() reads a settable clock; each call advances it by 1 µs so log keys stay unique."""
+
+    class SimulatedDatetime(datetime):
+        current = start
+
+        @classmethod
+        def now(cls, tz=None):
+            cls.current += timedelta(microseconds=1)
+            return cls.current
+
+    return SimulatedDatetime
+
+
+@contextmanager
+def _replay_settings(gate, mode, clock):
+    """Point the gate at *mode* and the simulated *clock* for one replay; restores everything after."""
+    qr_module = sys.modules[gate.validate_qr_token.__module__]
+    saved = {
+        "AUTH_MODE": gate.AUTH_MODE, "GATE_PARALLEL": gate.GATE_PARALLEL,
+        "log_journal": gate.log_journal, "db_ref": gate.db_ref,
+    }
+    saved_clock = (gate.datetime, qr_module.datetime)
+    saved_levels = (gate.logger.level, qr_module.logger.level)
+    gate.AUTH_MODE = mode
+    gate.GATE_PARALLEL = False
+    gate.log_journal = None
+    gate.datetime = qr_module.datetime = clock
+    # Denials and stolen-QR warnings are the point of the replay; keep them out of the log.
+    gate.logger.setLevel(logging.ERROR)
+    qr_module.logger.setLevel(logging.ERROR)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(gate, name, value)
+        gate.datetime, qr_module.datetime = saved_clock
+        gate.logger.setLevel(saved_levels[0])
+        qr_module.logger.setLevel(saved_levels[1])
+
+
+class _PrecomputedFace:
+    """Stands in for gate_decision's step-A face task: the probe vector is already known."""
+
+    _NO_FACE = {"status": "waiting", "message": "No face detected.", "distance": 999.0}
+
+    def __init__(self, embedding):
+        self._embedding = embedding
+
+    def result(self):
+        if self._embedding is None:
+            return None, self._NO_FACE
+        return self._embedding, None
+
+    def cancel(self):
+        return False
+
+
+# ──────────────────────────────────────────────
+# Population → database, trace → probes
+# ──────────────────────────────────────────────
+
+def build_database(gate, population):
+    """Gate DB tree with one approved visit per visitor; returns (tree, {visitor_id: qr_payload})."""
+    from qr_module import build_qr_record
+
+    day = population["day"]
+    visitors, payloads = {}, {}
+    for visitor_id, person in population["visitors"].items():
+        visit_id = f"visit_{visitor_id}"
+        _token, payload, qr_record = build_qr_record(visitor_id, visit_id, day)
+        blacklisted = bool(person.get("blacklisted"))
+        visitors[visitor_id] = {
+            "basic_info": {
+                "name": person.get("name") or visitor_id,
+                "contact": "",
+                "blacklisted": "yes" if blacklisted else "no",
+                "blacklist_reason": "Replay scenario" if blacklisted else "",
+                "embedding": encode_embedding(person["embedding"]),
+            },
+            "visits": {
+                visit_id: {
+                    "visit_id": visit_id,
+                    "purpose": "Replay",
+                    "employee_name": "Replay Host",
+                    "duration": "8 hours",
+                    "visit_date": day,
+                    "status": "approved",
+                    "visit_approved": True,
+                    "has_visited": False,
+                    "check_in_time": None,
+                    "check_out_time": None,
+                    **qr_record,
+                }
+            },
+        }
+        payloads[visitor_id] = payload
+    return {"visitors": visitors, "research_protocol_events": {}, "security_alerts": {}}, payloads
+
+
+def precompute_probes(population, trace, noise=0.35, seed=0):
+    """One live-probe vector per trace event (None when no face is shown)."""
+    rng = np.random.default_rng(seed)
+    enrolled = {vid: person["embedding"] for vid, person in population["visitors"].items()}
+    enrolled.update(population.get("outsiders", {}))
+    scale = noise / np.sqrt(EMBEDDING_DIM)
+    probes = []
+    for event in trace:
+        if event.get("embedding") is not None:
+            probes.append(np.asarray(event["embedding"], dtype=np.float64))
+        elif event.get("face") is not None:
+            base = np.asarray(enrolled[event["face"]], dtype=np.float64)
+            probes.append(base + rng.normal(0, scale, base.shape))
+        else:
+            probes.append(None)
+    return probes
+
+
+# ──────────────────────────────────────────────
+# Replay
+# ──────────────────────────────────────────────
+
+def _counter_value(db_ref, path):
+    value = db_ref.child(path).get()
+    return value if isinstance(value, (int, float)) else 0
+
+
+def replay_mode(gate, population, trace, mode, probes=None, noise=0.35, seed=0):
+    """
+    Replay *trace* under one AUTH_MODE on a fresh in-memory DB. Returns a stats dict:
+    events, seconds, events_per_second, outcomes, invalidations, alerts, by_label.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown AUTH_MODE {mode!r} (expected one of {', '.join(MODES)})")
+    if probes is None:
+        probes = precompute_probes(population, trace, noise=noise, seed=seed)
+    start = datetime.strptime(f"{population['day']} 00:00:00", TIME_FORMAT)
+    clock = _simulated_datetime(start)
+    outcomes = Counter()
+    by_label = defaultdict(Counter)
+    invalidations = 0
+    elapsed = 0.0
+    with _replay_settings(gate, mode, clock):
+        tree, payloads = build_database(gate, population)
+        gate.db_ref = gate.InMemoryDBRef(tree)
+        gate.get_face_matcher()  # bind replica + face index outside the timed loop
+        # Trace timestamps are parsed up front, like the probes: input parsing is not gate work.
+        times = [datetime.strptime(event["t"], TIME_FORMAT) for event in trace]
+        events_daily = summary_stream("research_protocol_events")
+        results = []
+        with gate.app.test_request_context("/checkin_verify_and_log", method="POST"):
+            t0 = perf_counter()
+            for event, probe, at in zip(trace, probes, times):
+                if at > clock.current:
+                    clock.current = at
+                raw_qr = event.get("qr_payload") or payloads.get(event.get("qr"))
+                counter = f"{events_daily}/{at:%Y-%m-%d}/by_type/invalidation"
+                before = _counter_value(gate.db_ref, counter)
+                response = gate.gate_decision(
+                    None, None, raw_qr, event.get("action") or "auto", "127.0.0.1",
+                    event.get("kiosk") or "replay", face_task=_PrecomputedFace(probe),
+                )
+                if isinstance(response, tuple):
+                    response = response[0]
+                results.append((event, response, _counter_value(gate.db_ref, counter) - before))
+            elapsed = perf_counter() - t0
+        # Decoding the JSON replies is the kiosk's work, so it stays out of the timed loop.
+        for event, response, invalidated in results:
+            status = (response.get_json() or {}).get("status")
+            outcome = status if status in OUTCOMES else "error"
+            label = event.get("label") or "unlabelled"
+            outcomes[outcome] += 1
+            by_label[label][outcome] += 1
+            if invalidated:
+                invalidations += invalidated
+                by_label[label]["invalidations"] += invalidated
+        alerts = Counter()
+        for summary in (gate.db_ref.child(summary_stream("security_alerts")).get() or {}).values():
+            alerts.update((summary or {}).get("by_type") or {})
+    return {
+        "mode": mode,
+        "events": len(trace),
+        "seconds": round(elapsed, 4),
+        "events_per_second": round(len(trace) / elapsed, 1) if elapsed else None,
+        "outcomes": {name: outcomes.get(name, 0) for name in OUTCOMES},
+        "invalidations": invalidations,
+        "alerts": dict(sorted(alerts.items())),
+        "by_label": {label: dict(counts) for label, counts in sorted(by_label.items())},
+    }
+
+
+_worker_gate = None
+
+
+def _replay_in_worker(population, trace, mode, probes):
+    global _worker_gate
+    if _worker_gate is None:
+        _worker_gate = load_gate()
+    return replay_mode(_worker_gate, population, trace, mode, probes=probes)
+
+
+def replay(gate, population, trace, modes=MODES, noise=0.35, seed=0, jobs=1):
+    """
+    replay_mode for each of *modes* with the same probe vectors. Returns {mode: stats}.
+
+    With *jobs* > 1 the modes run in separate processes (each loads its own
+    gate module; *gate* may then be None). A mode's replay is sequential,
+    since every attempt depends on the state the previous ones left.
+    """
+    probes = precompute_probes(population, trace, noise=noise, seed=seed)
+    if jobs > 1 and len(modes) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(modes))) as pool:
+            futures = {mode: pool.submit(_replay_in_worker, population, trace, mode, probes) for mode in modes}
+            return {mode: future.result() for mode, future in futures.items()}
+    return {mode: replay_mode(gate, population, trace, mode, probes=probes) for mode in modes}
+
+
+# ──────────────────────────────────────────────
+# Synthetic workload
+# ──────────────────────────────────────────────
+
+def _identity_vectors(rng, n, populations=48):
+    """dlib-like identity embeddings (inter-person distance ~0.6-1.1), as in benchmarks/ann_benchmark.py."""
+    centres = rng.normal(0, 1, (populations, EMBEDDING_DIM))
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    ids = 0.55 * centres[rng.integers(0, populations, n)] + rng.normal(0, 0.6 / np.sqrt(EMBEDDING_DIM), (n, EMBEDDING_DIM))
+    ids *= 0.9 / np.linalg.norm(ids, axis=1, keepdims=True)
+    return ids
+
+
+def _near(rng, vec, distance):
+    """A vector about *distance* away from *vec* (twins, lookalikes)."""
+    return vec + rng.normal(0, distance / np.sqrt(EMBEDDING_DIM), vec.shape)
+
+
+def synthetic_workload(visitors=1000, impostors=None, mix=None, day=None, seed=7,
+                       twin_distance=0.2, lookalike_distance=0.3):
+    """
+    (population, trace) for *visitors* registered visitors, each given one role from *mix*
+    (default DEFAULT_MIX), plus *impostors* unregistered faces trying face-only check-ins
+    (default: 5% of visitors). Arrivals fall between 08:00 and 16:00 on *day*.
+    """
+    rng = np.random.default_rng(seed)
+    mix = mix or DEFAULT_MIX
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    impostors = max(1, visitors // 20) if impostors is None else impostors
+    roles = list(mix)
+    weights = np.asarray([mix[r] for r in roles], dtype=np.float64)
+    assigned = rng.choice(len(roles), visitors, p=weights / weights.sum())
+    vectors = _identity_vectors(rng, visitors + impostors)
+    opening = datetime.strptime(f"{day} 08:00:00", TIME_FORMAT)
+
+    population = {"day": day, "visitors": {}, "outsiders": {}}
+    trace = []
+
+    def event(at, action, face, qr, label):
+        trace.append({"t": at.strftime(TIME_FORMAT), "action": action, "face": face, "qr": qr,
+                      "label": label, "kiosk": f"gate-{len(trace) % 3 + 1}"})
+
+    for i in range(visitors):
+        vid, role = f"v{i:06d}", roles[assigned[i]]
+        population["visitors"][vid] = {"embedding": vectors[i].tolist(), "blacklisted": role == "blacklisted"}
+        arrive = opening + timedelta(seconds=int(rng.integers(0, 8 * 3600)))
+        leave = arrive + timedelta(minutes=int(rng.integers(20, 240)))
+        attacker = f"x{i:06d}"
+        if role == "twin":
+            population["visitors"][f"{vid}t"] = {"embedding": _near(rng, vectors[i], twin_distance).tolist()}
+        if role in ("lookalike_qr", "lookalike_face"):
+            population["outsiders"][attacker] = _near(rng, vectors[i], lookalike_distance).tolist()
+        elif role in ("stolen_qr", "qr_replay"):
+            population["outsiders"][attacker] = vectors[visitors + int(rng.integers(0, impostors))].tolist()
+
+        if role == "legit_face_only":
+            event(arrive, "checkin", vid, None, role)
+            event(leave, "checkout", vid, None, role)
+            continue
+        if role == "blacklisted":
+            event(arrive, "checkin", vid, vid, role)
+            continue
+        early = arrive - timedelta(minutes=int(rng.integers(5, 60)))
+        if role in ("stolen_qr", "lookalike_qr"):
+            event(early, "checkin", attacker, vid, role)
+        elif role == "lookalike_face":
+            event(early, "checkin", attacker, None, role)
+        label = "victim" if role in ("stolen_qr", "lookalike_qr", "lookalike_face", "qr_replay") else role
+        event(arrive, "checkin", vid, vid, label)
+        event(leave, "checkout", vid, None if role == "qr_in_face_out" else vid, label)
+        if role == "qr_replay":
+            event(leave + timedelta(minutes=int(rng.integers(5, 90))), "checkin", attacker, vid, role)
+
+    for j in range(impostors):
+        oid = f"o{j:06d}"
+        population["outsiders"][oid] = vectors[visitors + j].tolist()
+        event(opening + timedelta(seconds=int(rng.integers(0, 10 * 3600))), "checkin", oid, None, "impostor_face")
+
+    trace.sort(key=lambda e: e["t"])
+    return population, trace
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def save_workload(population, trace, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "population.json"), "w", encoding="utf-8") as fh:
+        json.dump(population, fh)
+    with open(os.path.join(out_dir, "trace.jsonl"), "w", encoding="utf-8") as fh:
+        for event in trace:
+            fh.write(json.dumps(event) + "\n")
+
+
+# ──────────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────────
+
+def print_results(results):
+    modes = list(results)
+    print(f"{'':>20}" + "".join(f"{m:>12}" for m in modes))
+    rows = [("events/s", lambda s: s["events_per_second"])]
+    rows += [(name, lambda s, n=name: s["outcomes"][n]) for name in OUTCOMES]
+    rows.append(("invalidations", lambda s: s["invalidations"]))
+    for title, get in rows:
+        print(f"{title:>20}" + "".join(f"{get(results[m]):>12}" for m in modes))
+
+    labels = sorted({label for stats in results.values() for label in stats["by_label"]})
+    print("\ngranted+checked_out / denied / invalidations per label")
+    print(f"{'':>20}" + "".join(f"{m:>14}" for m in modes))
+    for label in labels:
+        cells = []
+        for m in modes:
+            counts = results[m]["by_label"].get(label, {})
+            cells.append(f"{counts.get('granted', 0) + counts.get('checked_out', 0)}/"
+                         f"{counts.get('denied', 0)}/{counts.get('invalidations', 0)}")
+        print(f"{label:>20}" + "".join(f"{c:>14}" for c in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a gate trace under hybrid, face_only and qr_only.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, metavar="VISITORS", help="Generate a population of this size")
+    source.add_argument("--population", help="Population JSON (use with --trace)")
+    parser.add_argument("--trace", help="Trace JSON lines (use with --population)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--probe-noise", type=float, default=0.35,
+                        help="Distance of live probes from the enrolled vector (default 0.35)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--jobs", type=int, default=min(len(MODES), os.cpu_count() or 1),
+                        help="Modes replayed in parallel processes (default: one per mode, up to the CPU count)")
+    parser.add_argument("--save-synthetic", metavar="DIR", help="Also write the generated population/trace here")
+    parser.add_argument("--json", dest="json_out", help="Write the full results as JSON")
+    args = parser.parse_args()
+    if args.population and not args.trace:
+        print("ERROR: --population needs --trace.")
+        sys.exit(1)
+
+    if args.synthetic:
+        population, trace = synthetic_workload(args.synthetic, seed=args.seed)
+        if args.save_synthetic:
+            save_workload(population, trace, args.save_synthetic)
+    else:
+        with open(args.population, encoding="utf-8") as fh:
+            population = json.load(fh)
+        trace = load_trace(args.trace)
+
+    gate = load_gate() if args.jobs <= 1 else None
+    print(f"{len(population['visitors'])} visitor(s), {len(population.get('outsiders', {}))} outsider(s), "
+          f"{len(trace)} event(s) on {population['day']}\n")
+    results = replay(gate, population, trace, modes=args.modes, noise=args.probe_noise, seed=args.seed,
+                     jobs=args.jobs)
+    print_results(results)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
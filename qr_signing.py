@@ -0,0 +1,90 @@
+"""
+Signed (v2) QR payloads shared by registration and the gate.
+=============================================
+A v1 QR is plain JSON:
+
+    {"v": visitor_id, "i": visit_id, "k": token, "e": "YYYY-mm-dd HH:MM:SS"}
+
+and the gate can only tell a forged or edited one apart by reading
+``visitors/{v}/visits/{i}`` and comparing the token. A v2 QR adds a version
+and an HMAC-SHA256 over those four fields, keyed with ``QR_SIGNING_KEY``
+(the same value in registration/.env and gate/.env):
+
+    {"q": 2, "v": ..., "i": ..., "k": ..., "e": ..., "s": base64url(hmac[:16])}
+
+``verify_qr_signature`` rejects a forged, tampered or truncated code with no
+I/O; the gate then goes to Firebase only for the token and state checks.
+Unsigned v1 codes are still accepted unless ``QR_REQUIRE_SIGNED`` is set
+(useful once every v1 code in circulation has expired, 36 h after rollout).
+
+The key is read from the environment on every call, so it is picked up
+after the apps run load_dotenv. Without a key, v1 payloads are generated and
+v2 signatures cannot be checked (the DB token check still applies).
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+QR_PAYLOAD_VERSION = 2
+SIGNATURE_BYTES = 16  # 128-bit tag keeps the QR a size smaller than the full digest
+
+
+def signing_key(environ=None):
+    """Server-held HMAC key as bytes, or None when QR_SIGNING_KEY is unset."""
+    key = (environ if environ is not None else os.environ).get("QR_SIGNING_KEY", "").strip()
+    return key.encode("utf-8") if key else None
+
+
+def signatures_required(environ=None):
+    value = (environ if environ is not None else os.environ).get("QR_REQUIRE_SIGNED", "0")
+    return value.strip().lower() in ("1", "true", "yes")
+
+
+def _mac(key, visitor_id, visit_id, expiry, token):
+    message = "\n".join(("qr", str(QR_PAYLOAD_VERSION), str(visitor_id), str(visit_id), str(expiry), str(token)))
+    digest = hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def build_qr_payload(visitor_id, visit_id, token, expiry, key=None):
+    """
+    Compact JSON for the QR image: v2 (signed) when a key is configured, else v1.
+
+    *expiry* is the "YYYY-mm-dd HH:MM:SS" string both apps already store as
+    ``qr_expires_at``; *key* defaults to ``signing_key()``.
+    """
+    key = key if key is not None else signing_key()
+    payload = {"v": str(visitor_id), "i": str(visit_id), "k": str(token), "e": str(expiry)}
+    if key:
+        payload = {"q": QR_PAYLOAD_VERSION, **payload, "s": _mac(key, visitor_id, visit_id, expiry, token)}
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def verify_qr_signature(qr_data, key=None, require_signed=None):
+    """
+    Offline check of a parsed QR payload: (ok, error_message | None).
+
+    v2 payloads must carry a valid signature for (v, i, e, k). v1 payloads pass
+    (the caller still checks the token against the DB) unless signatures are
+    required. With no key configured v2 signatures are not checked.
+    """
+    key = key if key is not None else signing_key()
+    require_signed = signatures_required() if require_signed is None else require_signed
+    version = qr_data.get("q")
+    if version is None and "s" not in qr_data:
+        if require_signed:
+            return False, "Unsigned QR codes are no longer accepted"
+        return True, None
+    if str(version) != str(QR_PAYLOAD_VERSION):
+        return False, "Unsupported QR version"
+    if not key:
+        return True, None
+    signature = str(qr_data.get("s") or "")
+    expected = _mac(key, qr_data.get("v", ""), qr_data.get("i", ""), qr_data.get("e", ""), qr_data.get("k", ""))
+    # compare_digest refuses non-ASCII str, which cannot be a valid tag anyway
+    if not signature.isascii() or not hmac.compare_digest(signature, expected):
+        return False, "QR signature invalid – possible forgery"
+    return True, None
@@ -7,6 +7,7 @@ import numpy as np
 import secrets
 import json
 import threading
+import atexit
 from io import BytesIO
 from collections import defaultdict, deque
 from flask import Flask, render_template, request, jsonify, redirect, session, url_for
@@ -26,6 +27,15 @@ _REPO_ROOT = Path(__file__).resolve().parent.parent
 if str(_REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(_REPO_ROOT))
 from presentation_demo import DEFAULT_DEPARTMENT_OPTIONS, PRESENTATION_ROOM_OPTIONS
+from face_index import is_blacklisted_record, match_faces, parse_embedding
+from face_engine import QUICK_CHECK_SIDE, WORKING_MAX_SIDE, FaceEngine, load_face_engine
+from face_workers import FaceWorkerPool, FaceWorkerPoolBusy
+from stage_order import AdaptiveStageOrder
+from frame_quality import FrameQualityGate
+from frame_upload import FrameUploadError, decode_frame, decode_frame_reduced, read_frame_upload
+from blacklist_index import BlacklistProjectionCache
+from embedding_codec import encode_embedding, decode_embedding
+from qr_signing import build_qr_payload
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -68,31 +78,14 @@ if not all([SMTP_SERVER, SMTP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD]):
     logger.error("WARNING: One or more SMTP environment variables are missing. Email functionality will fail.")
 
 # --- Upload folder ---
-UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads_reg")
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads_reg")  # created by init_registration()
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # --- Admin app URL (for meeting rooms list) ---
 ADMIN_APP_URL = os.environ.get("ADMIN_APP_URL", "http://localhost:5000").rstrip("/")
 
-# --- Firebase init with better error handling ---
-db_app = None
-try:
-    if not firebase_admin._apps:
-        cred = credentials.Certificate("firebase_credentials.json")
-        database_url = os.environ.get("FIREBASE_DATABASE_URL", "https://visitor-management-8f5b4-default-rtdb.firebaseio.com").rstrip("/") + "/"
-        db_app = firebase_admin.initialize_app(cred, {"databaseURL": database_url})
-        logger.info("Firebase initialized successfully")
-    else:
-        db_app = firebase_admin.get_app()
-        logger.info("Firebase already initialized")
-except FileNotFoundError:
-    logger.critical("FATAL ERROR: firebase_credentials.json not found. Database connection will fail.")
-except Exception as e:
-    logger.critical(f"FATAL ERROR: Firebase initialization error: {e}")
-
-# Global reference for the database
-db_ref = db.reference() if db_app else None
+# Global reference for the database (set by init_registration())
+db_ref = None
 
 # --- Visitor / visit policy helpers (registration + returning flow) ---
 
@@ -247,10 +240,89 @@ MSG_REGISTRATION_FACE_AMBIGUOUS = (
 )
 
 
-def _registration_biometric_blacklist_block(live_embedding, db_ref):
+# Blacklist-only face index (see blacklist_index.py); None until the projection has been seeded.
+BLACKLIST_INDEX_TTL_SECONDS = float(os.environ.get("BLACKLIST_INDEX_TTL_SECONDS", "5"))
+_blacklist_projection = BlacklistProjectionCache(ttl_seconds=BLACKLIST_INDEX_TTL_SECONDS)
+
+
+def _blacklisted_candidates_from_projection(live_embedding, db_ref, k=1):
+    """Nearest *k* blacklisted candidates from the projection (closest first).
+
+    Returns (available, candidates); available is False when the projection
+    is missing or unreadable and the caller must scan all visitors instead.
+    """
+    try:
+        index = _blacklist_projection.get(db_ref)
+    except Exception as e:
+        logger.warning("blacklist projection unavailable, falling back to full scan: %s", e)
+        return False, []
+    if index is None:
+        return False, []
+    return True, index.match(live_embedding, k=k).candidates
+
+
+def _nearest_blacklisted_from_projection(live_embedding, db_ref):
+    """Nearest blacklisted candidate from the projection: (available, candidate_or_none)."""
+    available, candidates = _blacklisted_candidates_from_projection(live_embedding, db_ref)
+    return available, (candidates[0] if candidates else None)
+
+
+def _own_record_candidate(live_embedding, visitor_id, basic_info):
+    """The registrant's existing record (same email) as a match candidate, or None."""
+    stored = parse_embedding((basic_info or {}).get("embedding"))
+    if visitor_id is None or stored is None:
+        return None
+    return {
+        "visitor_id": visitor_id,
+        "name": (basic_info or {}).get("name", "Unknown"),
+        # float32 query, as FaceIndex scores its candidates.
+        "distance": float(np.linalg.norm(stored.astype(np.float64) - live_embedding.astype(np.float32))),
+        "blacklisted": is_blacklisted_record(basic_info),
+    }
+
+
+def _blacklist_decision(best, second, threshold, twin_gap, reason_of):
+    """verify_face's no-email rules over the two nearest candidates; see _registration_biometric_blacklist_block."""
+    if best is None or best["distance"] > threshold:
+        return False, None, None
+
+    gap = abs(second["distance"] - best["distance"]) if second is not None else float("inf")
+
+    # Ambiguous: blacklisted vs non-blacklisted within twin gap (same as verify_face Case B).
+    if (
+        second is not None
+        and gap < twin_gap
+        and (best["blacklisted"] != second["blacklisted"])
+    ):
+        logger.warning(
+            "Registration blocked: ambiguous face between blacklisted and non-blacklisted (gap=%.4f).",
+            gap,
+        )
+        return True, MSG_REGISTRATION_FACE_AMBIGUOUS, None
+
+    # Unambiguous blacklisted match: best is blacklisted and clearly wins, or both top matches are blacklisted.
+    if best["blacklisted"]:
+        if second is None or gap >= twin_gap or second["blacklisted"]:
+            vid_bl = best["visitor_id"]
+            logger.warning(
+                "Registration blocked: face matches blacklisted visitor %s (dist=%.4f).",
+                vid_bl,
+                best["distance"],
+            )
+            return True, MSG_BLACKLISTED, reason_of(vid_bl)
+
+    return False, None, None
+
+
+def _registration_biometric_blacklist_block(live_embedding, db_ref, own_visitor_id=None, own_basic_info=None):
     """Block registration if the captured face matches a blacklisted visitor (twin-aware).
 
     Mirrors verify_face's no-email path: VERIFICATION_THRESHOLD, fixed TWIN_GAP=0.08.
+    With a seeded projection the check reads no visitors tree: the two nearest
+    blacklisted faces come from the projection, the nearest one's record is
+    read to confirm it, and the registrant's own record (*own_visitor_id* /
+    *own_basic_info*, found by email) is the non-blacklisted candidate, as the
+    expected visitor is in verify_face.
 
     Returns:
         (deny, user_message, blacklist_reason_or_none)
@@ -273,78 +345,48 @@ def _registration_biometric_blacklist_block(live_embedding, db_ref):
         threshold = 0.65
     twin_gap = 0.08
 
-    try:
-        all_visitors = db_ref.child("visitors").get() or {}
-    except Exception as e:
-        logger.error("registration biometric blacklist: failed to load visitors: %s", e)
+    # Fast negative: a deny needs a blacklisted face within threshold (+ twin gap when
+    # ambiguous), so a distant nearest blacklisted face settles it without a full read.
+    available, blacklisted = _blacklisted_candidates_from_projection(le, db_ref, k=2)
+    if available and (not blacklisted or blacklisted[0]["distance"] > threshold + twin_gap):
         return False, None, None
 
-    candidates = []
-    for vid, vdata in all_visitors.items():
-        if not isinstance(vdata, dict):
-            continue
-        basic = vdata.get("basic_info") or {}
-        if not isinstance(basic, dict):
-            basic = {}
-        emb_str = basic.get("embedding")
-        if not emb_str:
-            continue
+    if available:
+        nearest = blacklisted[0]
         try:
-            stored = np.array([float(x) for x in str(emb_str).strip().split()], dtype=np.float64)
-            if stored.size != le.size:
-                continue
-            dist = float(np.linalg.norm(le - stored))
-            is_bl = _visitor_basic_is_blacklisted(basic, vdata)
-            candidates.append(
-                {
-                    "visitor_id": vid,
-                    "distance": dist,
-                    "is_blacklisted": is_bl,
-                    "name": basic.get("name", "Unknown"),
-                }
+            record = db_ref.child(f"visitors/{nearest['visitor_id']}/basic_info").get()
+        except Exception as e:
+            logger.error("registration biometric blacklist: failed to read candidate: %s", e)
+            record = None
+        if isinstance(record, dict) and is_blacklisted_record(record):
+            candidates = list(blacklisted)
+            own = _own_record_candidate(le, own_visitor_id, own_basic_info)
+            if own is not None and own["visitor_id"] not in {c["visitor_id"] for c in candidates}:
+                candidates.append(own)
+            candidates.sort(key=lambda c: c["distance"])
+            return _blacklist_decision(
+                candidates[0], candidates[1] if len(candidates) > 1 else None, threshold, twin_gap,
+                lambda vid: record.get("blacklist_reason", "Security restriction"),
             )
-        except Exception as ex:
-            logger.error("registration biometric blacklist: embedding error for %s: %s", vid, ex)
-            continue
+        # Projection disagrees with the visitor record (stale): decide from the full tree.
+        logger.warning(
+            "blacklist projection entry %s is stale; checking all visitors", nearest["visitor_id"]
+        )
 
-    if not candidates:
+    try:
+        all_visitors = db_ref.child("visitors").get() or {}
+    except Exception as e:
+        logger.error("registration biometric blacklist: failed to load visitors: %s", e)
         return False, None, None
 
-    candidates.sort(key=lambda c: c["distance"])
-    best = candidates[0]
-    min_distance = best["distance"]
-    if min_distance > threshold:
-        return False, None, None
+    # One vectorised pass: nearest two candidates + gap (shared with the gate's matcher).
+    result = match_faces(le, all_visitors, k=2)
 
-    second = candidates[1] if len(candidates) > 1 else None
-    gap = abs(second["distance"] - best["distance"]) if second is not None else float("inf")
+    def reason_of(vid):
+        bi = (all_visitors.get(vid) or {}).get("basic_info") or {}
+        return bi.get("blacklist_reason", "Security restriction")
 
-    # Ambiguous: blacklisted vs non-blacklisted within twin gap (same as verify_face Case B).
-    if (
-        second is not None
-        and gap < twin_gap
-        and (best["is_blacklisted"] != second["is_blacklisted"])
-    ):
-        logger.warning(
-            "Registration blocked: ambiguous face between blacklisted and non-blacklisted (gap=%.4f).",
-            gap,
-        )
-        return True, MSG_REGISTRATION_FACE_AMBIGUOUS, None
-
-    # Unambiguous blacklisted match: best is blacklisted and clearly wins, or both top matches are blacklisted.
-    if best["is_blacklisted"]:
-        if second is None or gap >= twin_gap or second["is_blacklisted"]:
-            vid_bl = best["visitor_id"]
-            bi = (all_visitors.get(vid_bl) or {}).get("basic_info") or {}
-            reason = bi.get("blacklist_reason", "Security restriction")
-            logger.warning(
-                "Registration blocked: face matches blacklisted visitor %s (dist=%.4f).",
-                vid_bl,
-                min_distance,
-            )
-            return True, MSG_BLACKLISTED, reason
-
-    return False, None, None
+    return _blacklist_decision(result.best, result.runner_up, threshold, twin_gap, reason_of)
 
 
 def collect_department_choices():
@@ -380,48 +422,6 @@ def _merge_rooms_for_registration(remote_dict):
 _script_dir = os.path.dirname(os.path.abspath(__file__))
 detector = predictor = face_recognizer = _cv_face_cascade = _cv_face_alt2 = _yunet_detector = None
 _yunet_model_path = None
-if dlib:
-    try:
-        _shape_path = os.path.join(_script_dir, "shape_predictor_68_face_landmarks.dat")
-        _face_model_path = os.path.join(_script_dir, "dlib_face_recognition_resnet_model_v1.dat")
-        detector = dlib.get_frontal_face_detector()
-        predictor = dlib.shape_predictor(_shape_path)
-        face_recognizer = dlib.face_recognition_model_v1(_face_model_path)
-        _cv_face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-        )
-        try:
-            _cv_face_alt2 = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_alt2.xml")
-        except Exception:
-            _cv_face_alt2 = None
-        _yunet_model_path = os.path.abspath(os.path.join(_script_dir, "..", "gate", "face_detection_yunet_2023mar.onnx"))
-        if hasattr(cv2, "FaceDetectorYN") and os.path.isfile(_yunet_model_path):
-            try:
-                _yunet_detector = cv2.FaceDetectorYN.create(_yunet_model_path, "", (320, 320))
-                logger.info("YuNet + Dlib + Haar loaded (YuNet primary)")
-            except Exception as e:
-                logger.warning("YuNet init failed, using dlib+Haar only: %s", e)
-                _yunet_detector = None
-        else:
-            if not hasattr(cv2, "FaceDetectorYN"):
-                logger.info("OpenCV FaceDetectorYN not available; using Dlib + Haar only")
-            elif not os.path.isfile(_yunet_model_path):
-                logger.info("YuNet model not found at %s; using Dlib + Haar only", _yunet_model_path)
-            logger.info("Dlib + OpenCV Haar loaded")
-    except Exception as e:
-        logger.error("WARNING: Dlib model files not found or initialized: %s", e)
-
-def _embed_from_bbox(rgb_img, x, y, w, h):
-    """Compute dlib 128D embedding from a face bounding box (e.g. from YuNet)."""
-    if not predictor or not face_recognizer:
-        return None
-    try:
-        dlib_rect = dlib.rectangle(int(x), int(y), int(x + w), int(y + h))
-        shape = predictor(rgb_img, dlib_rect)
-        emb = face_recognizer.compute_face_descriptor(rgb_img, shape)
-        return np.array(emb)
-    except Exception:
-        return None
 
 def _to_dlib_format(img, rgb=True):
     """Ensure image is uint8 contiguous for dlib (8-bit gray or RGB). Fixes NumPy 2.0 / dlib compatibility."""
@@ -437,127 +437,56 @@ def _to_dlib_format(img, rgb=True):
         return None
 
 
-def _get_face_embedding_at_scale(cv2_img, min_side):
-    """Run full detection pipeline at one scale. min_side=0 means no resize."""
-    if cv2_img is None or cv2_img.size == 0:
-        return None
-    cv2_img = np.ascontiguousarray(cv2_img.astype(np.uint8))
-    bgr_img = cv2_img
-    rgb_img = _to_dlib_format(cv2_img, rgb=True)
-    gray_img = np.ascontiguousarray(cv2.cvtColor(cv2_img, cv2.COLOR_BGR2GRAY).astype(np.uint8))
-    h, w = rgb_img.shape[:2]
-    if min_side > 0 and min(h, w) < min_side:
-        scale = min_side / min(h, w)
-        new_w, new_h = int(w * scale), int(h * scale)
-        bgr_img = cv2.resize(bgr_img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-        rgb_img = cv2.resize(rgb_img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-        gray_img = cv2.resize(gray_img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-    bgr_img = np.ascontiguousarray(bgr_img)
-    rgb_img = np.ascontiguousarray(rgb_img)
-    gray_img = np.ascontiguousarray(gray_img)
-    h, w = rgb_img.shape[:2]
-
-    # Try Haar first (often more forgiving for frontal faces in varied lighting)
-    for cascade in (_cv_face_cascade, _cv_face_alt2):
-        if cascade is None:
-            continue
-        for (sf, mn, ms) in [(1.25, 2, (15, 15)), (1.2, 2, (20, 20)), (1.15, 3, (15, 15)), (1.1, 2, (25, 25))]:
-            rects = cascade.detectMultiScale(gray_img, scaleFactor=sf, minNeighbors=mn, minSize=ms)
-            if len(rects) > 0:
-                x, y, rw, rh = max(rects, key=lambda r: r[2] * r[3])
-                out = _embed_from_bbox(rgb_img, x, y, rw, rh)
-                if out is not None:
-                    return out
+# One detector pass + one descriptor per frame; fallbacks only within FACE_ENGINE_BUDGET_MS.
+# Stage order adapts to this kiosk's camera and is saved to FACE_ENGINE_STATS_PATH.
+FACE_ENGINE_BUDGET_MS = float(os.environ.get("FACE_ENGINE_BUDGET_MS", "250"))
+FACE_ENGINE_STATS_PATH = (
+    os.environ.get("FACE_ENGINE_STATS_PATH", "").strip()
+    or os.path.join(_script_dir, "face_engine_stats.json")
+)
+# Decode large JPEGs at 1/2, 1/4 or 1/8 scale (IMREAD_REDUCED_*) close to the detector's working size
+REDUCED_JPEG_DECODE = os.environ.get("REDUCED_JPEG_DECODE", "1").strip().lower() in ("1", "true", "yes")
+# Face embedding worker processes (0 = embed inline in the request thread)
+FACE_WORKERS = int(os.environ.get("FACE_WORKERS", "0"))
+FACE_WORKER_MAX_PENDING = int(os.environ.get("FACE_WORKER_MAX_PENDING", "0"))  # 0 = 2 x FACE_WORKERS
+_stage_order = None
+face_engine = None  # FaceEngine once init_registration() has loaded the models
+face_pool = None
+
+# Cheap blur/brightness/motion screening before face detection (thresholds: FRAME_QUALITY_*)
+frame_quality = (
+    FrameQualityGate.from_env(os.environ)
+    if os.environ.get("FRAME_QUALITY_GATE", "1").strip().lower() in ("1", "true", "yes") else None
+)
 
-    if _yunet_detector is not None:
-        _yunet_detector.setInputSize((w, h))
-        _, dets = _yunet_detector.detect(bgr_img)
-        if dets is not None and dets.shape[0] >= 1:
-            x, y, rw, rh = dets[0, 0], dets[0, 1], dets[0, 2], dets[0, 3]
-            if rw > 0 and rh > 0:
-                out = _embed_from_bbox(rgb_img, x, y, rw, rh)
-                if out is not None:
-                    return out
-        bgr_f = cv2.flip(bgr_img, 1)
-        rgb_f = cv2.flip(rgb_img, 1)
-        _yunet_detector.setInputSize((w, h))
-        _, dets = _yunet_detector.detect(bgr_f)
-        if dets is not None and dets.shape[0] >= 1:
-            x, y, rw, rh = dets[0, 0], dets[0, 1], dets[0, 2], dets[0, 3]
-            if rw > 0 and rh > 0:
-                out = _embed_from_bbox(rgb_f, x, y, rw, rh)
-                if out is not None:
-                    return out
-
-    def try_detect(rgb, gray):
-        for img in (gray, rgb):
-            for upsample in (0, 1, 2, 3, 4):
-                faces = detector(img, upsample)
-                if len(faces) > 0:
-                    face = faces[0]
-                    shape = predictor(rgb, face)
-                    emb = face_recognizer.compute_face_descriptor(rgb, shape)
-                    return np.array(emb)
-        for cascade in (_cv_face_cascade, _cv_face_alt2):
-            if cascade is None:
-                continue
-            for (sf, mn, ms) in [
-                (1.3, 2, (10, 10)), (1.2, 3, (15, 15)), (1.15, 4, (20, 20)),
-                (1.1, 5, (30, 30)), (1.05, 3, (20, 20)), (1.1, 2, (25, 25)),
-            ]:
-                rects = cascade.detectMultiScale(gray, scaleFactor=sf, minNeighbors=mn, minSize=ms)
-                if len(rects) > 0:
-                    x, y, rw, rh = max(rects, key=lambda r: r[2] * r[3])
-                    dlib_rect = dlib.rectangle(int(x), int(y), int(x + rw), int(y + rh))
-                    shape = predictor(rgb, dlib_rect)
-                    emb = face_recognizer.compute_face_descriptor(rgb, shape)
-                    return np.array(emb)
-        return None
+def decode_kiosk_frame(frame_bytes, target_side=WORKING_MAX_SIDE):
+    """(cv2_img, jpeg_source): reduced-resolution JPEG decode unless REDUCED_JPEG_DECODE is off."""
+    if REDUCED_JPEG_DECODE:
+        return decode_frame_reduced(frame_bytes, target_side)
+    return decode_frame(frame_bytes), None
 
-    out = try_detect(rgb_img, gray_img)
-    if out is not None:
-        return out
-    rgb_f = cv2.flip(rgb_img, 1)
-    gray_f = cv2.flip(gray_img, 1)
-    return try_detect(rgb_f, gray_f)
 
-def get_face_embedding(cv2_img):
-    """Try multiple scales (downscale and upscale); YuNet + dlib + Haar. No placeholder."""
-    if not predictor or not face_recognizer or cv2_img is None or cv2_img.size == 0:
+def get_face_embedding(cv2_img, source=None):
+    """YuNet first, then Haar/dlib HOG fallbacks within the frame budget; one descriptor. No placeholder."""
+    if face_engine is None or cv2_img is None or cv2_img.size == 0:
         return None
+    if face_pool is not None:
+        try:
+            return face_pool.embed(cv2_img, source=source)
+        except FaceWorkerPoolBusy as e:
+            # Shed load: the kiosk treats this like a frame without a face and sends the next one.
+            logger.warning(f"Face workers saturated, frame dropped: {e}")
+            return None
+        except Exception as e:
+            logger.error("Face worker embedding error: %s", e)
+            return None
     try:
-        h, w = cv2_img.shape[:2]
-        max_side = max(h, w)
-        images_to_try = [cv2_img]
-        # Downscale for large images (detectors often work better at 480–640px)
-        if max_side > 640:
-            scale = 640.0 / max_side
-            small = cv2.resize(cv2_img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_LINEAR)
-            images_to_try.append(small)
-        if max_side > 480:
-            scale = 480.0 / max_side
-            small = cv2.resize(cv2_img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_LINEAR)
-            images_to_try.append(small)
-        # Upscale for small images (face may be too small to detect)
-        if max_side < 400:
-            scale = 480.0 / max_side
-            large = cv2.resize(cv2_img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_LINEAR)
-            images_to_try.append(large)
-        # Histogram equalization can help in poor lighting
-        gray = cv2.cvtColor(cv2_img, cv2.COLOR_BGR2GRAY)
-        gray_eq = cv2.equalizeHist(gray)
-        gray_eq_bgr = cv2.cvtColor(gray_eq, cv2.COLOR_GRAY2BGR)
-        images_to_try.append(gray_eq_bgr)
-        # Mirrored image (webcam often shows mirrored view; capture might differ)
-        images_to_try.append(cv2.flip(cv2_img, 1))
-
-        for img in images_to_try:
-            for min_side in (0, 256, 320, 400, 512, 200):
-                out = _get_face_embedding_at_scale(img, min_side)
-                if out is not None:
-                    logger.info("Generated embedding (Register) - shape %s", out.shape)
-                    return out
-        return None
+        result = face_engine.embed(cv2_img, source=source)
+        if result.embedding is not None:
+            logger.info("Generated embedding (Register) - %s (total %.1fms)", result.summary(), result.elapsed_ms)
+        else:
+            logger.debug("No face: %s (total %.1fms)", result.summary(), result.elapsed_ms)
+        return result.embedding
     except Exception as e:
         logger.error("Dlib embedding error: %s", e)
         return None
@@ -798,19 +727,14 @@ def _generate_qr_token():
     return secrets.token_urlsafe(32)
 
 def _generate_qr_payload(visitor_id, visit_id, visit_date, token):
-    """Create the compact JSON payload for the QR code."""
+    """Create the compact JSON payload for the QR code (HMAC-signed v2 when QR_SIGNING_KEY is set)."""
     try:
         date_obj = datetime.strptime(str(visit_date), "%Y-%m-%d")
         expiry = date_obj + timedelta(hours=QR_EXPIRY_HOURS)
     except (ValueError, TypeError):
         expiry = datetime.now() + timedelta(hours=QR_EXPIRY_HOURS)
 
-    return json.dumps({
-        "v": str(visitor_id),
-        "i": str(visit_id),
-        "k": str(token),
-        "e": expiry.strftime("%Y-%m-%d %H:%M:%S"),
-    }, separators=(",", ":"))
+    return build_qr_payload(visitor_id, visit_id, token, expiry.strftime("%Y-%m-%d %H:%M:%S"))
 
 def _generate_qr_image_base64(payload_string):
     """Generate QR code image and return as data-URI base64 string."""
@@ -964,6 +888,8 @@ def api_debug_detect():
 
     emb = get_face_embedding(cv2_img)
     results["final_embedding"] = emb is not None
+    if face_engine is not None:
+        results["engine_timings"] = face_engine.detect(cv2_img).timings
     return jsonify(results)
 
 
@@ -1043,6 +969,9 @@ def api_face_debug():
         "shape_path": os.path.join(_script_dir, "shape_predictor_68_face_landmarks.dat"),
         "shape_exists": os.path.isfile(os.path.join(_script_dir, "shape_predictor_68_face_landmarks.dat")),
         "face_model_exists": os.path.isfile(os.path.join(_script_dir, "dlib_face_recognition_resnet_model_v1.dat")),
+        "face_engine": face_engine.stats() if face_engine is not None else None,
+        "face_workers": face_pool.stats() if face_pool is not None else None,
+        "frame_quality": frame_quality.stats() if frame_quality is not None else None,
     })
 
 
@@ -1050,32 +979,39 @@ def api_face_debug():
 def api_check_face():
     """Check if a face is detectable in the image. Used for live feedback during registration."""
     try:
-        data = request.get_json() or {}
-        img_b64 = data.get("image")
-        if not img_b64 or "," not in str(img_b64):
+        try:
+            _, frame_bytes = read_frame_upload(request)
+        except FrameUploadError:
+            frame_bytes = None
+        if frame_bytes is None:
             return jsonify({"face_detected": False, "error": "No image"}), 400
 
-        photo_base64 = str(img_b64).split(",")[1]
-        np_img = np.frombuffer(base64.b64decode(photo_base64), np.uint8)
-        cv2_img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+        cv2_img, _ = decode_kiosk_frame(frame_bytes, QUICK_CHECK_SIDE)
         if cv2_img is None:
             return jsonify({"face_detected": False, "error": "Invalid image"}), 400
 
-        if not predictor or not face_recognizer:
+        if face_engine is None:
             return jsonify({"face_detected": False, "error": "Face recognition not loaded"}), 500
 
-        emb = get_face_embedding(cv2_img)
-        if emb is None:
+        kiosk_id = f"{request.remote_addr}:check"
+        if frame_quality is not None:
+            verdict = frame_quality.assess(cv2_img, kiosk_id=kiosk_id)
+            if not verdict.ok:
+                return jsonify({"face_detected": False, "hint": verdict.hint, "quality_reason": verdict.reason})
+
+        # Detection only (one small YuNet pass); the descriptor is computed at submit time.
+        check = face_engine.quick_check(cv2_img)
+        if frame_quality is not None:
+            frame_quality.record_outcome(kiosk_id, check.face_detected)
+        if not check.face_detected:
             try:
                 debug_dir = os.path.join(_script_dir, "debug_frames")
                 os.makedirs(debug_dir, exist_ok=True)
                 cv2.imwrite(os.path.join(debug_dir, "last_no_face.jpg"), cv2_img)
             except Exception:
                 pass
-        return jsonify({
-            "face_detected": emb is not None and len(emb) == 128,
-            "hint": "Face the camera directly, ensure good lighting, move slightly closer." if emb is None else None,
-        })
+            check.hint = "Face the camera directly, ensure good lighting, move slightly closer."
+        return jsonify(check.to_dict())
     except Exception as e:
         logger.exception("check_face error: %s", e)
         return jsonify({"face_detected": False, "error": str(e)}), 500
@@ -1087,8 +1023,12 @@ def finalize_registration():
         # Clear any existing session data first
         session.clear()
         
-        data = request.get_json()
-        if not data:
+        # JSON with a photo_base64 data URL, or multipart with the photo as a "photo" file part.
+        try:
+            data, photo_bytes = read_frame_upload(request, field="photo", json_field="photo_base64")
+        except FrameUploadError:
+            return jsonify({"success": False, "message": "Invalid photo data"}), 400
+        if not data and photo_bytes is None:
             return jsonify({"success": False, "message": "No data received"}), 400
 
         logger.info(f"--- STARTING NEW REGISTRATION FOR: {data.get('name')} ---")
@@ -1099,10 +1039,9 @@ def finalize_registration():
         name = data.get("name")
         email = data.get("email")
         duration = data.get("duration", "Not sure")
-        photo_base64_full = data.get("photo_base64")
         visit_date = data.get("visit_date")
 
-        if not all([name, email, photo_base64_full]):
+        if not all([name, email, photo_bytes]):
             return jsonify({"success": False, "message": "Missing required fields"}), 400
 
         ip_addr = _client_ip(request)
@@ -1114,11 +1053,6 @@ def finalize_registration():
             resp.headers["Retry-After"] = str(pre_retry)
             return resp
 
-        if not photo_base64_full or "," not in photo_base64_full:
-            return jsonify({"success": False, "message": "Invalid photo data"}), 400
-
-        photo_base64 = photo_base64_full.split(",")[1]
-
         # Handle purpose: department visit vs free-text "other"
         purpose_type = data.get("purposeType")
         department_choice = (data.get("departmentSelect") or "").strip()
@@ -1149,8 +1083,6 @@ def finalize_registration():
 
         # Save photo to uploads_reg folder
         try:
-            image_data = base64.b64decode(photo_base64)
-            
             uploads_reg_folder = "uploads_reg"
             if not os.path.exists(uploads_reg_folder):
                 os.makedirs(uploads_reg_folder)
@@ -1159,7 +1091,7 @@ def finalize_registration():
             filepath = os.path.join(uploads_reg_folder, filename)
             
             with open(filepath, "wb") as f:
-                f.write(image_data)
+                f.write(photo_bytes)
             
             photo_url = f"/uploads_reg/{filename}"
             logger.info(f"Photo saved successfully: {filename}")
@@ -1175,8 +1107,7 @@ def finalize_registration():
                     "success": False,
                     "message": "Face recognition is not available. Please ensure dlib and model files (shape_predictor_68_face_landmarks.dat, dlib_face_recognition_resnet_model_v1.dat) are installed in registration/."
                 }), 500
-            np_img = np.frombuffer(base64.b64decode(photo_base64), np.uint8)
-            cv2_img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+            cv2_img = decode_frame(photo_bytes)
             if cv2_img is None:
                 return jsonify({
                     "success": False,
@@ -1190,7 +1121,7 @@ def finalize_registration():
                 }), 400
             embedding_array = get_face_embedding(cv2_img)
             if embedding_array is not None:
-                embedding_str = " ".join(map(str, embedding_array.flatten().tolist()))
+                embedding_str = encode_embedding(embedding_array)
             else:
                 logger.warning("No face detected in registration photo")
                 return jsonify({
@@ -1275,7 +1206,10 @@ def finalize_registration():
             }), 403
 
         # Biometric blacklist: same person cannot bypass blacklist by registering with a new email.
-        bio_deny, bio_msg, bio_reason = _registration_biometric_blacklist_block(embedding_array, db_ref)
+        bio_deny, bio_msg, bio_reason = _registration_biometric_blacklist_block(
+            embedding_array, db_ref,
+            own_visitor_id=visitor_id if existing_basic is not None else None, own_basic_info=existing_basic,
+        )
         if bio_deny:
             if bio_msg == MSG_BLACKLISTED:
                 send_blacklist_registration_denial_email(email, name, bio_reason)
@@ -2011,22 +1945,28 @@ def debug_session():
     })
 @app.route("/verify-face", methods=['POST'])
 def verify_face():
-    data = request.get_json()
-    if not data or not isinstance(data, dict) or "image" not in data:
+    try:
+        _, frame_bytes = read_frame_upload(request)
+    except FrameUploadError:
+        return jsonify({"match": False, "message": "Invalid image data"}), 400
+    if frame_bytes is None:
         return jsonify({"match": False, "message": "Missing or invalid request body (image required)"}), 400
     logger.info("Face verification request received")
     
     try:
-        captured_base64 = data["image"].split(",")[1]
-        np_img = np.frombuffer(base64.b64decode(captured_base64), np.uint8)
-        cv2_img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+        cv2_img, jpeg_source = decode_kiosk_frame(frame_bytes)
         
         if cv2_img is None:
             logger.warning("Unable to decode image during verification")
             return jsonify({"match": False, "message": "Unable to process image"})
         
+        if frame_quality is not None:
+            verdict = frame_quality.assess(cv2_img, kiosk_id=f"{request.remote_addr}:verify")
+            if not verdict.ok:
+                return jsonify({"match": False, "message": verdict.hint, "quality_reason": verdict.reason})
+
         # Get live embedding
-        live_embedding = get_face_embedding(cv2_img)
+        live_embedding = get_face_embedding(cv2_img, source=jpeg_source)
         
         if live_embedding is None:
             logger.warning("No face detected during verification")
@@ -2065,7 +2005,9 @@ def verify_face():
             emb_str = basic_info.get("embedding")
             if emb_str:
                 try:
-                    stored_emb = np.array([float(x) for x in emb_str.strip().split()])
+                    stored_emb = decode_embedding(emb_str, dim=None)
+                    if stored_emb is None:
+                        raise ValueError("unreadable stored embedding")
                     if len(stored_emb) == len(live_embedding):
                         expected_dist = np.linalg.norm(live_embedding - stored_emb)
                         min_distance = expected_dist
@@ -2083,31 +2025,12 @@ def verify_face():
                 expected_dist = float("inf")
 
             # Twin-aware blacklist check: compare live face against all blacklisted visitors too.
-            all_visitors = db_ref.child("visitors").get() or {}
-            min_blacklisted_dist = float("inf")
-            closest_blacklisted_id = None
-            for vid, vdata in all_visitors.items():
-                basic = (vdata or {}).get("basic_info", {}) or {}
-                raw_bl = basic.get("blacklisted", vdata.get("blacklisted", "no"))
-                is_bl = raw_bl is True or (
-                    isinstance(raw_bl, str) and raw_bl.strip().lower() in ("yes", "true", "1")
-                )
-                if not is_bl:
-                    continue
-                emb_str_bl = basic.get("embedding")
-                if not emb_str_bl:
-                    continue
-                try:
-                    stored_bl = np.array([float(x) for x in emb_str_bl.strip().split()])
-                    if len(stored_bl) != len(live_embedding):
-                        continue
-                    dist_bl = np.linalg.norm(live_embedding - stored_bl)
-                    if dist_bl < min_blacklisted_dist:
-                        min_blacklisted_dist = dist_bl
-                        closest_blacklisted_id = vid
-                except Exception as e:
-                    logger.error(f"Error processing embedding for blacklisted visitor {vid}: {e}")
-                    continue
+            available, nearest_bl = _nearest_blacklisted_from_projection(live_embedding, db_ref)
+            if not available:
+                all_visitors = db_ref.child("visitors").get() or {}
+                nearest_bl = match_faces(live_embedding, all_visitors, k=1).best_blacklisted
+            min_blacklisted_dist = nearest_bl["distance"] if nearest_bl else float("inf")
+            closest_blacklisted_id = nearest_bl["visitor_id"] if nearest_bl else None
 
             logger.info(
                 f"Expected visitor distance={expected_dist:.4f}, "
@@ -2159,75 +2082,36 @@ def verify_face():
         else:
             # No expected visitor from email: search all visitors and keep top matches for twin/blacklist handling.
             all_visitors = db_ref.child("visitors").get() or {}
-            visitor_count = 0
-            valid_embeddings = 0
-            candidates = []  # list of dicts: {id, dist, is_blacklisted, name}
 
             logger.info(f"Total visitors in DB for verification: {len(all_visitors)}")
 
-            for vid, vdata in all_visitors.items():
-                visitor_count += 1
-                basic_info = (vdata or {}).get("basic_info", {}) or {}
-                emb_str = basic_info.get("embedding")
-                if not emb_str:
-                    continue
-
-                try:
-                    stored_emb = np.array([float(x) for x in emb_str.strip().split()])
-                    if len(stored_emb) != len(live_embedding):
-                        logger.warning(
-                            f"Embedding dimension mismatch for visitor {vid}: "
-                            f"stored={len(stored_emb)}, live={len(live_embedding)}"
-                        )
-                        continue
-
-                    dist = np.linalg.norm(live_embedding - stored_emb)
-                    valid_embeddings += 1
-
-                    raw_bl = basic_info.get("blacklisted", vdata.get("blacklisted", "no"))
-                    is_bl = raw_bl is True or (
-                        isinstance(raw_bl, str) and raw_bl.strip().lower() in ("yes", "true", "1")
-                    )
-                    candidates.append(
-                        {
-                            "visitor_id": vid,
-                            "distance": float(dist),
-                            "is_blacklisted": is_bl,
-                            "name": basic_info.get("name", "Unknown"),
-                        }
-                    )
-                except Exception as e:
-                    logger.error(f"Error processing embedding for visitor {vid}: {e}")
-                    continue
-
-            candidates.sort(key=lambda c: c["distance"])
+            # Single pass: top-2 candidates, best distance and twin gap together.
+            result = match_faces(live_embedding, all_visitors, k=2)
+            candidates = result.candidates
 
             if candidates:
                 best = candidates[0]
                 min_distance = best["distance"]
                 matched_id = best["visitor_id"]
                 logger.info(
-                    f"Verification summary: {visitor_count} visitors checked, "
-                    f"{valid_embeddings} valid embeddings, best distance: {min_distance:.4f}"
+                    f"Verification summary: {len(all_visitors)} visitors checked, "
+                    f"{result.scanned} valid embeddings in {result.elapsed_ms:.1f}ms, "
+                    f"best distance: {min_distance:.4f}"
                 )
             else:
                 logger.info(
-                    f"Verification summary: {visitor_count} visitors checked, "
-                    f"{valid_embeddings} valid embeddings, no candidates."
+                    f"Verification summary: {len(all_visitors)} visitors checked, "
+                    f"{result.scanned} valid embeddings, no candidates."
                 )
 
             # Twin-aware blacklist behavior for the no-email path.
             if candidates and min_distance <= THRESHOLD:
                 best = candidates[0]
-                second = candidates[1] if len(candidates) > 1 else None
-
-                if second is not None:
-                    gap = abs(second["distance"] - best["distance"])
-                else:
-                    gap = float("inf")
+                second = result.runner_up
+                gap = result.twin_gap
 
                 # Case A: best is blacklisted and clearly separated from second → treat as blacklisted.
-                if best["is_blacklisted"] and (second is None or gap >= TWIN_GAP):
+                if best["blacklisted"] and (second is None or gap >= TWIN_GAP):
                     visitor_name = best["name"]
                     logger.warning(
                         f"Blacklisted visitor matched in verify_face (no-email): "
@@ -2247,7 +2131,7 @@ def verify_face():
                 if (
                     second is not None
                     and gap < TWIN_GAP
-                    and (best["is_blacklisted"] != second["is_blacklisted"])
+                    and (best["blacklisted"] != second["blacklisted"])
                 ):
                     logger.warning(
                         "Ambiguous face match between blacklisted and non-blacklisted visitor "
@@ -2511,6 +2395,106 @@ def internal_error(error):
     logger.error(f"Internal server error: {error}")
     return render_template('500.html'), 500
 
+# --- Startup ---
+# Importing this module has no side effects beyond defining the app: face
+# worker processes (FACE_WORKERS, "spawn") re-import the launching script as
+# __mp_main__, and must not open Firebase or load a second copy of the dlib
+# models. python app.py and the WSGI entry point (Procfile) call
+# init_registration().
+
+def _init_database():
+    global db_ref
+    db_app = None
+    try:
+        if not firebase_admin._apps:
+            cred = credentials.Certificate("firebase_credentials.json")
+            database_url = os.environ.get("FIREBASE_DATABASE_URL", "https://visitor-management-8f5b4-default-rtdb.firebaseio.com").rstrip("/") + "/"
+            db_app = firebase_admin.initialize_app(cred, {"databaseURL": database_url})
+            logger.info("Firebase initialized successfully")
+        else:
+            db_app = firebase_admin.get_app()
+            logger.info("Firebase already initialized")
+    except FileNotFoundError:
+        logger.critical("FATAL ERROR: firebase_credentials.json not found. Database connection will fail.")
+    except Exception as e:
+        logger.critical(f"FATAL ERROR: Firebase initialization error: {e}")
+    db_ref = db.reference() if db_app else None
+
+
+def _load_face_models():
+    global detector, predictor, face_recognizer, _cv_face_cascade, _cv_face_alt2, _yunet_detector
+    global _yunet_model_path, _stage_order, face_engine, face_pool
+    if dlib:
+        try:
+            _shape_path = os.path.join(_script_dir, "shape_predictor_68_face_landmarks.dat")
+            _face_model_path = os.path.join(_script_dir, "dlib_face_recognition_resnet_model_v1.dat")
+            detector = dlib.get_frontal_face_detector()
+            predictor = dlib.shape_predictor(_shape_path)
+            face_recognizer = dlib.face_recognition_model_v1(_face_model_path)
+            _cv_face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+            )
+            try:
+                _cv_face_alt2 = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_alt2.xml")
+            except Exception:
+                _cv_face_alt2 = None
+            _yunet_model_path = os.path.abspath(os.path.join(_script_dir, "..", "gate", "face_detection_yunet_2023mar.onnx"))
+            if hasattr(cv2, "FaceDetectorYN") and os.path.isfile(_yunet_model_path):
+                try:
+                    _yunet_detector = cv2.FaceDetectorYN.create(_yunet_model_path, "", (320, 320))
+                    logger.info("YuNet + Dlib + Haar loaded (YuNet primary)")
+                except Exception as e:
+                    logger.warning("YuNet init failed, using dlib+Haar only: %s", e)
+                    _yunet_detector = None
+            else:
+                if not hasattr(cv2, "FaceDetectorYN"):
+                    logger.info("OpenCV FaceDetectorYN not available; using Dlib + Haar only")
+                elif not os.path.isfile(_yunet_model_path):
+                    logger.info("YuNet model not found at %s; using Dlib + Haar only", _yunet_model_path)
+                logger.info("Dlib + OpenCV Haar loaded")
+        except Exception as e:
+            logger.error("WARNING: Dlib model files not found or initialized: %s", e)
+
+    if predictor and face_recognizer:
+        _stage_order = AdaptiveStageOrder(path=FACE_ENGINE_STATS_PATH)
+        atexit.register(_stage_order.save)
+        face_engine = FaceEngine(
+            predictor, face_recognizer,
+            hog_detector=detector, cascade=_cv_face_cascade, cascade_alt=_cv_face_alt2,
+            yunet=_yunet_detector, budget_ms=FACE_ENGINE_BUDGET_MS, ordering=_stage_order,
+        )
+
+    # Worker processes load their own copy of the models; started on the first frame.
+    if face_engine is not None and FACE_WORKERS > 0:
+        face_pool = FaceWorkerPool(
+            FACE_WORKERS, load_face_engine,
+            factory_kwargs={
+                "model_dir": _script_dir, "yunet_path": _yunet_model_path,
+                "budget_ms": FACE_ENGINE_BUDGET_MS, "stats_path": FACE_ENGINE_STATS_PATH,
+            },
+            max_pending=FACE_WORKER_MAX_PENDING or None, ordering=_stage_order,
+        )
+        atexit.register(face_pool.shutdown, wait=False)
+
+
+_registration_initialized = False
+
+
+def init_registration():
+    """Create the upload folder, connect Firebase and load the face models (once)."""
+    global _registration_initialized
+    if _registration_initialized:
+        return app
+    _registration_initialized = True
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    _init_database()
+    _load_face_models()
+    return app
+
+
 if __name__ == "__main__":
+    # The debug reloader's parent process only watches files; the serving child initialises.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        init_registration()
     logger.info("Starting Flask application...")
     app.run(host="0.0.0.0", port=5001, debug=True)
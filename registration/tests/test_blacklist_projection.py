@@ -0,0 +1,189 @@
+"""Tests for the blacklist face projection used by registration.
+
+Run from registration/:
+  python -m unittest tests.test_blacklist_projection -v
+"""
+import os
+import sys
+import unittest
+import unittest.mock
+from pathlib import Path
+
+import numpy as np
+
+_reg_dir = Path(__file__).resolve().parent.parent
+if str(_reg_dir) not in sys.path:
+    sys.path.insert(0, str(_reg_dir))
+
+import app as reg_app  # noqa: E402
+from blacklist_index import rebuild_blacklist_projection, update_blacklist_projection  # noqa: E402
+from embedding_codec import encode_embedding  # noqa: E402
+from event_partitions import is_increment  # noqa: E402
+
+
+class _DictRef:
+    """Minimal slash-path reference over a nested dict; counts reads per path."""
+
+    def __init__(self, store, path="", reads=None):
+        self.store = store
+        self.path = path.strip("/")
+        self.reads = reads if reads is not None else []
+
+    def _parts(self):
+        return [p for p in self.path.split("/") if p]
+
+    def child(self, path):
+        return _DictRef(self.store, f"{self.path}/{path}", self.reads)
+
+    def get(self):
+        self.reads.append(self.path)
+        node = self.store
+        for part in self._parts():
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _parent(self):
+        node = self.store
+        for part in self._parts()[:-1]:
+            node = node.setdefault(part, {})
+        return node
+
+    def set(self, value):
+        if value is None:
+            self.delete()  # Firebase deletes on null
+            return
+        if is_increment(value):
+            # Server-side increment ({".sv": {"increment": n}}), as Firebase resolves it.
+            current = self._parent().get(self._parts()[-1])
+            value = (current if isinstance(current, (int, float)) else 0) + value[".sv"]["increment"]
+        if not self._parts():
+            self.store.clear()
+            self.store.update(value)
+        else:
+            self._parent()[self._parts()[-1]] = value
+
+    def update(self, values):
+        # Each key is a path under this ref (Firebase multi-location update).
+        for key, value in values.items():
+            self.child(key).set(value)
+
+    def delete(self):
+        self._parent().pop(self._parts()[-1], None)
+
+
+def _unit(i):
+    v = np.zeros(128)
+    v[i] = 1.0
+    return v
+
+
+class TestBlacklistProjection(unittest.TestCase):
+    def setUp(self):
+        os.environ.setdefault("VERIFICATION_THRESHOLD", "0.65")
+        self.store = {"visitors": {
+            "bl1": {"basic_info": {
+                "name": "Blocked", "embedding": encode_embedding(_unit(0)),
+                "blacklisted": "yes", "blacklist_reason": "Test reason",
+            }},
+            "ok1": {"basic_info": {"name": "Fine", "embedding": encode_embedding(_unit(1)), "blacklisted": "no"}},
+        }}
+        self.db = _DictRef(self.store)
+        reg_app._blacklist_projection.invalidate()
+
+    def test_rebuild_keeps_only_blacklisted_faces(self):
+        self.assertEqual(rebuild_blacklist_projection(self.db), 1)
+        node = self.store["blacklist_index"]
+        self.assertEqual(set(node["faces"]), {"bl1"})
+        self.assertEqual(node["faces"]["bl1"]["reason"], "Test reason")
+        self.assertIs(node["meta"]["complete"], True)
+
+    def test_far_face_allowed_without_reading_visitors(self):
+        rebuild_blacklist_projection(self.db)
+        self.db.reads.clear()
+        deny, _, _ = reg_app._registration_biometric_blacklist_block(_unit(2), self.db)
+        self.assertFalse(deny)
+        self.assertNotIn("visitors", self.db.reads)
+
+    def test_close_face_denied_from_projection_and_candidate_record(self):
+        rebuild_blacklist_projection(self.db)
+        self.db.reads.clear()
+        deny, msg, reason = reg_app._registration_biometric_blacklist_block(_unit(0), self.db)
+        self.assertTrue(deny)
+        self.assertEqual(msg, reg_app.MSG_BLACKLISTED)
+        self.assertEqual(reason, "Test reason")
+        self.assertIn("visitors/bl1/basic_info", self.db.reads)
+        self.assertNotIn("visitors", self.db.reads)
+
+    def test_twin_check_uses_the_registrants_own_record(self):
+        twin = self.store["visitors"]["bl1"]["basic_info"]["embedding"]
+        self.store["visitors"]["ok1"]["basic_info"]["embedding"] = twin
+        rebuild_blacklist_projection(self.db)
+        self.db.reads.clear()
+        own = self.store["visitors"]["ok1"]["basic_info"]
+        deny, msg, _ = reg_app._registration_biometric_blacklist_block(
+            _unit(0), self.db, own_visitor_id="ok1", own_basic_info=own
+        )
+        self.assertTrue(deny)
+        self.assertEqual(msg, reg_app.MSG_REGISTRATION_FACE_AMBIGUOUS)
+        self.assertNotIn("visitors", self.db.reads)
+
+        # Own record clearly closer than the blacklisted face: allowed.
+        live = _unit(0) * 0.7 + _unit(1) * 0.3  # 0.42 from the blacklisted face
+        own = dict(own, embedding=encode_embedding(live))
+        deny, _, _ = reg_app._registration_biometric_blacklist_block(
+            live, self.db, own_visitor_id="ok1", own_basic_info=own
+        )
+        self.assertFalse(deny)
+        self.assertNotIn("visitors", self.db.reads)
+
+    def test_stale_projection_entry_falls_back_to_full_check(self):
+        rebuild_blacklist_projection(self.db)
+        self.store["visitors"]["bl1"]["basic_info"]["blacklisted"] = "no"  # projection not updated
+        self.db.reads.clear()
+        deny, _, _ = reg_app._registration_biometric_blacklist_block(_unit(0), self.db)
+        self.assertFalse(deny)
+        self.assertIn("visitors", self.db.reads)
+
+    def test_toggle_updates_are_picked_up(self):
+        rebuild_blacklist_projection(self.db)
+        ok_basic = self.store["visitors"]["ok1"]["basic_info"]
+        update_blacklist_projection(self.db, "ok1", dict(ok_basic, blacklisted="yes"), True)
+        self.assertEqual(self.store["blacklist_index"]["meta"]["version"], 2)
+        update_blacklist_projection(self.db, "bl1", {}, False)
+        self.assertEqual(set(self.store["blacklist_index"]["faces"]), {"ok1"})
+        self.assertEqual(self.store["blacklist_index"]["meta"]["version"], 3)
+
+        reg_app._blacklist_projection.invalidate()
+        available, nearest = reg_app._nearest_blacklisted_from_projection(_unit(1), self.db)
+        self.assertTrue(available)
+        self.assertEqual(nearest["visitor_id"], "ok1")
+
+    def test_toggle_is_one_update(self):
+        rebuild_blacklist_projection(self.db)
+        with unittest.mock.patch.object(_DictRef, "update", autospec=True, side_effect=_DictRef.update) as update:
+            update_blacklist_projection(self.db, "bl1", {}, False)
+        update.assert_called_once()
+        self.assertNotIn("bl1", self.store["blacklist_index"]["faces"])
+
+    def test_concurrent_toggles_each_bump_the_version(self):
+        rebuild_blacklist_projection(self.db)
+        ok_basic = dict(self.store["visitors"]["ok1"]["basic_info"], blacklisted="yes")
+        # Two admins toggle at once: the version bump must not read-then-write.
+        self.db.reads.clear()
+        update_blacklist_projection(self.db, "ok1", ok_basic, True)
+        update_blacklist_projection(self.db, "bl1", {}, False)
+        self.assertNotIn("blacklist_index/meta", self.db.reads)
+        self.assertEqual(self.store["blacklist_index"]["meta"]["version"], 3)
+
+    def test_unseeded_projection_falls_back_to_full_scan(self):
+        available, _ = reg_app._nearest_blacklisted_from_projection(_unit(0), self.db)
+        self.assertFalse(available)
+        deny, msg, _ = reg_app._registration_biometric_blacklist_block(_unit(0), self.db)
+        self.assertTrue(deny)
+        self.assertIn("visitors", self.db.reads)
+
+
+if __name__ == "__main__":
+    unittest.main()
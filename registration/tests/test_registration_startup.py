@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+_REG_DIR = Path(__file__).resolve().parents[1]
+
+# What multiprocessing's "spawn" start method does in a face worker: re-run the
+# launching script (python app.py) under the name __mp_main__, with the parent's sys.path.
+_WORKER_IMPORT = """
+import json, runpy, sys
+import firebase_admin
+ns = runpy.run_path(sys.argv[1], run_name="__mp_main__")
+print(json.dumps({
+    "db_ref": ns["db_ref"] is None,
+    "predictor": ns["predictor"] is None,
+    "face_engine": ns["face_engine"] is None,
+    "face_pool": ns["face_pool"] is None,
+    "firebase_apps": len(firebase_admin._apps),
+}))
+"""
+
+
+class SpawnedWorkerImportTests(unittest.TestCase):
+    def test_spawned_worker_does_not_connect_or_load_models(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, FACE_WORKERS="2",
+                       PYTHONPATH=os.pathsep.join([str(_REG_DIR), str(_REG_DIR.parent)]))
+            proc = subprocess.run(
+                [sys.executable, "-c", _WORKER_IMPORT, str(_REG_DIR / "app.py")],
+                cwd=tmp, env=env, capture_output=True, text=True, timeout=120,
+            )
+            self.assertEqual(proc.returncode, 0, proc.stderr)
+            state = json.loads(proc.stdout.strip().splitlines()[-1])
+            self.assertEqual(state, {
+                "db_ref": True, "predictor": True, "face_engine": True, "face_pool": True,
+                "firebase_apps": 0,
+            })
+            self.assertEqual(os.listdir(tmp), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""verify_face request validation (no Firebase, no face models)."""
+import io
+import sys
+import unittest
+from pathlib import Path
+
+_reg_dir = Path(__file__).resolve().parent.parent
+if str(_reg_dir) not in sys.path:
+    sys.path.insert(0, str(_reg_dir))
+
+import app as reg_app  # noqa: E402
+
+
+class TestVerifyFaceUpload(unittest.TestCase):
+    def setUp(self):
+        self.client = reg_app.app.test_client()
+
+    def test_unreadable_frames_are_rejected_with_400(self):
+        bad_data_url = self.client.post("/verify-face", json={"image": "not-a-data-url"})
+        empty_part = self.client.post("/verify-face", data={"image": (io.BytesIO(b""), "frame.jpg")},
+                                      content_type="multipart/form-data")
+        for resp in (bad_data_url, empty_part):
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(resp.get_json(), {"match": False, "message": "Invalid image data"})
+
+    def test_missing_frame_is_rejected_with_400(self):
+        resp = self.client.post("/verify-face", json={"email": "a@example.com"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(resp.get_json()["match"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Learned detector-stage ordering for FaceEngine (one instance per kiosk).
+=============================================
+Which detector finds a face first depends on the camera, mounting height and
+lighting of each kiosk, so a fixed stage order wastes time wherever its first
+choice usually misses. ``AdaptiveStageOrder`` keeps per-stage success and
+latency statistics and ranks stages bandit-style by *optimistic expected cost
+per success*:
+
+    cost = mean_ms / min(1, hit_rate + c * sqrt(ln(total) / attempts))
+
+so the cheapest stage that usually succeeds runs first, while rarely tried
+stages get an exploration bonus that grows until they are re-tried. Counts are
+halved once a stage passes ``max_weight`` attempts so the ranking follows
+day/night lighting changes. Statistics are saved to a JSON file (atomic
+replace) and reloaded on restart, so a kiosk keeps its learned order.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Unseen stages are assumed to cost PRIOR_MS x (default position + 1) so the
+# default order holds until real measurements arrive.
+PRIOR_MS = 10.0
+STATS_VERSION = 1
+
+
+class StageStats:
+    __slots__ = ("attempts", "hits", "mean_ms")
+
+    def __init__(self, attempts=0.0, hits=0.0, mean_ms=None):
+        self.attempts = float(attempts)
+        self.hits = float(hits)
+        self.mean_ms = mean_ms
+
+    def to_dict(self):
+        return {"attempts": round(self.attempts, 3), "hits": round(self.hits, 3), "mean_ms": self.mean_ms}
+
+
+class AdaptiveStageOrder:
+    """Ranks stage names by learned cost per success; thread-safe."""
+
+    def __init__(self, path=None, exploration=0.5, latency_alpha=0.1, max_weight=500, save_every=50,
+                 persist=True):
+        self.path = path
+        self.persist = bool(persist)  # False: load the learned order but never write it
+        self.exploration = float(exploration)
+        self.latency_alpha = float(latency_alpha)
+        self.max_weight = float(max_weight)
+        self.save_every = int(save_every)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._total = 0.0
+        self._unsaved = 0
+        if path:
+            self.load()
+
+    def _stage(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = StageStats()
+        return stats
+
+    def _cost(self, name, position):
+        stats = self._stats.get(name)
+        if stats is None or stats.attempts <= 0:
+            mean_ms = PRIOR_MS * (position + 1)
+            rate, attempts = 0.5, 0.0
+        else:
+            mean_ms = stats.mean_ms if stats.mean_ms is not None else PRIOR_MS * (position + 1)
+            rate, attempts = (stats.hits + 1.0) / (stats.attempts + 2.0), stats.attempts
+        bonus = self.exploration * math.sqrt(math.log(self._total + 2.0) / (attempts + 1.0))
+        return max(mean_ms, 1e-3) / min(1.0, rate + bonus)
+
+    def order(self, stages):
+        """Return *stages* (``(name, fn)`` pairs, default order) sorted cheapest-expected first."""
+        with self._lock:
+            ranked = sorted(enumerate(stages), key=lambda item: (self._cost(item[1][0], item[0]), item[0]))
+        return [stage for _, stage in ranked]
+
+    def record(self, name, ms, found):
+        """Fold one stage run into the statistics; persists every ``save_every`` records."""
+        with self._lock:
+            stats = self._stage(name)
+            stats.attempts += 1.0
+            stats.hits += 1.0 if found else 0.0
+            if stats.mean_ms is None:
+                stats.mean_ms = float(ms)
+            else:
+                stats.mean_ms += self.latency_alpha * (float(ms) - stats.mean_ms)
+            if stats.attempts > self.max_weight:
+                stats.attempts *= 0.5
+                stats.hits *= 0.5
+            self._total += 1.0
+            self._unsaved += 1
+            due = self.path and self.persist and self._unsaved >= self.save_every
+        if due:
+            self.save()
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable stage statistics {self.path}: {e}")
+            return False
+        if not isinstance(data, dict) or data.get("version") != STATS_VERSION:
+            return False
+        with self._lock:
+            self._stats = {
+                name: StageStats(s.get("attempts", 0), s.get("hits", 0), s.get("mean_ms"))
+                for name, s in (data.get("stages") or {}).items() if isinstance(s, dict)
+            }
+            self._total = sum(s.attempts for s in self._stats.values())
+        return True
+
+    def save(self):
+        if not self.path or not self.persist:
+            return False
+        payload = {"version": STATS_VERSION, "stages": self.snapshot()}
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(payload, fh, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save stage statistics to {self.path}: {e}")
+            return False
+        with self._lock:
+            self._unsaved = 0
+        return True